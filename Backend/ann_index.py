@@ -0,0 +1,154 @@
+from typing import List, Tuple
+
+import numpy as np
+
+# k-means sees at most this many points per list while training
+TRAIN_POINTS_PER_LIST = 64
+ASSIGN_BLOCK_ROWS = 16384
+
+
+def default_nlist(count: int) -> int:
+    return max(1, int(4 * np.sqrt(count)))
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by inner product) for each row, computed in blocks to bound memory."""
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def spherical_kmeans(sample: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+        occupied = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts[occupied])[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[occupied] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = sample[rng.choice(len(sample), empty.size, replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over the rows of a normalized float32 matrix.
+
+    Rows are bucketed by their nearest k-means centroid; a query scans only the
+    ``nprobe`` buckets whose centroids are closest to it. The index stores row
+    numbers, not vectors, so the caller's matrix (memory-mapped or not) stays the
+    single copy of the data. Deleted rows are filtered out via the ``mask`` passed to ``search``.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray | None = None, nprobe: int = 8):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.lists: List[np.ndarray] = [np.zeros(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        if assignments is not None:
+            self._set_assignments(np.asarray(assignments, dtype=np.int32))
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: int | None = None, nprobe: int = 8, iterations: int = 10,
+              seed: int = 0) -> "IVFIndex":
+        nlist = nlist or default_nlist(len(vectors))
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), nlist * TRAIN_POINTS_PER_LIST)
+        sample_rows = np.sort(rng.choice(len(vectors), sample_size, replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        index = cls(spherical_kmeans(sample, nlist, iterations, seed), nprobe=nprobe)
+        index.add(np.arange(len(vectors)), vectors)
+        return index
+
+    def _set_assignments(self, assignments: np.ndarray) -> None:
+        self.assignments = assignments
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=self.nlist)
+        self.lists = np.split(order.astype(np.int64), np.cumsum(counts)[:-1])
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Assign ``vectors`` (already normalized) to buckets as rows ``rows`` of the matrix.
+
+        Rows past the current end are appended; existing rows (updates) move buckets.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return
+        new_assignments = _assign(vectors, self.centroids)
+        size = max(len(self.assignments), int(rows.max()) + 1)
+        assignments = np.full(size, -1, dtype=np.int32)
+        assignments[:len(self.assignments)] = self.assignments
+        updated = rows[rows < len(self.assignments)]
+        if updated.size:
+            # Moving rows between buckets is rare (re-upserts), so rebuild lists wholesale.
+            assignments[rows] = new_assignments
+            self._set_assignments(assignments)
+            return
+        assignments[rows] = new_assignments
+        self.assignments = assignments
+        order = np.argsort(new_assignments, kind="stable")
+        touched, starts = np.unique(new_assignments[order], return_index=True)
+        for bucket, group in zip(touched, np.split(rows[order], starts[1:])):
+            self.lists[bucket] = np.concatenate([self.lists[bucket], group])
+
+    def compact(self, keep: np.ndarray) -> None:
+        """Drop rows where ``keep`` is False, renumbering the remainder like the caller's matrix."""
+        self._set_assignments(self.assignments[keep])
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, top_k: int, nprobe: int | None = None,
+               mask: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+        candidates = np.concatenate([self.lists[b] for b in probe])
+        if mask is not None and candidates.size:
+            candidates = candidates[mask[candidates]]
+        if candidates.size == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+        candidates.sort()  # sequential access into the memory-mapped matrix
+        scores = np.asarray(vectors[candidates]) @ query
+        k = min(top_k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return candidates[top], scores[top]
+
+
+def test():
+    rng = np.random.default_rng(1)
+    # Clustered data so that a handful of probes finds the true neighbours.
+    centers = rng.normal(size=(32, 64)).astype(np.float32)
+    data = centers[rng.integers(0, 32, 4000)] + 0.1 * rng.normal(size=(4000, 64)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+
+    index = IVFIndex.train(data[:3000], nlist=32, nprobe=4)
+    index.add(np.arange(3000, 4000), data[3000:])
+    rows, scores = index.search(data, data[3500], top_k=5)
+    assert rows[0] == 3500 and np.isclose(scores[0], 1.0, atol=1e-4)
+
+    alive = np.ones(len(data), dtype=bool)
+    alive[3500] = False
+    rows, _ = index.search(data, data[3500], top_k=5, mask=alive)
+    assert 3500 not in rows
+
+    keep = np.arange(len(data)) != 10
+    index.compact(keep)
+    assert sum(len(lst) for lst in index.lists) == len(data) - 1
+    print("IVFIndex train/add/search/tombstone test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,199 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = "./cache/answers.sqlite3"
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_MAX_ENTRIES = 10_000
+
+_PUNCTUATION = re.compile(r"[\s\?\!\.\,;:।॥'\"]+")
+# Digits in any script, with comma grouping (1,000 or 1,00,000) and a decimal part.
+_NUMBER = re.compile(r"\d+(?:,\d{2,3})*(?:\.\d+)?")
+
+
+def normalize_query(text: str) -> str:
+    """Case-, whitespace- and punctuation-insensitive form of a question."""
+    return _PUNCTUATION.sub(" ", unicodedata.normalize("NFC", text).lower()).strip()
+
+
+def number_tokens(text: str) -> List[str]:
+    """The numbers in a question in order, as canonical ASCII decimals ("1,00,000" -> "100000", "10.50" -> "10.5")."""
+    numbers = []
+    for token in _NUMBER.findall(unicodedata.normalize("NFC", text)):
+        digits = "".join(str(unicodedata.digit(c)) if c.isdigit() else c for c in token.replace(",", ""))
+        numbers.append(format(Decimal(digits).normalize(), "f"))
+    return numbers
+
+
+def answer_cache_from_env() -> "AnswerCache | None":
+    if os.getenv("ANSWER_CACHE", "on").lower() in ("off", "0", "false"):
+        return None
+    return AnswerCache(
+        path=os.getenv("ANSWER_CACHE_PATH", DEFAULT_CACHE_PATH),
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+    )
+
+
+class AnswerCache:
+    """Semantic cache of finished ``/chat`` answers.
+
+    An answer is reused when a new question's embedding has cosine similarity of at
+    least ``threshold`` with a cached question in the same language and corpus
+    version and the same numbers: questions about different ages, amounts or
+    sections embed almost identically but need different answers. ``markdown_loader`` bumps the corpus version whenever it ingests a
+    document, which retires every answer produced against the older corpus.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_CACHE_PATH, threshold: float = DEFAULT_THRESHOLD,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (language, corpus version) -> (max row id, row ids, normalized matrix)
+        self._matrices: Dict[tuple, tuple] = {}
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "seconds_saved": 0.0}
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, language TEXT NOT NULL, corpus_version INTEGER NOT NULL, "
+            "query TEXT NOT NULL, vector BLOB NOT NULL, payload TEXT NOT NULL, "
+            "generation_seconds REAL NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers (language, corpus_version)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('corpus_version', '0')")
+        self._db.commit()
+
+    def corpus_version(self) -> int:
+        (value,) = self._db.execute("SELECT value FROM meta WHERE key = 'corpus_version'").fetchone()
+        return int(value)
+
+    def _scope_matrix(self, language: str, version: int):
+        (max_id,) = self._db.execute(
+            "SELECT MAX(id) FROM answers WHERE language = ? AND corpus_version = ?", (language, version)
+        ).fetchone()
+        cached = self._matrices.get((language, version))
+        if cached is not None and cached[0] == max_id:
+            return cached
+        rows = self._db.execute(
+            "SELECT id, vector FROM answers WHERE language = ? AND corpus_version = ?", (language, version)
+        ).fetchall()
+        ids = np.asarray([r[0] for r in rows], dtype=np.int64)
+        matrix = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows]) if rows else np.zeros((0, 0), np.float32)
+        self._matrices = {k: v for k, v in self._matrices.items() if k[1] == version}
+        self._matrices[(language, version)] = (max_id, ids, matrix)
+        return self._matrices[(language, version)]
+
+    def lookup(self, query: str, vector: List[float], language: str) -> Dict[str, Any] | None:
+        query_vector = np.asarray(vector, dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) or 1.0
+        numbers = number_tokens(query)
+        with self._lock:
+            _, ids, matrix = self._scope_matrix(language, self.corpus_version())
+            if len(ids) == 0 or matrix.shape[1] != len(query_vector):
+                self.counters["misses"] += 1
+                return None
+            scores = matrix @ query_vector
+            hit = None
+            for best in np.argsort(-scores):
+                if scores[best] < self.threshold:
+                    break
+                cached_query, payload, generation_seconds = self._db.execute(
+                    "SELECT query, payload, generation_seconds FROM answers WHERE id = ?", (int(ids[best]),)
+                ).fetchone()
+                if number_tokens(cached_query) == numbers:
+                    hit = best
+                    break
+            if hit is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            self.counters["seconds_saved"] += generation_seconds
+        entry = json.loads(payload)
+        entry["similarity"] = float(scores[hit])
+        return entry
+
+    def store(self, query: str, vector: List[float], language: str, payload: Dict[str, Any],
+              generation_seconds: float) -> None:
+        """Cache ``payload`` (the replayable answer: context count and streamed chunks) for ``query``.
+
+        ``query`` is the question as asked, since matching its numbers needs their separators.
+        """
+        normalized = np.asarray(vector, dtype=np.float32)
+        normalized /= np.linalg.norm(normalized) or 1.0
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO answers (language, corpus_version, query, vector, payload, generation_seconds, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (language, self.corpus_version(), query, normalized.tobytes(), json.dumps(payload, ensure_ascii=False),
+                 generation_seconds, time.time()),
+            )
+            self._db.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY id DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+            self.counters["stores"] += 1
+
+    def invalidate_corpus(self) -> int:
+        """Start a new corpus version and drop answers computed against older ones."""
+        with self._lock:
+            version = self.corpus_version() + 1
+            self._db.execute("UPDATE meta SET value = ? WHERE key = 'corpus_version'", (str(version),))
+            self._db.execute("DELETE FROM answers WHERE corpus_version < ?", (version,))
+            self._db.commit()
+            self._matrices = {}
+        return version
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.counters)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def test():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = AnswerCache(Path(tmp) / "answers.sqlite3", threshold=0.9)
+        assert normalize_query("  What is the VOTING age?? ") == "what is the voting age"
+        cache.store("what is the voting age", [1.0, 0.0, 0.0], "en", {"contexts": 5, "chunks": ["18"]}, 12.0)
+
+        assert cache.lookup("what is the voting age", [0.99, 0.05, 0.0], "en")["chunks"] == ["18"]
+        assert cache.lookup("what is the voting age", [0.99, 0.05, 0.0], "ne") is None
+        assert cache.lookup("what is the voting age", [0.0, 1.0, 0.0], "en") is None
+        assert cache.stats()["seconds_saved"] == 12.0
+
+        # Questions differing only in a number embed alike but must not share an answer.
+        assert number_tokens("Tax on Rs. 5,00,000?") == number_tokens("tax on rs 500000") == ["500000"]
+        assert number_tokens("धारा १२.") == number_tokens("section 12") == ["12"]
+        assert number_tokens("10.5%") != number_tokens("10.05%") and number_tokens("10.50%") == ["10.5"]
+        assert number_tokens("section 5(10)") == ["5", "10"] != number_tokens("section 10(5)")
+        cache.store("Tax on Rs. 5,00,000 income?", [0.0, 0.0, 1.0], "en", {"contexts": 5, "chunks": ["50000"]}, 9.0)
+        cache.store("Tax on Rs. 9,00,000 income?", [0.0, 0.01, 1.0], "en", {"contexts": 5, "chunks": ["90000"]}, 9.0)
+        assert cache.lookup("tax on rs 900000 income", [0.0, 0.0, 1.0], "en")["chunks"] == ["90000"]
+        assert cache.lookup("tax on rs 7,00,000 income", [0.0, 0.0, 1.0], "en") is None
+        assert cache.lookup("tax on rs 500000 income", [0.0, 0.0, 1.0], "en")["chunks"] == ["50000"]
+
+        # A second process (markdown_loader) re-ingesting a document retires the answer.
+        AnswerCache(Path(tmp) / "answers.sqlite3").invalidate_corpus()
+        assert cache.lookup("what is the voting age", [1.0, 0.0, 0.0], "en") is None
+    print("AnswerCache lookup/scope/numbers/invalidation test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,101 @@
+"""Answer a JSONL file of questions in bulk, appending one JSON result per line.
+
+    python batch_answer.py questions.jsonl --output answers.jsonl
+    python batch_answer.py evaluation_set.jsonl --output answers.jsonl --concurrency 16
+
+Each input line is an object with a ``question`` (and optionally an ``id``, which
+defaults to the line number) or a bare JSON string. Questions go through
+``rag_server.answer_batch``, the same path as the ``/batch`` endpoint: repeated
+questions are answered once, translation and embedding are batched, retrieval is a
+single search per wave and answers are generated ``--concurrency`` at a time.
+
+Results are appended and flushed as they complete, so an interrupted run resumes
+where it stopped: ids that already have an answer in ``--output`` are skipped and
+failed ones are tried again. A retried id appears more than once in the file; its
+last line is the one that counts. Progress and the questions-per-minute throughput
+are printed as the run goes.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+import rag_server
+
+
+def load_items(path: Path) -> list[dict]:
+    entries = []
+    with path.open(encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                entry = json.loads(line)
+                if isinstance(entry, dict) and "id" not in entry:
+                    entry = {**entry, "id": line_no}
+                entries.append(entry if isinstance(entry, dict) else {"id": line_no, "question": entry})
+    return rag_server.batch_items(entries)
+
+
+def answered_ids(path: Path) -> set[str]:
+    """Ids with an answer in an earlier run's output; a torn last line is ignored."""
+    done = set()
+    if not path.exists():
+        return done
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if "answer" in result:
+                done.add(str(result["id"]))
+            else:
+                done.discard(str(result.get("id")))
+    return done
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", type=Path, help="JSONL file of questions")
+    parser.add_argument("--output", type=Path, required=True, help="JSONL file the results are appended to")
+    parser.add_argument("--k", type=int, default=5, help="passages per answer")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="answers generated at once (default BATCH_CONCURRENCY, 8)")
+    parser.add_argument("--wave", type=int, default=200, help="distinct questions translated and searched together")
+    parser.add_argument("--progress-every", type=int, default=25)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    items = load_items(args.input)
+    done = answered_ids(args.output)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} questions, {len(items) - len(pending)} already answered, {len(pending)} to go",
+          file=sys.stderr)
+    if not pending:
+        return
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    answered = errors = 0
+
+    def report() -> None:
+        minutes = (time.perf_counter() - started) / 60
+        print(f"{answered}/{len(pending)} done, {errors} failed, "
+              f"{answered / minutes if minutes else 0:.1f} questions/min", file=sys.stderr)
+
+    with args.output.open("a", encoding="utf-8") as out:
+        if out.tell() and not args.output.read_bytes().endswith(b"\n"):
+            out.write("\n")  # finish a line torn by the interrupted run
+        for result in rag_server.answer_batch(pending, k=args.k, concurrency=args.concurrency, wave_size=args.wave):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            answered += 1
+            errors += "error" in result
+            if answered % args.progress_every == 0:
+                report()
+    report()
+
+
+if __name__ == "__main__":
+    main()
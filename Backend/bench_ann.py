@@ -0,0 +1,99 @@
+"""Recall@k and query latency of the IVF index versus exact search on synthetic corpora.
+
+    python bench_ann.py --sizes 10000,100000,1000000 --nprobe 1,4,8,16,32
+
+A 1M x 768 float32 corpus needs ~3 GB of RAM; pass ``--dim`` to shrink it.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex, default_nlist
+
+
+def synthetic_corpus(size: int, dim: int, rng: np.random.Generator, clusters: int = 256) -> np.ndarray:
+    """Gaussian mixture on the unit sphere, roughly how chunk embeddings of a few topics cluster."""
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    data = np.empty((size, dim), dtype=np.float32)
+    block = 65536
+    for start in range(0, size, block):
+        n = min(block, size - start)
+        data[start:start + n] = centers[rng.integers(0, clusters, n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data
+
+
+def exact_top_k(data: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = data @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def percentile_ms(samples: list[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1000)
+
+
+def run(size: int, dim: int, nprobes: list[int], queries: int, k: int, seed: int) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    data = synthetic_corpus(size, dim, rng)
+    # Held-out queries drawn from the same distribution (perturbed corpus points).
+    query_vecs = data[rng.integers(0, size, queries)] + 0.3 * rng.normal(size=(queries, dim)).astype(np.float32)
+    query_vecs /= np.linalg.norm(query_vecs, axis=1, keepdims=True)
+
+    latencies, truth = [], []
+    for q in query_vecs:
+        t0 = time.perf_counter()
+        truth.append(exact_top_k(data, q, k))
+        latencies.append(time.perf_counter() - t0)
+    results = [{
+        "size": size, "dim": dim, "method": "exact", "recall": 1.0,
+        "p50_ms": percentile_ms(latencies, 50), "p99_ms": percentile_ms(latencies, 99),
+    }]
+
+    t0 = time.perf_counter()
+    index = IVFIndex.train(data, nlist=default_nlist(size))
+    build_s = time.perf_counter() - t0
+
+    for nprobe in nprobes:
+        latencies, hits = [], 0
+        for q, expected in zip(query_vecs, truth):
+            t0 = time.perf_counter()
+            rows, _ = index.search(data, q, k, nprobe=nprobe)
+            latencies.append(time.perf_counter() - t0)
+            hits += len(np.intersect1d(rows, expected))
+        results.append({
+            "size": size, "dim": dim, "method": f"ivf nlist={index.nlist} nprobe={nprobe}",
+            "recall": hits / (k * queries), "build_s": build_s,
+            "p50_ms": percentile_ms(latencies, 50), "p99_ms": percentile_ms(latencies, 99),
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--nprobe", default="1,4,8,16,32", help="comma-separated nprobe values")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    nprobes = [int(n) for n in args.nprobe.split(",")]
+    all_results = []
+    print(f"{'size':>9}  {'method':<28} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        for row in run(size, args.dim, nprobes, args.queries, args.k, args.seed):
+            all_results.append(row)
+            print(f"{row['size']:>9}  {row['method']:<28} {row['recall']:>9.3f} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(all_results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Page-window chunker versus the structure-aware chunker.
+
+    python bench_chunker.py                       # synthetic acts with known answers
+    python bench_chunker.py output/documents/*.md # size statistics for converted documents
+
+For each chunker this reports the number of chunks, the tokens stored in the index
+(and how much of that is duplicated page overlap), the context tokens the top-k
+chunks add to the answer prompt, and, on the synthetic corpus, the fraction of
+questions whose answer sentence is in the top-k chunks. Retrieval uses the BM25
+index by default; ``--dense`` embeds with the configured Gemini model instead.
+"""
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from ingest_scheduler import estimate_tokens
+from lexical_index import LexicalIndex
+from markdown_loader import PAGE_DELIM_REGEX, chunk_text
+from structure_chunker import chunk_markdown
+
+WORDS = ("tax registration passport citizenship marriage property land company license permit vehicle import "
+         "export customs court appeal notice fee fine penalty exemption refund deposit record certificate "
+         "office officer authority ministry province municipality resident foreigner employee employer").split()
+FILLER = [
+    "The {a} authority shall maintain a record of every {b} in the prescribed manner.",
+    "Any person aggrieved by a decision on the {a} may file an appeal within thirty five days.",
+    "Notwithstanding anything in this Act, the {a} officer may require additional documents relating to {b}.",
+    "The Government of Nepal may, by notification in the Nepal Gazette, alter the {a} {b} schedule.",
+    "No {a} shall be issued to a person who has not paid the {b} due under this Act.",
+]
+
+
+def synthetic_act(rng: np.random.Generator, act: int, sections: int, page_tokens: int = 450,
+                  pages_per_window: int = 5):
+    """Markdown shaped like pdf_to_markdown_agent output, plus (question, answer sentence) pairs."""
+    lines, questions = [f"# Synthetic Act {act}, 2080", ""], []
+    for number in range(1, sections + 1):
+        if number % 10 == 1:
+            lines += [f"## Chapter {number // 10 + 1}", ""]
+        a, b = rng.choice(WORDS, size=2, replace=False)
+        subject = f"{a} {b} class {act}-{number}"
+        fact = f"The fee for {subject} is Rs. {int(rng.integers(100, 100_000))}."
+        body = [FILLER[i].format(a=rng.choice(WORDS), b=rng.choice(WORDS)) for i in rng.integers(0, 5, size=rng.integers(2, 40))]
+        body.insert(int(rng.integers(0, len(body) + 1)), fact)
+        lines += [f"{number}. Provisions relating to {a} {b}:", " ".join(body), ""]
+        questions.append((f"What is the fee for {subject}?", fact))
+
+    # Cut into pages, then into windows that each restart page numbering and carry front-matter.
+    pages, current = [], []
+    for line in lines:
+        current.append(line)
+        if estimate_tokens("\n".join(current)) >= page_tokens:
+            pages.append(current)
+            current = []
+    pages.append(current)
+    windows = []
+    for start in range(0, len(pages), pages_per_window):
+        window = [f"---\ntitle: Synthetic Act {act}\npage_count: {pages_per_window}\n---"]
+        for n, page in enumerate(pages[start:start + pages_per_window], 1):
+            window.append(f"<!----- PAGE {n} ------->\n" + "\n".join(page))
+        windows.append("\n".join(window))
+    return "\n\n".join(windows), questions
+
+
+def chunkers(max_tokens: int):
+    return {
+        "pages": lambda text: chunk_text(text),
+        "structure": lambda text: [c["text"] for c in chunk_markdown(text, max_tokens=max_tokens)],
+    }
+
+
+def dense_search(chunks: list[str], questions: list[str], top_k: int) -> list[list[int]]:
+    from embedding_engine_wrapper import EmbeddingEngineWrapper
+
+    embedder = EmbeddingEngineWrapper(cache=False)
+
+    def embed(texts):
+        vectors = []
+        for i in range(0, len(texts), 32):
+            vectors += [e.values for e in embedder.embed(texts[i:i + 32])]
+        matrix = np.asarray(vectors, dtype=np.float32)
+        return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    scores = embed(questions) @ embed(chunks).T
+    return np.argsort(-scores, axis=1)[:, :top_k].tolist()
+
+
+def lexical_search(chunks: list[str], questions: list[str], top_k: int) -> list[list[int]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LexicalIndex(tmp)
+        index.upsert([str(i) for i in range(len(chunks))], chunks)
+        index.save()
+        return [[int(id_) for id_, _ in index.search(q, top_k)] for q in questions]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("documents", nargs="*", type=Path)
+    parser.add_argument("--acts", type=int, default=8, help="synthetic acts to generate")
+    parser.add_argument("--sections", type=int, default=80, help="sections per synthetic act")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=800, help="structure chunker token budget")
+    parser.add_argument("--dense", action="store_true", help="retrieve with Gemini embeddings instead of BM25")
+    args = parser.parse_args()
+
+    if args.dense:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    rng = np.random.default_rng(0)
+    if args.documents:
+        texts, questions = [p.read_text(encoding="utf-8") for p in args.documents], []
+    else:
+        acts = [synthetic_act(rng, act, args.sections) for act in range(1, args.acts + 1)]
+        texts, questions = [t for t, _ in acts], [q for _, qs in acts for q in qs]
+    source_tokens = sum(estimate_tokens(PAGE_DELIM_REGEX.sub("", t)) for t in texts)
+
+    print(f"{len(texts)} documents, {source_tokens} tokens, {len(questions)} questions, top {args.top_k}, "
+          f"{'dense' if args.dense else 'BM25'} retrieval")
+    print(f"{'chunker':<10} {'chunks':>7} {'avg tok':>8} {'index tok':>10} {'dup':>6} {'ctx tok/answer':>15} "
+          f"{'hit rate':>9}")
+    for name, chunk in chunkers(args.max_tokens).items():
+        chunks = [c for text in texts for c in chunk(text)]
+        sizes = np.asarray([estimate_tokens(c) for c in chunks])
+        line = (f"{name:<10} {len(chunks):>7} {sizes.mean():>8.0f} {sizes.sum():>10} "
+                f"{sizes.sum() / source_tokens - 1:>6.0%}")
+        if questions:
+            search = dense_search if args.dense else lexical_search
+            results = search(chunks, [q for q, _ in questions], args.top_k)
+            context = np.mean([sizes[r].sum() for r in results])
+            hits = np.mean([any(answer in chunks[i] for i in r) for r, (_, answer) in zip(results, questions)])
+            line += f" {context:>15.0f} {hits:>9.1%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("GEMINI_KEY", "")
+    main()
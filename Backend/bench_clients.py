@@ -0,0 +1,89 @@
+"""Server cold-start time and per-call connection overhead of the Gemini and Pinecone clients.
+
+    python bench_clients.py --calls 20
+    python bench_clients.py --skip-pinecone
+
+Cold start is the time to import ``rag_server`` in a fresh interpreter, then the
+time until ``/ready`` would report every backend warmed up. The per-call part
+repeats a cheap metadata request (Gemini ``models.get``, Pinecone
+``describe_index_stats``). It compares a new client per call, which pays DNS,
+TCP and TLS every time, with the shared pooled client that keeps its connection
+alive. Needs ``GEMINI_KEY`` and, unless skipped, ``PINECONE_API_KEY``.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+COLD_START = """
+import time
+started = time.perf_counter()
+import rag_server, clients
+imported = time.perf_counter() - started
+while any(c["state"] == clients.STATE_PENDING for c in clients.readiness()["components"].values()):
+    time.sleep(0.01)
+print(imported, time.perf_counter() - started, clients.readiness()["ready"])
+"""
+
+
+def cold_start(runs: int) -> None:
+    imports, readies = [], []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", COLD_START], capture_output=True, text=True, check=True)
+        imported, ready, ok = output.stdout.split()[-3:]
+        imports.append(float(imported))
+        readies.append(float(ready))
+    print(f"cold start over {runs} runs: import p50 {statistics.median(imports):.2f}s, "
+          f"warmed up p50 {statistics.median(readies):.2f}s (last run ready: {ok})")
+
+
+def per_call(name: str, fresh, pooled, calls: int) -> None:
+    def timings(call) -> list[float]:
+        samples = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    pooled()  # open the pooled connection first
+    new_client = statistics.median(timings(fresh))
+    shared = statistics.median(timings(pooled))
+    print(f"{name:<9} new client per call p50 {new_client * 1000:7.1f} ms, shared pooled client p50 "
+          f"{shared * 1000:7.1f} ms, connection overhead {(new_client - shared) * 1000:7.1f} ms/call")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--cold-starts", type=int, default=3)
+    parser.add_argument("--model", default="gemini-2.5-pro")
+    parser.add_argument("--index", default="legaladviser")
+    parser.add_argument("--skip-pinecone", action="store_true")
+    args = parser.parse_args()
+    load_dotenv()
+
+    from google import genai
+
+    import clients
+
+    cold_start(args.cold_starts)
+    per_call("gemini", lambda: genai.Client(api_key=os.getenv("GEMINI_KEY")).models.get(model=args.model),
+             lambda: clients.gemini_client().models.get(model=args.model), args.calls)
+    if not args.skip_pinecone:
+        from pinecone import Pinecone
+
+        def fresh_pinecone():
+            pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+            pc.Index(args.index).describe_index_stats()
+
+        per_call("pinecone", fresh_pinecone, lambda: clients.pinecone_index(args.index).describe_index_stats(),
+                 args.calls)
+
+
+if __name__ == "__main__":
+    main()
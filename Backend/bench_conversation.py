@@ -0,0 +1,176 @@
+"""Per-turn prompt tokens and latency of a long conversation, with and without the conversation store.
+
+    python bench_conversation.py --turns 30
+    python bench_conversation.py --turns 60 --recent-turns 2 --prompt-word-delay 0.001
+
+The same questions are asked one after another through ``rag_server.pipeline_events``
+against the offline fakes, twice. The ``full-history`` run sends the whole
+question history with every turn, as a client without a conversation id does, so
+the translate prompt grows with every turn. The ``conversation`` run sends only
+the new question and a conversation id; the translate prompt is built from the
+rolling summary and the last ``--recent-turns`` turns, and the turns leaving that
+window are folded into the summary in the background between turns, like while
+the client reads the answer. The fake LLM takes ``--prompt-word-delay`` seconds
+per prompt word on top of its fixed delays, so latency follows prompt size.
+Each question comes with a sentence of client background, as real ones do.
+
+For each turn this reports the translate prompt tokens, the summary prompt tokens
+spent after the turn (conversation run only), the time until the question is
+translated and the time to the last answer token, then the mean of the first and
+last five turns of each run. The answer prompt depends only on the question and
+its passages, so it is the same in both runs.
+"""
+import argparse
+import atexit
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="legaladviser-conversation-")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ.setdefault("GEMINI_KEY", "stub")
+os.environ["VECTOR_STORE_BACKEND"] = "local"
+os.environ["LOCAL_INDEX_DIR"] = _tmp
+os.environ["ANSWER_CACHE"] = "off"
+os.environ["EMBEDDING_CACHE"] = "off"
+os.environ["LEXICAL_INDEX_DIR"] = os.path.join(_tmp, "lexical")
+os.environ["DOCUMENT_STORE_DIR"] = os.path.join(_tmp, "documents")
+os.environ["CONVERSATION_STORE_PATH"] = os.path.join(_tmp, "conversations.sqlite3")
+os.environ["REQUEST_COALESCING"] = "off"
+os.environ.setdefault("REQUEST_LOG", "off")
+os.environ["BACKEND_WARMUP"] = "off"
+
+import logging
+
+import numpy as np
+
+import rag_server
+from bench_chunker import synthetic_act
+from context_assembly import count_tokens
+from fakes import FakeEmbedder, FakeLLM, FakeVectorStore
+from markdown_loader import split_document
+
+# Background clients give along with their questions, so turns are the length of real ones.
+CLIENT_FACTS = (
+    "I run a private limited company in Kathmandu with {n} employees and an annual turnover of Rs. {m} lakh.",
+    "My father transferred {n} ropani of land to me in {year} and my brother now disputes the transfer.",
+    "I have worked for a hotel in Pokhara for {n} years and was dismissed last month without notice.",
+    "We signed a lease for a shop in Lalitpur in {year} with a monthly rent of Rs. {m} thousand.",
+    "I imported goods worth Rs. {m} lakh through the Birgunj customs office in {year}.",
+)
+
+
+class RecordingLLM(FakeLLM):
+    """A fake LLM that remembers the prompt tokens of each call by kind."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.tokens = {"translate": [], "summary": [], "answer": []}
+
+    def generate(self, messages) -> str:
+        prompt = str(messages)
+        kind = "summary" if "running summary of a client's conversation" in prompt else "translate"
+        self.tokens[kind].append(count_tokens(prompt))
+        return super().generate(messages)
+
+    def stream_generate(self, messages):
+        self.tokens["answer"].append(count_tokens(str(messages)))
+        return super().stream_generate(messages)
+
+
+def build_corpus(acts: int, seed: int) -> list[str]:
+    rng = np.random.default_rng(seed)
+    embedder = FakeEmbedder()
+    store = FakeVectorStore()
+    questions = []
+    for act in range(acts):
+        text, pairs = synthetic_act(rng, act, 20)
+        chunks, _ = split_document(text)
+        store.upsert([e.values for e in embedder.embed(chunks)], [{"document": c} for c in chunks],
+                     ids=[f"act{act}-chunk{i}" for i in range(len(chunks))])
+        for question, _ in pairs:
+            fact = CLIENT_FACTS[rng.integers(len(CLIENT_FACTS))].format(
+                n=rng.integers(2, 60), m=rng.integers(5, 500), year=rng.integers(2070, 2081))
+            questions.append(f"{fact} {question}")
+    rag_server.vector_store = store
+    rag_server.embedder = embedder
+    rag_server.document_store = None
+    rag_server.lexical_index = None
+    rag_server.query_routing = False
+    rag_server.speculative_retrieval = False
+    rng.shuffle(questions)
+    return questions
+
+
+def run(name: str, questions: list[str], args) -> list[dict]:
+    llm = RecordingLLM(generate_delay=args.generate_delay, first_token_delay=args.generate_delay, chunks=10,
+                       chunk_delay=0.005, prompt_word_delay=args.prompt_word_delay)
+    rag_server.llm = rag_server.translate_llm = rag_server.background_llm = llm
+    conversations = rag_server.conversations
+    rows = []
+    for turn, question in enumerate(questions):
+        seen = {kind: len(tokens) for kind, tokens in llm.tokens.items()}
+        if name == "conversation":
+            events = rag_server.pipeline_events([question], conversation_id="bench")
+        else:
+            events = rag_server.pipeline_events(questions[:turn + 1])
+        started = time.perf_counter()
+        understood = None
+        for event in events:
+            assert '"status": "error"' not in event, event
+            if understood is None and '"step": "Understanding", "status": "result"' in event:
+                understood = time.perf_counter() - started
+        seconds = time.perf_counter() - started
+        if name == "conversation":
+            conversations.wait_idle()
+        rows.append({"turn": turn + 1, "translate_seconds": understood, "seconds": seconds,
+                     **{kind: sum(tokens[seen[kind]:]) for kind, tokens in llm.tokens.items()}})
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--recent-turns", type=int, default=None,
+                        help="turns kept verbatim (default CONVERSATION_RECENT_TURNS, 4)")
+    parser.add_argument("--summary-batch", type=int, default=None,
+                        help="turns folded per summary call (default CONVERSATION_SUMMARY_BATCH, 4)")
+    parser.add_argument("--generate-delay", type=float, default=0.02, help="fixed seconds per fake LLM call")
+    parser.add_argument("--prompt-word-delay", type=float, default=0.0005, help="fake LLM seconds per prompt word")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    if rag_server.conversations is None:
+        raise SystemExit("CONVERSATIONS is off")
+    if args.recent_turns is not None:
+        rag_server.conversations.recent_turns = args.recent_turns
+    if args.summary_batch is not None:
+        rag_server.conversations.summary_batch = args.summary_batch
+
+    questions = build_corpus(acts=max(2, args.turns // 10), seed=args.seed)[:args.turns]
+    full = run("full-history", questions, args)
+    stored = run("conversation", questions, args)
+
+    print(f"{'':>4} | {'full history':^27} | {'conversation store':^39}")
+    print(f"{'turn':>4} | {'tokens':>7} {'translate s':>11} {'total s':>7} | {'tokens':>7} {'summary tok':>11} "
+          f"{'translate s':>11} {'total s':>7}")
+    for a, b in zip(full, stored):
+        print(f"{a['turn']:>4} | {a['translate']:>7} {a['translate_seconds']:>11.3f} {a['seconds']:>7.3f} | "
+              f"{b['translate']:>7} {b['summary']:>11} {b['translate_seconds']:>11.3f} {b['seconds']:>7.3f}")
+    window = min(5, len(questions))
+    for name, rows in (("full-history", full), ("conversation", stored)):
+        first, last = rows[:window], rows[-window:]
+
+        def change(key: str, fmt: str) -> str:
+            return (f"{statistics.mean(r[key] for r in first):{fmt}} -> "
+                    f"{statistics.mean(r[key] for r in last):{fmt}}")
+
+        print(f"{name:<13} first -> last {window} turns: translate tokens {change('translate', '.0f')}, "
+              f"translate {change('translate_seconds', '.3f')}s, total {change('seconds', '.3f')}s; "
+              f"summary tokens {statistics.mean(r['summary'] for r in rows):.0f}/turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""End-to-end benchmark of ingestion and /chat against deterministic fake backends.
+
+    python bench_e2e.py --concurrency 1,16,64 --requests 200
+    python bench_e2e.py --server asgi --output results.json --compare bench_results/e2e-<commit>.json
+
+``markdown_loader.main`` ingests synthetic acts with the fake LLM, embedder and
+in-memory vector store from ``fakes.py``. The resulting corpus is then queried
+through a real HTTP server (Flask or ASGI) at each concurrency level. The run
+reports throughput, p50/p95/p99 latency, time to first token and peak memory,
+and writes everything with the commit hash to JSON so runs can be compared.
+Client and server share the process, so peak RSS includes the load generator.
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+_tmp = tempfile.mkdtemp(prefix="legaladviser-bench-")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ.setdefault("GEMINI_KEY", "stub")
+os.environ["VECTOR_STORE_BACKEND"] = "local"
+os.environ["LOCAL_INDEX_DIR"] = _tmp
+os.environ["ANSWER_CACHE"] = "off"
+os.environ["EMBEDDING_CACHE"] = "off"
+os.environ["LEXICAL_INDEX_DIR"] = os.path.join(_tmp, "lexical")
+os.environ["DOCUMENT_STORE_DIR"] = os.path.join(_tmp, "documents")
+os.environ["CONVERSATION_STORE_PATH"] = os.path.join(_tmp, "conversations.sqlite3")
+os.environ["INGEST_RPM"] = os.environ["INGEST_TPM"] = "1e12"
+os.environ.setdefault("REQUEST_COALESCING", "off")
+os.environ.setdefault("REQUEST_LOG", "off")
+# The stub key would fail the Gemini warm-up; the fakes need none.
+os.environ["BACKEND_WARMUP"] = "off"
+os.environ.setdefault("MAX_CONCURRENT_STREAMS", "100000")
+
+import logging
+
+import httpx
+import numpy as np
+
+import markdown_loader
+import rag_server
+from bench_chunker import synthetic_act
+from fakes import FakeEmbedder, FakeLLM, FakeVectorStore, start_server
+from lexical_index import lexical_index_from_env
+
+PERCENTILES = (50, 95, 99)
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(values: list[float], prefix: str) -> dict:
+    if not values:
+        return {f"{prefix}_p{p}_s": None for p in PERCENTILES}
+    return {f"{prefix}_p{p}_s": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def git_commit() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "unknown", "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def run_ingest(args, llm: FakeLLM, embedder: FakeEmbedder, store: FakeVectorStore) -> tuple[dict, list[str]]:
+    rng = np.random.default_rng(args.seed)
+    input_dir, processed_dir = Path(_tmp) / "input", Path(_tmp) / "processed"
+    input_dir.mkdir()
+    questions = []
+    for act in range(args.documents):
+        text, pairs = synthetic_act(rng, act, args.sections)
+        (input_dir / f"act_{act}.md").write_text(text, encoding="utf-8")
+        questions += [q for q, _ in pairs]
+    markdown_loader.INPUT_DIR, markdown_loader.PROCESSED_DIR = input_dir, processed_dir
+    os.environ["INGEST_WORKERS"] = str(args.ingest_workers)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    markdown_loader.main(vector_store=store, embedder=embedder, llm_wrapper=llm)
+    wall = time.perf_counter() - started
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "documents": args.documents,
+        "chunks": len(store),
+        "wall_s": wall,
+        "chunks_per_s": len(store) / wall if wall else None,
+        "llm_calls": llm.calls["generate"],
+        "python_peak_mb": traced_peak / 1024 / 1024,
+        "peak_rss_mb": peak_rss_mb(),
+    }, questions
+
+
+async def one_request(client: httpx.AsyncClient, url: str, question: str, expected_chunks: int) -> dict:
+    started = time.perf_counter()
+    first_token = None
+    chunks = 0
+    try:
+        async with client.stream("POST", url, json={"queries": [question]}) as response:
+            if response.status_code != 200:
+                return {"ok": False, "error": f"HTTP {response.status_code}"}
+            async for line in response.aiter_lines():
+                if '"step": "Answering"' in line:
+                    chunks += 1
+                    first_token = first_token or time.perf_counter() - started
+                elif '"step": "Error"' in line:
+                    return {"ok": False, "error": line}
+    except httpx.HTTPError as e:
+        return {"ok": False, "error": type(e).__name__}
+    return {"ok": chunks == expected_chunks, "ttft": first_token, "total": time.perf_counter() - started,
+            "error": None if chunks == expected_chunks else f"{chunks} chunks"}
+
+
+async def drive(url: str, questions: list[str], concurrency: int, requests: int, expected_chunks: int,
+                timeout: float) -> dict:
+    pending = iter(range(requests))
+    results = []
+
+    async def worker(client):
+        for i in pending:
+            results.append(await one_request(client, url, questions[i % len(questions)], expected_chunks))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    ok = [r for r in results if r["ok"]]
+    errors = sorted({r["error"] for r in results if not r["ok"]})
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": errors[:5],
+        "wall_s": wall,
+        "throughput_rps": len(ok) / wall if wall else None,
+        **percentiles([r["total"] for r in ok], "latency"),
+        **percentiles([r["ttft"] for r in ok], "ttft"),
+        "peak_threads": threading.active_count(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\nChange versus {baseline['commit']} ({baseline_path}):")
+    for key in ("chunks_per_s", "python_peak_mb", "peak_rss_mb"):
+        old, new = baseline["ingest"].get(key), current["ingest"].get(key)
+        if old and new is not None:
+            print(f"  ingest {key:<20} {old:>10.2f} -> {new:>10.2f} ({(new - old) / old:+.1%})")
+    old_levels = {level["concurrency"]: level for level in baseline["chat"]}
+    for level in current["chat"]:
+        old = old_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        for key in ("throughput_rps", "latency_p50_s", "latency_p99_s", "ttft_p50_s", "ttft_p99_s"):
+            if old.get(key) and level.get(key) is not None:
+                print(f"  chat c={level['concurrency']:<4} {key:<15} {old[key]:>10.3f} -> {level[key]:>10.3f} "
+                      f"({(level[key] - old[key]) / old[key]:+.1%})")
+
+
+def fmt(value: float | None) -> str:
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--concurrency", default="1,16,64", help="comma-separated numbers of concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="/chat requests per concurrency level")
+    parser.add_argument("--documents", type=int, default=8, help="synthetic acts to ingest")
+    parser.add_argument("--sections", type=int, default=60, help="sections per synthetic act")
+    parser.add_argument("--ingest-workers", type=int, default=8)
+    parser.add_argument("--generate-delay", type=float, default=0.2, help="seconds per fake generate call")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="seconds before the first answer chunk")
+    parser.add_argument("--chunks", type=int, default=20, help="answer chunks streamed per request")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--embed-latency", type=float, default=0.01)
+    parser.add_argument("--vector-latency", type=float, default=0.005)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON results path (default bench_results/e2e-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to print changes against")
+    args = parser.parse_args()
+    # Per-chunk and per-request log lines would dominate the timings.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    llm = FakeLLM(args.generate_delay, args.first_token_delay, args.chunks, args.chunk_delay)
+    embedder = FakeEmbedder(latency=args.embed_latency)
+    store = FakeVectorStore(latency=args.vector_latency)
+
+    ingest, questions = run_ingest(args, llm, embedder, store)
+    print(f"ingest: {ingest['chunks']} chunks from {ingest['documents']} documents in {ingest['wall_s']:.2f}s "
+          f"({ingest['chunks_per_s']:.1f} chunks/s), python peak {ingest['python_peak_mb']:.1f} MB")
+
+    rag_server.llm = rag_server.translate_llm = rag_server.background_llm = llm
+    rag_server.embedder = embedder
+    rag_server.vector_store = store
+    rag_server.lexical_index = lexical_index_from_env()
+
+    port = {"flask": 8711, "asgi": 8712}[args.server]
+    stop = start_server(args.server, port)
+    chat = []
+    print(f"{'clients':>7} {'ok':>5} {'failed':>6} {'req/s':>7} {'p50 s':>6} {'p95 s':>6} {'p99 s':>6} "
+          f"{'ttft p50':>8} {'ttft p99':>8} {'rss MB':>7}")
+    try:
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            r = asyncio.run(drive(f"http://127.0.0.1:{port}/chat", questions, concurrency, args.requests,
+                                  args.chunks, args.timeout))
+            chat.append(r)
+            print(f"{concurrency:>7} {r['ok']:>5} {r['failed']:>6} {fmt(r['throughput_rps']):>7} "
+                  f"{fmt(r['latency_p50_s']):>6} {fmt(r['latency_p95_s']):>6} {fmt(r['latency_p99_s']):>6} "
+                  f"{fmt(r['ttft_p50_s']):>8} {fmt(r['ttft_p99_s']):>8} {r['peak_rss_mb']:>7.0f}")
+    finally:
+        stop()
+
+    results = {**git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": sys.version.split()[0],
+               "config": vars(args), "ingest": ingest, "chat": chat}
+    output = Path(args.output or f"bench_results/e2e-{results['commit']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"\nWrote {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
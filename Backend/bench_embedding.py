@@ -0,0 +1,88 @@
+"""Per-query latency and ingestion throughput of the Gemini and local embedding backends.
+
+    python bench_embedding.py --backends gemini,local --concurrency 1,8,32
+    python bench_embedding.py --backends local --quantize --max-wait-ms 10
+
+Query latency is measured with ``--concurrency`` threads each embedding one
+question at a time, the way /chat calls it; ingestion throughput embeds chunk-sized
+texts in batches of ``EMBED_BATCH_SIZE`` like ``markdown_loader``. The embedding
+cache is off throughout. Gemini needs ``GEMINI_KEY``.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+from bench_rerank import SENTENCES
+from embedding_engine_wrapper import EmbeddingEngineWrapper
+from markdown_loader import EMBED_BATCH_SIZE
+
+QUESTIONS = [
+    "What is the minimum voting age?",
+    "मतदान गर्ने न्यूनतम उमेर कति हो?",
+    "What is the VAT rate on taxable goods?",
+    "How long is a passport valid?",
+    "What is the fine for not registering for VAT?",
+]
+
+
+def query_latency(embedder: EmbeddingEngineWrapper, concurrency: int, queries: int) -> np.ndarray:
+    def one(i):
+        started = time.perf_counter()
+        embedder.embed([f"{QUESTIONS[i % len(QUESTIONS)]} ({i})"])
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return np.asarray(list(pool.map(one, range(queries))))
+
+
+def ingestion_throughput(embedder: EmbeddingEngineWrapper, chunks: int, chunk_tokens: int) -> float:
+    rng = np.random.default_rng(0)
+    texts = [" ".join(rng.choice(SENTENCES, size=max(1, chunk_tokens // 20))) + f" ({i})" for i in range(chunks)]
+    started = time.perf_counter()
+    for i in range(0, len(texts), EMBED_BATCH_SIZE):
+        embedder.embed(texts[i:i + EMBED_BATCH_SIZE])
+    return chunks / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="gemini,local")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated query thread counts")
+    parser.add_argument("--queries", type=int, default=64, help="queries per concurrency level")
+    parser.add_argument("--chunks", type=int, default=256, help="texts for the ingestion run")
+    parser.add_argument("--chunk-tokens", type=int, default=400)
+    parser.add_argument("--quantize", action="store_true", help="int8 local model")
+    parser.add_argument("--max-wait-ms", type=float, help="local batching window")
+    args = parser.parse_args()
+    load_dotenv()
+    if args.quantize:
+        os.environ["LOCAL_EMBEDDING_QUANTIZE"] = "on"
+    if args.max_wait_ms is not None:
+        os.environ["LOCAL_EMBEDDING_MAX_WAIT_MS"] = str(args.max_wait_ms)
+
+    print(f"{'backend':>8} {'threads':>7} {'p50 ms':>8} {'p95 ms':>8} {'q/s':>8}")
+    throughput = {}
+    for backend in args.backends.split(","):
+        started = time.perf_counter()
+        embedder = EmbeddingEngineWrapper(cache=False, backend=backend)
+        load_seconds = time.perf_counter() - started
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            started = time.perf_counter()
+            latencies = query_latency(embedder, concurrency, args.queries)
+            rate = args.queries / (time.perf_counter() - started)
+            p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+            print(f"{backend:>8} {concurrency:>7} {p50:>8.1f} {p95:>8.1f} {rate:>8.1f}")
+        throughput[backend] = (embedder.model_name, load_seconds,
+                               ingestion_throughput(embedder, args.chunks, args.chunk_tokens))
+
+    print()
+    for backend, (model_name, load_seconds, rate) in throughput.items():
+        print(f"{backend}: {model_name} loaded in {load_seconds:.1f}s, ingestion {rate:.1f} chunks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""BM25 query latency of LexicalIndex on a synthetic corpus.
+
+    python bench_lexical.py --chunks 20000 --chunk-terms 600
+
+Chunk text follows a Zipf term distribution; queries draw their terms from random
+chunks, skipping the most frequent ones the way real questions are mostly content words.
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from lexical_index import LexicalIndex, tokenize
+
+# Letters no Romanized spelling fold touches, so every synthetic term stays one distinct token.
+TERM_LETTERS = "bcdfgijklmnpqrtuwxyz"
+
+
+def synthetic_term(i: int) -> str:
+    """A purely alphabetic term: ``i`` written in base 20 with ``TERM_LETTERS`` after a ``term`` prefix."""
+    digits = ""
+    while True:
+        i, digit = divmod(i, len(TERM_LETTERS))
+        digits = TERM_LETTERS[digit] + digits
+        if i == 0:
+            return "term" + digits
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--chunk-terms", type=int, default=600, help="terms per chunk")
+    parser.add_argument("--vocabulary", type=int, default=100_000)
+    parser.add_argument("--query-terms", type=int, default=6)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--skip-frequent", type=int, default=1000, help="most frequent terms never used in queries")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vocabulary = np.asarray([synthetic_term(i) for i in range(args.vocabulary)])
+    assert all(tokenize(term) == [term] for term in vocabulary), "synthetic terms must tokenize to themselves"
+    ranks = np.minimum(rng.zipf(1.2, size=(args.chunks, args.chunk_terms)), args.vocabulary) - 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LexicalIndex(tmp)
+        started = time.perf_counter()
+        index.upsert([f"chunk-{i}" for i in range(args.chunks)], [" ".join(vocabulary[row]) for row in ranks])
+        index.save()
+        print(f"built index over {len(index)} chunks, {len(index.term_ids)} terms, "
+              f"{len(index.posting_docs)} postings in {time.perf_counter() - started:.1f}s")
+
+        queries = []
+        for row in rng.integers(0, args.chunks, size=args.queries):
+            content = ranks[row][ranks[row] >= args.skip_frequent]
+            queries.append(" ".join(vocabulary[rng.choice(content, size=args.query_terms)]))
+
+        lengths = [index.offsets[index.term_ids[t] + 1] - index.offsets[index.term_ids[t]]
+                   for q in queries for t in tokenize(q)]
+        print(f"query terms occur in {np.mean(lengths) / len(index):.1%} of chunks on average")
+
+        for query in queries[:50]:  # warm the page cache and the term-folding cache
+            index.search(query, args.top_k)
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, args.top_k)
+            latencies.append(time.perf_counter() - started)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"{args.queries} queries of {args.query_terms} terms, top {args.top_k}: "
+              f"p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Peak memory and time-to-first-window of eager versus lazy PDF page-window splitting.
+
+    python bench_pdf_memory.py                # every PDF in ../Datasets
+    python bench_pdf_memory.py --in-flight 8 path/to/file.pdf
+
+Each measurement runs in a fresh subprocess so peak RSS is not polluted by earlier runs.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+DATASETS_DIR = Path(__file__).resolve().parent.parent / "Datasets"
+
+
+def measure(mode: str, pdf_path: Path, in_flight: int) -> dict:
+    from pdf_to_markdown_agent import pdf_to_byte_chunks
+
+    started = time.perf_counter()
+    first_window = None
+    total_bytes = 0
+    windows = 0
+    if mode == "eager":
+        # What pdf_to_byte_chunks used to do: build every window before returning.
+        chunks = list(pdf_to_byte_chunks(pdf_path))
+        first_window = time.perf_counter() - started
+        for chunk in chunks:
+            total_bytes += len(chunk)
+            windows += 1
+    else:
+        pending = deque(maxlen=in_flight)  # windows handed to workers but not yet finished
+        for chunk in pdf_to_byte_chunks(pdf_path):
+            first_window = first_window or time.perf_counter() - started
+            pending.append(chunk)
+            total_bytes += len(chunk)
+            windows += 1
+    return {
+        "mode": mode,
+        "windows": windows,
+        "window_mb": total_bytes / 2**20,
+        "first_window_s": first_window or 0.0,
+        "total_s": time.perf_counter() - started,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="*", type=Path)
+    parser.add_argument("--in-flight", type=int, default=4, help="windows held at once in lazy mode")
+    parser.add_argument("--child", choices=["eager", "lazy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.pdfs[0], args.in_flight)))
+        return
+
+    pdfs = args.pdfs or sorted(DATASETS_DIR.glob("*.pdf"))
+    print(f"{'pdf':<55} {'mode':<5} {'windows':>7} {'MB out':>7} {'first s':>8} {'total s':>8} {'peak RSS MB':>11}")
+    for pdf in pdfs:
+        for mode in ("eager", "lazy"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode, "--in-flight", str(args.in_flight), str(pdf)],
+                capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent,
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{pdf.name[:55]:<55} {mode:<5} {r['windows']:>7} {r['window_mb']:>7.1f} {r['first_window_s']:>8.2f} "
+                  f"{r['total_s']:>8.2f} {r['peak_rss_mb']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Latency of the cross-encoder rerank step at several candidate counts.
+
+    python bench_rerank.py --candidates 10,25,50,100 --threads 4
+    python bench_rerank.py --backend onnx --quantize
+
+Passages are synthetic legal-style text of about ``--passage-tokens`` tokens, so
+the numbers reflect model cost at the configured ``max_length``.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from reranker import DEFAULT_RERANK_MAX_LENGTH, DEFAULT_RERANK_MODEL, Reranker
+
+SENTENCES = [
+    "The tax officer may require the taxpayer to submit records for the preceding five fiscal years.",
+    "A citizen of Nepal who has attained the age of eighteen years shall have the right to vote.",
+    "Any person who contravenes this section shall be liable to a fine of up to fifty thousand rupees.",
+    "The application for a passport shall be submitted to the district administration office.",
+    "Value added tax shall be levied at the rate of thirteen percent on taxable goods and services.",
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--candidates", default="10,25,50,100", help="comma-separated candidate counts")
+    parser.add_argument("--model", default=DEFAULT_RERANK_MODEL)
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino"], default="torch")
+    parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--max-length", type=int, default=DEFAULT_RERANK_MAX_LENGTH)
+    parser.add_argument("--passage-tokens", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    reranker = Reranker(args.model, backend=args.backend, quantize=args.quantize, threads=args.threads,
+                        max_length=args.max_length)
+    print(f"loaded {args.model} ({args.backend}{', int8' if args.quantize else ''}) "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    rng = np.random.default_rng(0)
+    sentences_per_passage = max(1, args.passage_tokens // 20)
+    print(f"{'candidates':>10} {'p50 ms':>8} {'p95 ms':>8} {'ms/pair':>8}")
+    for n in (int(c) for c in args.candidates.split(",")):
+        passages = [" ".join(rng.choice(SENTENCES, size=sentences_per_passage)) for _ in range(n)]
+        reranker.score("What is the VAT rate?", passages)  # warm this batch shape
+        latencies = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            reranker.score("What is the VAT rate?", passages)
+            latencies.append(time.perf_counter() - started)
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+        print(f"{n:>10} {p50:>8.1f} {p95:>8.1f} {p50 / n:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Storage size, index load time and query latency of the legacy and compact chunk layouts.
+
+    python bench_storage.py --acts 300
+    python bench_storage.py --acts 300 --dim 3072 --quantization float16
+
+Synthetic acts are chunked with ``markdown_loader.split_document`` and embedded with
+the hashed-word fake embedder, then stored twice with ``markdown_loader.vector_metadata``:
+the legacy layout keeps each chunk's text and summary as metadata on a float32
+index, the compact one keeps only provision/pages metadata on a quantized index and
+the texts in the lz4 document store. For each layout this reports bytes per chunk
+on disk and scanned per query, the time to open the index and answer a first
+query, the latency of a query for ``--fetch-k`` candidates plus the texts of the
+top ``--k``, the bytes of a query response (what Pinecone would send back), and
+the recall@k of the compact layout against exact float32 search.
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from bench_chunker import synthetic_act
+from document_store import DocumentStore
+from fakes import FakeEmbedder, FakeLLM
+from local_vector_index import LocalVectorIndex
+from markdown_loader import split_document, vector_metadata
+
+
+def build_corpus(acts: int, sections: int, seed: int):
+    rng = np.random.default_rng(seed)
+    ids, chunks, summaries, metas, questions = [], [], [], [], []
+    for act in range(acts):
+        text, pairs = synthetic_act(rng, act, sections)
+        act_chunks, act_meta = split_document(text)
+        for i, (chunk, meta) in enumerate(zip(act_chunks, act_meta)):
+            ids.append(f"act{act}-chunk{i}")
+            chunks.append(chunk)
+            # The fake summarizer keeps the first words, about the length of a real summary.
+            summaries.append(FakeLLM.respond(f"summarization assistant\n\n{chunk}"))
+            metas.append(meta)
+        questions += [q for q, _ in pairs]
+    return ids, chunks, summaries, metas, questions
+
+
+def directory_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def timed(call, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def measure(name: str, root: Path, quantization: str, documents: DocumentStore | None, queries: np.ndarray,
+            args) -> dict:
+    def open_and_query():
+        LocalVectorIndex(root, quantization=quantization).query(vector=queries[0], top_k=args.fetch_k)
+
+    index = LocalVectorIndex(root, quantization=quantization)
+    ns = index._namespace(None)
+    responses = []
+
+    def one_query(vector):
+        response = index.query(vector=vector, top_k=args.fetch_k, include_metadata=True)
+        top = response["matches"][:args.k]
+        if documents is not None:
+            texts = documents.get_many([m["id"] for m in top])
+        else:
+            texts = {m["id"]: m["metadata"]["document"] for m in top}
+        responses.append(response)
+        return [m["id"] for m in top], texts
+
+    one_query(queries[0])
+    latencies, results = [], []
+    for vector in queries:
+        started = time.perf_counter()
+        results.append(one_query(vector)[0])
+        latencies.append(time.perf_counter() - started)
+    disk = directory_bytes(root) + (directory_bytes(documents.root) if documents is not None else 0)
+    scanned = ns.codes if ns.codes is not None else ns.vectors
+    return {
+        "layout": name,
+        "chunks": len(ns),
+        "disk_bytes_per_chunk": disk / len(ns),
+        "scanned_bytes_per_chunk": scanned.nbytes / len(ns),
+        "load_s": statistics.median(timed(open_and_query, args.load_runs)),
+        "query_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "query_p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "response_bytes": statistics.mean(len(json.dumps(r, ensure_ascii=False).encode("utf-8"))
+                                          for r in responses),
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--acts", type=int, default=300, help="synthetic acts (about 60 chunks each)")
+    parser.add_argument("--sections", type=int, default=60)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--quantization", choices=["int8", "float16"], default="int8")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--load-runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ids, chunks, summaries, metas, questions = build_corpus(args.acts, args.sections, args.seed)
+    embedder = FakeEmbedder(dim=args.dim)
+    vectors = [e.values for e in embedder.embed([f"{s}\n{c}" for s, c in zip(summaries, chunks)])]
+    rng = np.random.default_rng(args.seed)
+    asked = [questions[i] for i in rng.choice(len(questions), size=min(args.queries, len(questions)), replace=False)]
+    queries = np.asarray([e.values for e in embedder.embed(asked)], dtype=np.float32)
+    print(f"{len(ids)} chunks of {args.dim} dimensions, {len(queries)} queries")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = []
+        for name, quantization, documents in (
+            ("legacy", "none", None),
+            (f"compact-{args.quantization}", args.quantization, DocumentStore(Path(tmp) / "documents")),
+        ):
+            root = Path(tmp) / name
+            if documents is not None:
+                documents.put_many(ids, chunks)
+            LocalVectorIndex(root, quantization=quantization).upsert([
+                {"id": id_, "values": vector, "metadata": vector_metadata(chunk, summary, meta, documents)}
+                for id_, vector, chunk, summary, meta in zip(ids, vectors, chunks, summaries, metas)
+            ])
+            rows.append(measure(name, root, quantization, documents, queries, args))
+
+    exact = rows[0]["results"]
+    print(f"{'layout':<15} {'disk B/chunk':>12} {'scan B/chunk':>12} {'load s':>7} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'resp B':>8} {'recall@k':>8}")
+    for row in rows:
+        recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(row["results"], exact) if b])
+        print(f"{row['layout']:<15} {row['disk_bytes_per_chunk']:>12.0f} {row['scanned_bytes_per_chunk']:>12.0f} "
+              f"{row['load_s']:>7.3f} {row['query_p50_ms']:>7.2f} {row['query_p95_ms']:>7.2f} "
+              f"{row['response_bytes']:>8.0f} {recall:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Process-wide Gemini and Pinecone clients, created lazily and shared by every wrapper.
+
+Constructing a wrapper makes no network call. The first use of a client builds it
+once under a lock, with a keep-alive connection pool sized by ``CLIENT_POOL_SIZE``
+(default 32) and ``CLIENT_TIMEOUT_SECONDS`` (default 120). Gemini uses HTTP/2 when
+the ``h2`` package is installed. ``start_warmup`` makes those first calls on a
+background thread at server start, so startup doesn't wait on the network and
+``readiness()`` reports when each backend has answered.
+"""
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+DEFAULT_POOL_SIZE = 32
+DEFAULT_TIMEOUT_SECONDS = 120.0
+DEFAULT_KEEPALIVE_SECONDS = 60.0
+
+STATE_PENDING = "pending"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+_clients: Dict[Any, Any] = {}
+# One lock per key, so a factory that needs another shared client (a Pinecone index needs
+# the Pinecone client) and slow factories for different clients don't wait on each other.
+_key_locks: Dict[Any, threading.Lock] = {}
+_lock = threading.Lock()
+_readiness: Dict[str, Dict[str, Any]] = {}
+_readiness_lock = threading.Lock()
+
+
+def pool_size() -> int:
+    return int(os.getenv("CLIENT_POOL_SIZE", DEFAULT_POOL_SIZE))
+
+
+def timeout_seconds() -> float:
+    return float(os.getenv("CLIENT_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS))
+
+
+def http2_enabled() -> bool:
+    if os.getenv("CLIENT_HTTP2", "on").lower() in ("off", "0", "false"):
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+def shared(key: Any, factory: Callable[[], Any]) -> Any:
+    """The client stored under ``key``, built by ``factory`` on first use by exactly one thread.
+
+    ``factory`` runs under ``key``'s own lock only, so it may itself call ``shared`` for another key.
+    """
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        client = _clients.get(key)
+        if client is None:
+            started = time.perf_counter()
+            client = _clients[key] = factory()
+            logging.info("Created %s client in %.2fs", key[0] if isinstance(key, tuple) else key,
+                         time.perf_counter() - started)
+    return client
+
+
+def _httpx_args() -> Dict[str, Any]:
+    import httpx
+
+    size = pool_size()
+    return {
+        "limits": httpx.Limits(max_connections=size, max_keepalive_connections=size,
+                               keepalive_expiry=DEFAULT_KEEPALIVE_SECONDS),
+        "http2": http2_enabled(),
+    }
+
+
+def gemini_client(api_key: str | None = None):
+    api_key = api_key or os.getenv("GEMINI_KEY")
+
+    def create():
+        from google import genai
+        from google.genai import types
+
+        # The SDK takes milliseconds. With aiohttp installed the async side uses its own
+        # per-loop session and ignores the httpx-only arguments.
+        options = types.HttpOptions(timeout=int(timeout_seconds() * 1000), client_args=_httpx_args(),
+                                    async_client_args=_httpx_args())
+        return genai.Client(api_key=api_key, http_options=options)
+
+    return shared(("gemini", api_key), create)
+
+
+def pinecone_client(api_key: str | None = None):
+    api_key = api_key or os.getenv("PINECONE_API_KEY")
+
+    def create():
+        from pinecone import Pinecone
+
+        return Pinecone(api_key=api_key)
+
+    return shared(("pinecone", api_key), create)
+
+
+def pinecone_index(index_name: str, api_key: str | None = None):
+    """The data-plane client of ``index_name``; ``PINECONE_HOST`` skips the control-plane lookups."""
+    api_key = api_key or os.getenv("PINECONE_API_KEY")
+
+    def create():
+        pc = pinecone_client(api_key)
+        host = os.getenv("PINECONE_HOST")
+        if host:
+            return pc.Index(host=host, connection_pool_maxsize=pool_size())
+        index_names = [i.get("name") for i in pc.list_indexes().indexes]
+        if index_name not in index_names:
+            raise ValueError(f"Cannot find pinecone index {index_name}")
+        return pc.Index(index_name, connection_pool_maxsize=pool_size())
+
+    return shared(("pinecone-index", api_key, index_name), create)
+
+
+def _set_state(name: str, state: str, **fields) -> None:
+    with _readiness_lock:
+        _readiness[name] = {"state": state, **fields}
+
+
+def warm_up(checks: Dict[str, Callable[[], Any]]) -> None:
+    """Run each check in turn, recording whether its backend is ready."""
+    for name, check in checks.items():
+        started = time.perf_counter()
+        try:
+            check()
+        except Exception as e:
+            logging.exception("Warm-up of %s failed", name)
+            _set_state(name, STATE_FAILED, error=f"{type(e).__name__}: {e}",
+                       seconds=round(time.perf_counter() - started, 3))
+        else:
+            _set_state(name, STATE_READY, seconds=round(time.perf_counter() - started, 3))
+
+
+def start_warmup(checks: Dict[str, Callable[[], Any]]) -> threading.Thread | None:
+    """Warm up the backends on a daemon thread; ``BACKEND_WARMUP=off`` skips it and reports them ready."""
+    if os.getenv("BACKEND_WARMUP", "on").lower() in ("off", "0", "false"):
+        for name in checks:
+            _set_state(name, STATE_READY, seconds=0.0, skipped=True)
+        return None
+    for name in checks:
+        _set_state(name, STATE_PENDING)
+    thread = threading.Thread(target=warm_up, args=(checks,), name="backend-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> Dict[str, Any]:
+    with _readiness_lock:
+        components = {name: dict(state) for name, state in _readiness.items()}
+    return {"ready": all(c["state"] == STATE_READY for c in components.values()), "components": components}
+
+
+def test():
+    from concurrent.futures import ThreadPoolExecutor
+
+    created = []
+
+    def factory():
+        time.sleep(0.05)
+        created.append(object())
+        return created[-1]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        clients = list(pool.map(lambda _: shared(("test", 1), factory), range(16)))
+    assert len(created) == 1 and all(c is created[0] for c in clients)
+
+    # A Pinecone index is built from the shared Pinecone client, itself created on first use.
+    import sys
+    import types
+
+    class StubPinecone:
+        def __init__(self, api_key):
+            self.api_key = api_key
+
+        def list_indexes(self):
+            return types.SimpleNamespace(indexes=[{"name": "laws"}])
+
+        def Index(self, name, connection_pool_maxsize):
+            return ("index", name, self.api_key)
+
+    saved = sys.modules.get("pinecone")
+    sys.modules["pinecone"] = types.SimpleNamespace(Pinecone=StubPinecone)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            index = pool.submit(pinecone_index, "laws", "test-key").result(timeout=2)
+        assert index == ("index", "laws", "test-key") and pinecone_client("test-key").api_key == "test-key"
+    finally:
+        if saved is None:
+            del sys.modules["pinecone"]
+        else:
+            sys.modules["pinecone"] = saved
+        for key in [k for k in _clients if isinstance(k, tuple) and "test-key" in k]:
+            del _clients[key]
+
+    def fail():
+        raise ConnectionError("unreachable")
+
+    start_warmup({"test.slow": lambda: time.sleep(0.1), "test.down": fail}).join()
+    state = readiness()
+    assert not state["ready"]
+    assert state["components"]["test.slow"]["state"] == STATE_READY
+    assert state["components"]["test.down"]["error"] == "ConnectionError: unreachable"
+    print("Client registry, nested Pinecone index and readiness test passed.")
+
+
+if __name__ == "__main__":
+    test()
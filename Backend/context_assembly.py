@@ -0,0 +1,167 @@
+"""Turn retrieved passages into a compact, cited context block for the answer prompt.
+
+Passages keep their retrieval order. Sentences already included from an earlier
+passage are dropped (page-window chunks overlap by a page), each passage is trimmed
+to the sentences that share the most weighted terms with the question and its
+sub-queries, and passages are packed until ``CONTEXT_TOKEN_BUDGET`` is used up.
+"""
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from ingest_scheduler import estimate_tokens
+from lexical_index import tokenize
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = 3000
+DEFAULT_PASSAGE_TOKEN_BUDGET = 600
+# Passages whose sentences were nearly all in earlier passages are skipped entirely.
+DUPLICATE_PASSAGE_FRACTION = 0.8
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?।॥])\s+|\n+")
+_tokenizer = None
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens of ``text``: Gemini's local tokenizer with ``TOKEN_COUNTER=gemini``, else a chars/4 estimate."""
+    global _tokenizer
+    if os.getenv("TOKEN_COUNTER", "estimate") == "gemini":
+        if _tokenizer is None:
+            try:
+                from google.genai.local_tokenizer import LocalTokenizer  # needs sentencepiece
+
+                _tokenizer = LocalTokenizer(model_name=os.getenv("TOKEN_COUNTER_MODEL", "gemini-2.5-pro"))
+            except Exception:
+                logging.exception("Gemini local tokenizer unavailable; estimating token counts")
+                _tokenizer = False
+        if _tokenizer:
+            return _tokenizer.count_tokens(text).total_tokens
+    return estimate_tokens(text)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(tokenize(sentence))
+
+
+def citation_header(n: int, context: Dict[str, Any]) -> str:
+    parts = [f"[{n}]"]
+    if context.get("provision"):
+        parts.append(str(context["provision"]))
+    if context.get("pages"):
+        parts.append(f"pages {context['pages']}")
+    return " ".join(parts)
+
+
+def trim_passage(sentences: List[str], weights: Dict[str, float], budget: int) -> Tuple[List[str], bool]:
+    """The highest-scoring sentences that fit in ``budget`` tokens, in their original order."""
+    if count_tokens(" ".join(sentences)) <= budget:
+        return sentences, False
+    scored = sorted(
+        range(len(sentences)),
+        key=lambda i: sum(weights.get(t, 0.0) for t in set(tokenize(sentences[i]))),
+        reverse=True,
+    )
+    keep, used = set(), 0
+    for i in scored:
+        cost = count_tokens(sentences[i])
+        if used + cost <= budget:
+            keep.add(i)
+            used += cost
+    if not keep:
+        # Statutory clauses are often one run-on sentence longer than the budget: keep its start.
+        head = truncate_sentence(sentences[scored[0]], budget)
+        return ([head] if head else []), True
+    return [sentences[i] for i in sorted(keep)], True
+
+
+def truncate_sentence(sentence: str, budget: int) -> str:
+    """The longest word prefix of ``sentence`` that fits in ``budget`` tokens with an ellipsis."""
+    words = sentence.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle]) + " …") <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + " …" if low else ""
+
+
+def assemble_context(contexts: List[Dict[str, Any]], queries: List[str],
+                     budget: int | None = None, passage_budget: int | None = None) -> Tuple[str, Dict[str, int]]:
+    """Render ``contexts`` (rows from ``rag_server.context_rows``) within ``budget`` tokens.
+
+    Returns the context block and usage counts: raw tokens of the passages as retrieved,
+    tokens actually kept, and how many passages were included, deduplicated or trimmed.
+    """
+    budget = budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", DEFAULT_CONTEXT_TOKEN_BUDGET))
+    passage_budget = passage_budget or int(os.getenv("PASSAGE_TOKEN_BUDGET", DEFAULT_PASSAGE_TOKEN_BUDGET))
+    passages = [split_sentences(c.get("document") or "") for c in contexts]
+
+    # Query terms weighted by how rare they are among the retrieved sentences.
+    query_terms = Counter(t for q in queries for t in set(tokenize(q)))
+    sentence_terms = Counter(t for sentences in passages for s in sentences for t in set(tokenize(s)))
+    n_sentences = sum(len(s) for s in passages) or 1
+    weights = {t: c * math.log(1 + n_sentences / (1 + sentence_terms[t])) for t, c in query_terms.items()}
+
+    usage = {"raw_context_tokens": sum(count_tokens(c.get("document") or "") for c in contexts),
+             "context_tokens": 0, "passages": 0, "deduplicated": 0, "trimmed": 0}
+    seen: set = set()
+    blocks: List[str] = []
+    for context, sentences in zip(contexts, passages):
+        fresh = [s for s in sentences if _sentence_key(s) not in seen]
+        if not fresh or len(fresh) <= (1 - DUPLICATE_PASSAGE_FRACTION) * len(sentences):
+            usage["deduplicated"] += 1
+            continue
+        header = citation_header(usage["passages"] + 1, context)
+        remaining = budget - usage["context_tokens"] - count_tokens(header) - 1
+        if remaining <= 0:
+            break
+        kept, trimmed = trim_passage(fresh, weights, min(passage_budget, remaining))
+        if not kept:
+            continue
+        seen.update(_sentence_key(s) for s in kept)
+        block = f"{header}\n{' '.join(kept)}"
+        blocks.append(block)
+        usage["context_tokens"] += count_tokens(block)
+        usage["passages"] += 1
+        usage["trimmed"] += trimmed or len(fresh) < len(sentences)
+    return "\n\n".join(blocks), usage
+
+
+def test():
+    long_passage = " ".join(f"Filler sentence number {i} about unrelated procedure." for i in range(200))
+    contexts = [
+        {"document": "Section 11. The VAT rate is thirteen percent. " + long_passage, "provision": "Section 11",
+         "pages": "12-13"},
+        {"document": "The VAT rate is thirteen percent. Section 11 applies to all taxable goods.", "pages": "13-14"},
+        {"document": "The VAT rate is thirteen percent.", "pages": "13-13"},
+        {"document": "Section 12. Registration is required above the threshold."},
+    ]
+    text, usage = assemble_context(contexts, ["What is the VAT rate?"], budget=200, passage_budget=80)
+    assert text.startswith("[1] Section 11 pages 12-13\n")
+    assert "The VAT rate is thirteen percent." in text and text.count("thirteen percent") == 1
+    assert "[2] pages 13-14\nSection 11 applies to all taxable goods." in text
+    assert usage["deduplicated"] == 1 and usage["trimmed"] >= 1
+    assert usage["context_tokens"] <= 200 < usage["raw_context_tokens"]
+
+    # A top passage that is one sentence longer than the passage budget is truncated, not
+    # dropped along with everything ranked below it.
+    run_on = ", and ".join(f"the licensee shall maintain record {i} of each transaction" for i in range(60))
+    text, usage = assemble_context([{"document": run_on, "provision": "Section 5"},
+                                    {"document": "Section 6. Records are kept for five years."}],
+                                   ["How long are records kept?"], budget=400, passage_budget=100)
+    assert usage["passages"] == 2 and 0 < usage["context_tokens"] <= 400
+    assert "the licensee shall maintain record 0" in text and text.count("…") == 1
+    assert "Records are kept for five years." in text
+    print("assemble_context dedup/trim/budget/run-on test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,288 @@
+"""Server-side state of multi-turn conversations, keyed by the client's conversation id.
+
+A conversation keeps its last ``recent_turns`` turns verbatim and a rolling
+summary of everything older, so a follow-up is translated from the summary, those
+turns and the new question instead of the whole history. Each turn records the
+question, its translated queries, the ids of the contexts it retrieved and an
+excerpt of the answer. Once ``summary_batch`` turns have fallen out of the verbatim
+window they are folded into the summary in the background by
+``summarize(summary, turns)``, which sees only the old summary and those turns, so
+every LLM call stays the same size however long the conversation gets.
+
+Conversations live in an in-memory LRU, optionally in front of a SQLite table at
+``path`` (opt-in, since turns hold clients' questions and answer excerpts);
+``ttl_seconds`` expires idle ones and ``max_disk_entries`` evicts the least
+recently used rows from disk.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from answer_cache import normalize_query
+
+DEFAULT_RECENT_TURNS = 4
+DEFAULT_SUMMARY_BATCH = 4
+DEFAULT_MEMORY_ENTRIES = 1000
+DEFAULT_DISK_ENTRIES = 100_000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+# Characters of each answer kept for the summary; the start of an answer carries its conclusion.
+ANSWER_EXCERPT_CHARS = 400
+# Turns kept verbatim at most while summaries keep failing; older ones are dropped.
+MAX_UNSUMMARIZED_TURNS = 16
+
+Summarize = Callable[[str, List[dict]], str]
+
+
+def conversation_store_from_env(summarize: Summarize | None = None) -> "ConversationStore | None":
+    if os.getenv("CONVERSATIONS", "on").lower() in ("off", "0", "false"):
+        return None
+    path = os.getenv("CONVERSATION_STORE_PATH", "memory")
+    return ConversationStore(
+        path=None if path.lower() in ("off", "memory", "") else path,
+        recent_turns=int(os.getenv("CONVERSATION_RECENT_TURNS", str(DEFAULT_RECENT_TURNS))),
+        summary_batch=int(os.getenv("CONVERSATION_SUMMARY_BATCH", str(DEFAULT_SUMMARY_BATCH))),
+        ttl_seconds=float(os.getenv("CONVERSATION_TTL_SECONDS", str(DEFAULT_TTL_SECONDS))),
+        summarize=summarize,
+    )
+
+
+def new_conversation() -> dict:
+    return {"summary": "", "summarized_turns": 0, "turns": []}
+
+
+class ConversationStore:
+    def __init__(self, path: str | Path | None = None, recent_turns: int = DEFAULT_RECENT_TURNS,
+                 summary_batch: int = DEFAULT_SUMMARY_BATCH, max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 max_disk_entries: int = DEFAULT_DISK_ENTRIES, ttl_seconds: float | None = DEFAULT_TTL_SECONDS,
+                 summarize: Summarize | None = None):
+        self.recent_turns = recent_turns
+        self.summary_batch = max(1, summary_batch)
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.summarize = summarize
+        # id -> (last update, state)
+        self._memory: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Conversations with a summary call in flight; their turns are folded one batch at a time.
+        self._folding: set = set()
+        self._idle = threading.Condition(self._lock)
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="conversation-summary")
+        self.counters = {"turns": 0, "summaries": 0, "summary_failures": 0, "dropped_turns": 0,
+                         "translation_reuses": 0, "evictions": 0}
+
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated)")
+            self._db.commit()
+
+    def _expired(self, updated: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - updated > self.ttl_seconds
+
+    def _remember(self, conversation_id: str, updated: float, state: dict) -> None:
+        self._memory[conversation_id] = (updated, state)
+        self._memory.move_to_end(conversation_id)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, conversation_id: str, now: float) -> Optional[dict]:
+        """The live state of a conversation, from memory or disk; callers hold the lock."""
+        entry = self._memory.get(conversation_id)
+        if entry is not None and not self._expired(entry[0], now):
+            self._memory.move_to_end(conversation_id)
+            return entry[1]
+        self._memory.pop(conversation_id, None)
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT state, updated FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[1], now):
+            self._db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            self._db.commit()
+            return None
+        state = json.loads(row[0])
+        self._remember(conversation_id, row[1], state)
+        return state
+
+    def _save(self, conversation_id: str, state: dict) -> None:
+        now = time.time()
+        self._remember(conversation_id, now, state)
+        if self._db is None:
+            return
+        self._db.execute("INSERT OR REPLACE INTO conversations (id, state, updated) VALUES (?, ?, ?)",
+                         (conversation_id, json.dumps(state, ensure_ascii=False), now))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM conversations").fetchone()
+        if count > self.max_disk_entries:
+            excess = count - self.max_disk_entries
+            self._db.execute(
+                "DELETE FROM conversations WHERE id IN (SELECT id FROM conversations ORDER BY updated LIMIT ?)", (excess,)
+            )
+            self.counters["evictions"] += excess
+        self._db.commit()
+
+    def get(self, conversation_id: str) -> Optional[dict]:
+        with self._lock:
+            state = self._load(conversation_id, time.time())
+            return json.loads(json.dumps(state)) if state is not None else None
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            found = self._memory.pop(conversation_id, None) is not None
+            if self._db is not None:
+                found = self._db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount > 0 or found
+                self._db.commit()
+            return found
+
+    def history(self, conversation_id: str, question: str, seed: List[str] = ()) -> List[str]:
+        """What ``translate_query`` needs for ``question``: the summary, the unsummarized questions, the question.
+
+        A conversation the store does not know (new, expired or evicted) starts from
+        ``seed``, the earlier questions if the client sent them.
+        """
+        with self._lock:
+            state = self._load(conversation_id, time.time())
+            if state is None:
+                return [*seed, question]
+            history = [f"(Summary of the earlier conversation: {state['summary']})"] if state["summary"] else []
+            return history + [turn["question"] for turn in state["turns"]] + [question]
+
+    def cached_translation(self, conversation_id: str, question: str) -> Optional[str]:
+        """The translated queries of an unsummarized turn that asked the same question, if any."""
+        key = normalize_query(question)
+        with self._lock:
+            state = self._load(conversation_id, time.time())
+            for turn in reversed(state["turns"] if state is not None else []):
+                if turn.get("translated") and normalize_query(turn["question"]) == key:
+                    self.counters["translation_reuses"] += 1
+                    return turn["translated"]
+        return None
+
+    def record_turn(self, conversation_id: str, question: str, translated: str | None, context_ids: List[str],
+                    answer: str, seed: List[str] = ()) -> None:
+        turn = {"question": question, "translated": translated, "context_ids": list(context_ids),
+                "answer": answer[:ANSWER_EXCERPT_CHARS], "time": time.time()}
+        with self._lock:
+            state = self._load(conversation_id, time.time())
+            if state is None:
+                state = new_conversation()
+                state["turns"] = [{"question": q, "translated": None, "context_ids": [], "answer": ""} for q in seed]
+            state["turns"].append(turn)
+            self.counters["turns"] += 1
+            overflow = len(state["turns"]) - MAX_UNSUMMARIZED_TURNS
+            if overflow > 0:
+                del state["turns"][:overflow]
+                state["summarized_turns"] += overflow
+                self.counters["dropped_turns"] += overflow
+            self._save(conversation_id, state)
+            self._schedule_fold(conversation_id, state)
+
+    def _schedule_fold(self, conversation_id: str, state: dict) -> None:
+        """Summarize the turns older than the verbatim window in the background; callers hold the lock."""
+        count = len(state["turns"]) - self.recent_turns
+        if self.summarize is None or count < self.summary_batch or conversation_id in self._folding:
+            return
+        self._folding.add(conversation_id)
+        self._pool.submit(self._fold, conversation_id, state["summary"], state["turns"][:count])
+
+    def _fold(self, conversation_id: str, summary: str, turns: List[dict]) -> None:
+        try:
+            new_summary = self.summarize(summary, turns).strip()
+        except Exception as e:
+            new_summary = None
+            logging.warning("Summarizing conversation %s failed, keeping its turns verbatim: %s", conversation_id, e)
+        with self._lock:
+            self._folding.discard(conversation_id)
+            state = self._load(conversation_id, time.time())
+            if new_summary is None:
+                self.counters["summary_failures"] += 1
+            # Turns only ever leave from the front, so the folded ones are still first unless the
+            # conversation was dropped or cut back meanwhile.
+            elif state is not None and state["turns"][:len(turns)] == turns:
+                state["summary"] = new_summary
+                del state["turns"][:len(turns)]
+                state["summarized_turns"] += len(turns)
+                self.counters["summaries"] += 1
+                self._save(conversation_id, state)
+                self._schedule_fold(conversation_id, state)
+            self._idle.notify_all()
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """Block until no summary is being written; for tests and benchmarks."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._folding, timeout)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["summaries_in_flight"] = len(self._folding)
+        return stats
+
+
+def test():
+    import tempfile
+
+    def summarize(summary: str, turns: List[dict]) -> str:
+        return " ".join(filter(None, [summary, *(turn["question"].split()[-1] for turn in turns)]))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "conversations.sqlite3"
+        store = ConversationStore(path, recent_turns=2, summary_batch=1, max_memory_entries=1, summarize=summarize)
+        assert store.history("c1", "Q0 about vat", seed=["earlier"]) == ["earlier", "Q0 about vat"]
+        for i in range(6):
+            store.record_turn("c1", f"Q{i} about topic{i}", f'{{"en": ["q{i}"]}}', [f"ctx{i}"], "A" * 1000)
+            assert store.wait_idle(5)
+        state = store.get("c1")
+        assert state["summary"] == "topic0 topic1 topic2 topic3" and state["summarized_turns"] == 4
+        assert [t["question"] for t in state["turns"]] == ["Q4 about topic4", "Q5 about topic5"]
+        assert len(state["turns"][0]["answer"]) == ANSWER_EXCERPT_CHARS and state["turns"][0]["context_ids"] == ["ctx4"]
+        assert store.history("c1", "Q6") == ["(Summary of the earlier conversation: topic0 topic1 topic2 topic3)",
+                                             "Q4 about topic4", "Q5 about topic5", "Q6"]
+        assert store.cached_translation("c1", " q5 ABOUT topic5 ") == '{"en": ["q5"]}'
+        assert store.cached_translation("c1", "Q0 about topic0") is None
+
+        # c2 pushes c1 out of the 1-entry LRU; it comes back from disk, and survives a restart.
+        store.record_turn("c2", "Other", None, [], "")
+        assert store.get("c1")["summary"] == state["summary"]
+        reopened = ConversationStore(path, recent_turns=2)
+        assert reopened.get("c1") == state and reopened.delete("c1") and reopened.get("c1") is None
+
+        def failing(summary: str, turns: List[dict]) -> str:
+            raise RuntimeError("quota")
+
+        batched = ConversationStore(None, recent_turns=2, summary_batch=3, summarize=summarize)
+        for i in range(7):
+            batched.record_turn("c", f"Q{i} about topic{i}", None, [], "")
+            assert batched.wait_idle(5)
+        assert batched.get("c")["summary"] == "topic0 topic1 topic2" and len(batched.get("c")["turns"]) == 4
+        assert batched.counters["summaries"] == 1
+
+        flaky = ConversationStore(None, recent_turns=1, summary_batch=1, summarize=failing)
+        for i in range(MAX_UNSUMMARIZED_TURNS + 3):
+            flaky.record_turn("c", f"Q{i}", None, [], "")
+            assert flaky.wait_idle(5)
+        assert len(flaky.get("c")["turns"]) == MAX_UNSUMMARIZED_TURNS and flaky.counters["summary_failures"] > 0
+
+        expiring = ConversationStore(None, ttl_seconds=0)
+        expiring.record_turn("c", "Q", None, [], "")
+        time.sleep(0.01)
+        assert expiring.get("c") is None
+    print("Conversation store window/summary/LRU/disk/TTL test passed.")
+
+
+if __name__ == "__main__":
+    test()
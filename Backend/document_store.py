@@ -0,0 +1,200 @@
+"""Chunk texts stored once, compressed, outside the vector metadata.
+
+Vector metadata only carries what search needs (provision, pages, heading); the
+text of a chunk is read from here for the few contexts that reach the prompt.
+Each text is an lz4 block (zlib when ``lz4`` is not installed) appended to a
+data file; ``documents.json`` maps an id to its offset and length, so a lookup is
+one seek and read per chunk. Replaced and deleted texts leave dead bytes behind
+until they make up ``COMPACT_DEAD_FRACTION`` of the file, and compaction then
+copies the live texts to a new data file.
+"""
+import importlib.util
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, List
+
+from local_vector_index import COMPACT_DEAD_FRACTION, _atomic_write_json
+
+DEFAULT_DOCUMENT_STORE_DIR = "./document_store"
+INDEX_FILE = "documents.json"
+
+
+def document_store_from_env() -> "DocumentStore | None":
+    if os.getenv("DOCUMENT_STORE", "on").lower() in ("off", "0", "false"):
+        return None
+    return DocumentStore(os.getenv("DOCUMENT_STORE_DIR", DEFAULT_DOCUMENT_STORE_DIR))
+
+
+def _default_codec() -> str:
+    return "lz4" if importlib.util.find_spec("lz4") is not None else "zlib"
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "lz4":
+        import lz4.block
+
+        return lz4.block.compress(data, store_size=True)
+    return zlib.compress(data, 6)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "lz4":
+        import lz4.block
+
+        return lz4.block.decompress(data)
+    return zlib.decompress(data)
+
+
+class DocumentStore:
+    def __init__(self, root: str | Path = DEFAULT_DOCUMENT_STORE_DIR, codec: str | None = None):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._file = None
+        self._load(codec)
+
+    def _load(self, codec: str | None = None) -> None:
+        index_path = self.root / INDEX_FILE
+        state = json.loads(index_path.read_text(encoding="utf-8")) if index_path.exists() else {}
+        self.codec = state.get("codec") or codec or _default_codec()
+        # id -> [offset, compressed length, raw length]
+        self.entries: Dict[str, List[int]] = state.get("entries", {})
+        self.dead_bytes = state.get("dead_bytes", 0)
+        self.generation = state.get("generation", 0)
+        self._index_mtime = index_path.stat().st_mtime_ns if index_path.exists() else None
+        self._open()
+
+    def _open(self, create: bool = False) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        # Nothing is created on disk until the first text is stored.
+        if create or self.data_path.exists():
+            # Append mode: every write lands at the end whatever was last read.
+            self._file = open(self.data_path, "a+b")
+
+    @property
+    def data_path(self) -> Path:
+        return self.root / f"documents-{self.generation}.bin"
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _save(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        _atomic_write_json(self.root / INDEX_FILE,
+                           {"codec": self.codec, "generation": self.generation, "entries": self.entries,
+                            "dead_bytes": self.dead_bytes})
+        self._index_mtime = (self.root / INDEX_FILE).stat().st_mtime_ns
+
+    def put_many(self, ids: List[str], texts: List[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            if self._file is None:
+                self.root.mkdir(parents=True, exist_ok=True)
+                self._open(create=True)
+            offset = self._file.seek(0, os.SEEK_END)
+            blocks = []
+            for id_, text in zip(ids, texts):
+                raw = (text or "").encode("utf-8")
+                block = _compress(self.codec, raw)
+                if id_ in self.entries:
+                    self.dead_bytes += self.entries[id_][1]
+                self.entries[id_] = [offset, len(block), len(raw)]
+                offset += len(block)
+                blocks.append(block)
+            self._file.write(b"".join(blocks))
+            self._save()
+            self._maybe_compact()
+
+    def get_many(self, ids: List[str]) -> Dict[str, str]:
+        """Texts of the stored ids among ``ids``; unknown ids are left out."""
+        with self._lock:
+            if any(id_ not in self.entries for id_ in ids):
+                self._reload_if_changed()
+            found = {}
+            for id_ in dict.fromkeys(ids):
+                entry = self.entries.get(id_)
+                if entry is not None:
+                    found[id_] = _decompress(self.codec, self._read(entry)).decode("utf-8")
+            return found
+
+    def _read(self, entry: List[int]) -> bytes:
+        self._file.seek(entry[0])
+        return self._file.read(entry[1])
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            removed = [self.entries.pop(id_) for id_ in ids if id_ in self.entries]
+            if not removed:
+                return
+            self.dead_bytes += sum(entry[1] for entry in removed)
+            self._save()
+            self._maybe_compact()
+
+    def _reload_if_changed(self) -> None:
+        """Pick up texts another process (e.g. an ingestion run) has added since we loaded."""
+        index_path = self.root / INDEX_FILE
+        if index_path.exists() and index_path.stat().st_mtime_ns != self._index_mtime:
+            self._load()
+
+    def _maybe_compact(self) -> None:
+        size = self._file.seek(0, os.SEEK_END)
+        if not size or self.dead_bytes < COMPACT_DEAD_FRACTION * size:
+            return
+        old_path = self.data_path
+        entries, offset = {}, 0
+        with open(self.root / f"documents-{self.generation + 1}.bin", "wb") as fh:
+            for id_, (start, length, raw_length) in self.entries.items():
+                fh.write(self._read([start, length]))
+                entries[id_] = [offset, length, raw_length]
+                offset += length
+            fh.flush()
+            os.fsync(fh.fileno())
+        # The index switches to the new file atomically; until then the old pair stays valid.
+        self.entries, self.dead_bytes = entries, 0
+        self.generation += 1
+        self._open(create=True)
+        self._save()
+        old_path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stored = sum(entry[1] for entry in self.entries.values())
+            raw = sum(entry[2] for entry in self.entries.values())
+            return {"documents": len(self.entries), "stored_bytes": stored, "raw_bytes": raw,
+                    "dead_bytes": self.dead_bytes, "compression_ratio": raw / stored if stored else 0.0}
+
+
+def test():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        assert DocumentStore(Path(tmp) / "unused").get_many(["c1"]) == {} and not (Path(tmp) / "unused").exists()
+        store = DocumentStore(tmp)
+        texts = {f"c{i}": f"Section {i}. The fee for item {i} is Rs. {i * 100}. " * 20 for i in range(50)}
+        store.put_many(list(texts), list(texts.values()))
+        assert store.get_many(["c3", "missing", "c7"]) == {"c3": texts["c3"], "c7": texts["c7"]}
+        assert store.stats()["compression_ratio"] > 2
+
+        other = DocumentStore(tmp)
+        store.put_many(["new"], ["कर दर तेह्र प्रतिशत हुनेछ।"])
+        assert other.get_many(["new"]) == {"new": "कर दर तेह्र प्रतिशत हुनेछ।"}
+
+        size = os.path.getsize(store.data_path)
+        store.put_many(["c1"], ["replaced"])
+        store.delete([f"c{i}" for i in range(10, 50)])
+        assert os.path.getsize(store.data_path) < size and store.dead_bytes == 0
+        assert [p.name for p in Path(tmp).glob("*.bin")] == [store.data_path.name]
+        reopened = DocumentStore(tmp)
+        assert reopened.get_many(["c1", "c2", "c20", "new"]) == {"c1": "replaced", "c2": texts["c2"],
+                                                               "new": "कर दर तेह्र प्रतिशत हुनेछ।"}
+    print("Document store put/get/delete/compact test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,165 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = "./cache/embeddings.sqlite3"
+DEFAULT_MEMORY_ENTRIES = 4096
+DEFAULT_DISK_ENTRIES = 200_000
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache: an in-memory LRU in front of a SQLite table.
+
+    Keys are ``sha256(model name + normalized text)`` so a model change never serves
+    stale vectors. ``ttl_seconds`` expires entries by age and ``max_disk_entries``
+    evicts the least recently used rows from disk; ``path=None`` keeps memory only.
+    """
+
+    def __init__(self, path: str | Path | None = DEFAULT_CACHE_PATH, max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 max_disk_entries: int = DEFAULT_DISK_ENTRIES, ttl_seconds: float | None = None):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)")
+            self._db.commit()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    def _remember(self, key: str, created: float, vector: np.ndarray) -> None:
+        self._memory[key] = (created, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached vectors for ``texts`` in order, ``None`` where the text has not been embedded yet."""
+        now = time.time()
+        keys = [cache_key(model_name, t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        from_disk = set()
+        with self._lock:
+            disk_keys = []
+            for key in dict.fromkeys(keys):
+                entry = self._memory.get(key)
+                if entry is not None and not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    self._memory.pop(key, None)
+                    disk_keys.append(key)
+
+            if disk_keys and self._db is not None:
+                placeholders = ",".join("?" * len(disk_keys))
+                rows = self._db.execute(
+                    f"SELECT key, vector, created FROM embeddings WHERE key IN ({placeholders})", disk_keys
+                ).fetchall()
+                expired = []
+                for key, blob, created in rows:
+                    if self._expired(created, now):
+                        expired.append(key)
+                        continue
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector
+                    from_disk.add(key)
+                    self._remember(key, created, vector)
+                if expired:
+                    self._db.executemany("DELETE FROM embeddings WHERE key = ?", [(k,) for k in expired])
+                if from_disk:
+                    self._db.executemany("UPDATE embeddings SET accessed = ? WHERE key = ?", [(now, k) for k in from_disk])
+                self._db.commit()
+
+            results: List[Optional[List[float]]] = []
+            for key in keys:
+                vector = found.get(key)
+                if vector is None:
+                    self.counters["misses"] += 1
+                    results.append(None)
+                else:
+                    self.counters["disk_hits" if key in from_disk else "memory_hits"] += 1
+                    results.append(vector.tolist())
+        return results
+
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]) -> None:
+        now = time.time()
+        entries = [(cache_key(model_name, t), np.asarray(v, dtype=np.float32)) for t, v in zip(texts, vectors)]
+        with self._lock:
+            for key, vector in entries:
+                self._remember(key, now, vector)
+            if self._db is None:
+                return
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created, accessed) VALUES (?, ?, ?, ?)",
+                [(key, vector.tobytes(), now, now) for key, vector in entries],
+            )
+            (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_disk_entries:
+                excess = count - self.max_disk_entries
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY accessed LIMIT ?)", (excess,)
+                )
+                self.counters["evictions"] += excess
+            self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self.counters)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+        return stats
+
+
+def test():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "embeddings.sqlite3"
+        cache = EmbeddingCache(path, max_memory_entries=2)
+        assert cache.get_many("m", ["What is the voting age?"]) == [None]
+        cache.put_many("m", ["What is the voting age?", "b", "c"], [[1.0, 0.0], [0.0, 1.0], [0.5, 0.5]])
+
+        # Whitespace differences hit the same entry; the first key fell out of the 2-entry LRU.
+        assert cache.get_many("m", ["  What is the   voting age? "]) == [[1.0, 0.0]]
+        assert cache.counters["disk_hits"] == 1
+        assert cache.get_many("other-model", ["b"]) == [None]
+
+        reopened = EmbeddingCache(path, ttl_seconds=3600)
+        assert reopened.get_many("m", ["c", "b"]) == [[0.5, 0.5], [0.0, 1.0]]
+        assert reopened.stats()["hit_rate"] == 1.0
+    print("EmbeddingCache LRU/disk/TTL test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -1,14 +1,62 @@
+import asyncio
 import os
 
 from dotenv import load_dotenv
-from google import genai
 from google.genai.types import Content, Part, ContentEmbedding, File, ContentDict
 
+import clients
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_PATH
+from local_embedder import DEFAULT_LOCAL_EMBEDDING_MODEL, local_embedder_from_env
+from metrics import embedded_texts, span
+from resilience import DEFAULT_RETRIES, CallPolicy
+
+DEFAULT_EMBEDDING_BACKEND = "gemini"  # or "local" for a sentence-transformers model on CPU
+DEFAULT_EMBEDDING_DEADLINE_SECONDS = 10.0
+
+
+def _cache_from_env() -> EmbeddingCache | None:
+    if os.getenv("EMBEDDING_CACHE", "on").lower() in ("off", "0", "false"):
+        return None
+    ttl = os.getenv("EMBEDDING_CACHE_TTL_SECONDS")
+    return EmbeddingCache(
+        path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+        ttl_seconds=float(ttl) if ttl else None,
+    )
+
 
 class EmbeddingEngineWrapper:
-    def __init__(self, model_name="text-embedding-004"):
-        self.model_name = model_name
-        self.client = genai.Client(api_key=os.getenv("GEMINI_KEY"))
+    def __init__(self, model_name="text-embedding-004", cache: EmbeddingCache | bool | None = None,
+                 backend: str | None = None):
+        self.backend = backend or os.getenv("EMBEDDING_BACKEND", DEFAULT_EMBEDDING_BACKEND)
+        if self.backend == "local":
+            self.model_name = os.getenv("LOCAL_EMBEDDING_MODEL", DEFAULT_LOCAL_EMBEDDING_MODEL)
+        elif self.backend == "gemini":
+            self.model_name = model_name
+            # Query embeddings are on the request path; a stuck call should fail fast and retry.
+            self.policy = CallPolicy(
+                model_name,
+                deadline=float(os.getenv("EMBEDDING_DEADLINE_SECONDS", DEFAULT_EMBEDDING_DEADLINE_SECONDS)),
+                retries=int(os.getenv("LLM_RETRIES", DEFAULT_RETRIES)),
+            )
+        else:
+            raise ValueError(f"Unknown embedding backend {self.backend}")
+        # None: configure from the environment; False: no caching.
+        self.cache = _cache_from_env() if cache is None else (cache or None)
+
+    @property
+    def client(self):
+        return clients.gemini_client()
+
+    @property
+    def local(self):
+        """The shared local model, loaded on first use; None for the Gemini backend."""
+        return clients.shared("local-embedder", local_embedder_from_env) if self.backend == "local" else None
+
+    def warm_up(self) -> None:
+        if self.backend == "local":
+            self.local.embed(["warm-up"])
+        else:
+            self.client.models.get(model=self.model_name)
 
     def embed(self, messages:  list[Content | list[File | Part | None | str] | File | Part | None | str]
                                | Content
@@ -19,8 +67,73 @@ class EmbeddingEngineWrapper:
                                | str
                                | list[Content | list[File | Part | None | str] | File | Part | None | str | ContentDict]
                                | ContentDict) -> list[ContentEmbedding] | None:
-        response = self.client.models.embed_content(model=self.model_name, contents=messages)
-        return response.embeddings
+        texts = self._cacheable_texts(messages)
+        if texts is None:
+            return self._embed_uncached(messages)
+
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            # Only the texts we have never seen go to the API, deduplicated.
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            embeddings = self._embed_uncached(unique)
+            if embeddings is None or len(embeddings) != len(unique):
+                return embeddings
+            self._fill_misses(texts, vectors, missing, unique, embeddings)
+        return [ContentEmbedding(values=v) for v in vectors]
+
+    async def aembed(self, messages: Content | str | list[Content | str]) -> list[ContentEmbedding] | None:
+        texts = self._cacheable_texts(messages)
+        if texts is None:
+            return await self._aembed_uncached(messages)
+
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            embeddings = await self._aembed_uncached(unique)
+            if embeddings is None or len(embeddings) != len(unique):
+                return embeddings
+            self._fill_misses(texts, vectors, missing, unique, embeddings)
+        return [ContentEmbedding(values=v) for v in vectors]
+
+    def _embed_uncached(self, messages) -> list[ContentEmbedding] | None:
+        embedded_texts.inc(len(messages) if isinstance(messages, list) else 1, backend=self.backend)
+        with span("embedding", backend=self.backend):
+            if self.local is not None:
+                return [ContentEmbedding(values=v) for v in self.local.embed(self._local_texts(messages))]
+            return self.policy.call(
+                lambda: self.client.models.embed_content(model=self.model_name, contents=messages).embeddings)
+
+    async def _aembed_uncached(self, messages) -> list[ContentEmbedding] | None:
+        embedded_texts.inc(len(messages) if isinstance(messages, list) else 1, backend=self.backend)
+        with span("embedding", backend=self.backend):
+            if self.local is not None:
+                # Joins the same batches as the server threads without blocking the event loop.
+                vectors = await asyncio.wrap_future(self.local.submit(self._local_texts(messages)))
+                return [ContentEmbedding(values=v) for v in vectors]
+            response = await self.policy.acall(
+                lambda: self.client.aio.models.embed_content(model=self.model_name, contents=messages))
+            return response.embeddings
+
+    @staticmethod
+    def _local_texts(messages) -> list[str]:
+        texts = [messages] if isinstance(messages, str) else messages
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            raise ValueError("The local embedding backend only embeds plain text")
+        return texts
+
+    def _cacheable_texts(self, messages) -> list[str] | None:
+        texts = [messages] if isinstance(messages, str) else messages
+        if self.cache is None or not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return None
+        return texts
+
+    def _fill_misses(self, texts, vectors, missing, unique, embeddings) -> None:
+        self.cache.put_many(self.model_name, unique, [e.values for e in embeddings])
+        fresh = dict(zip(unique, embeddings))
+        for i in missing:
+            vectors[i] = fresh[texts[i]].values
 
 
 def test():
@@ -0,0 +1,341 @@
+"""Retrieval-quality, answer-quality and latency evaluation of the live pipeline.
+
+    python evaluate.py --workers 8
+    python evaluate.py --languages en,ro --k 10 --compare eval_results/eval-<commit>.json
+
+Every question in ``evaluation_set.jsonl`` (English, Nepali and Romanized Nepali)
+goes through the server's own path: ``route_query`` / ``translate_query``,
+``retrieve`` and ``prepare_answer_prompt``, then the answer model. Questions run in
+parallel, each under its own ``RequestTrace``, so per-question stage timings come
+from the same spans as ``/metrics``.
+
+Retrieval is scored against each question's ``relevant`` provisions. Each entry is
+a phrase, or a list of alternative phrases (English and Nepali headings), matched
+case-insensitively against a passage's provision and text. recall@k is the share
+of relevant provisions found in the top k passages and MRR uses the first passage
+that matches any of them. Answers are scored against the reference like
+``Evaluation_Metrics.ipynb``: BLEU, embedding cosine similarity and the share at or
+above the notebook's 0.79 threshold, plus token-level F1. The cosine scores are
+computed in batches.
+
+Translate and answer outputs are cached in ``EVAL_CACHE_PATH`` (default
+``./cache/eval_outputs.sqlite3``), keyed by model and prompt. A rerun then differs
+only where retrieval changed the prompt. Cached stages take no time, so compare
+latencies with ``--refresh``, which calls the models again and overwrites the cache.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+from nltk.translate.bleu_score import SmoothingFunction, sentence_bleu
+
+import metrics
+import rag_server
+from query_router import ROUTE_DIRECT, ROUTE_FULL, direct_translation, route_query
+
+DEFAULT_DATASET = "evaluation_set.jsonl"
+DEFAULT_CACHE_PATH = "./cache/eval_outputs.sqlite3"
+# Cosine similarity at which the notebooks counted an answer as matching its reference.
+SEMANTIC_THRESHOLD = 0.79
+# Gemini embeds at most 100 texts per request.
+EMBED_BATCH = 100
+PERCENTILES = (50, 95)
+COMPARED = ("mrr", "bleu", "cosine", "semantic_match", "f1", "total_p50_s", "total_p95_s",
+            "time_to_first_token_p50_s")
+
+_WORD = re.compile(r"\w+")
+
+
+def load_questions(path: str | Path, languages: List[str] | None = None) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return [item for item in items if not languages or item["language"] in languages]
+
+
+class OutputCache:
+    """Model outputs on disk, keyed by ``sha256(model name + prompt)``."""
+
+    def __init__(self, path: str | Path = DEFAULT_CACHE_PATH, refresh: bool = False):
+        self.refresh = refresh
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS outputs (key TEXT PRIMARY KEY, output TEXT NOT NULL, "
+                         "created REAL NOT NULL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model_name: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        if self.refresh:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT output FROM outputs WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, output: str) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO outputs (key, output, created) VALUES (?, ?, ?)",
+                             (key, output, time.time()))
+            self._db.commit()
+
+
+class CachedLLM:
+    """An ``LLMWrapper`` whose outputs are served from an ``OutputCache`` when present.
+
+    ``hits`` counts cached calls per thread, so a question can report whether its
+    timings include real model calls.
+    """
+
+    def __init__(self, llm, cache: OutputCache):
+        self.llm = llm
+        self.cache = cache
+        self.model_name = llm.model_name
+        self._local = threading.local()
+
+    @property
+    def hits(self) -> int:
+        return getattr(self._local, "hits", 0)
+
+    @hits.setter
+    def hits(self, value: int) -> None:
+        self._local.hits = value
+
+    def generate(self, messages) -> str:
+        key = self.cache.key(self.model_name, str(messages))
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        output = self.llm.generate(messages)
+        self.cache.put(key, output)
+        return output
+
+    def stream_generate(self, messages) -> Iterator[str]:
+        key = self.cache.key(self.model_name, str(messages))
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            yield cached
+            return
+        chunks = []
+        for chunk in self.llm.stream_generate(messages):
+            chunks.append(chunk)
+            yield chunk
+        self.cache.put(key, "".join(chunks))
+
+
+def use_output_cache(cache: OutputCache) -> List[CachedLLM]:
+    """Route rag_server's translate and answer models through ``cache``."""
+    answer = CachedLLM(rag_server.llm, cache)
+    translate = answer if rag_server.translate_llm is rag_server.llm else CachedLLM(rag_server.translate_llm, cache)
+    rag_server.llm, rag_server.translate_llm = answer, translate
+    return [answer] if translate is answer else [answer, translate]
+
+
+def _matches(context: Dict[str, Any], phrases: List[str]) -> bool:
+    text = f"{context.get('provision', '')}\n{context['document']}".lower()
+    return any(phrase.lower() in text for phrase in phrases)
+
+
+def retrieval_scores(contexts: List[Dict[str, Any]], relevant: List[str | List[str]], ks: List[int]) -> Dict[str, Any]:
+    """recall@k for each k and the reciprocal rank of the first relevant passage."""
+    if not relevant:
+        return {}
+    groups = [[r] if isinstance(r, str) else r for r in relevant]
+    hits = np.array([[_matches(c, g) for c in contexts] for g in groups], dtype=bool).reshape(len(groups), -1)
+    scores = {f"recall@{k}": float(hits[:, :k].any(axis=1).mean()) for k in ks}
+    relevant_ranks = np.flatnonzero(hits.any(axis=0))
+    scores["rr"] = 1.0 / (relevant_ranks[0] + 1) if relevant_ranks.size else 0.0
+    return scores
+
+
+def token_f1(reference: str, answer: str) -> float:
+    ref, hyp = Counter(_WORD.findall(reference.lower())), Counter(_WORD.findall(answer.lower()))
+    overlap = sum((ref & hyp).values())
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / sum(hyp.values()), overlap / sum(ref.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def _embed_matrix(embedder, texts: List[str]) -> np.ndarray:
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH):
+        embeddings = embedder.embed(texts[start:start + EMBED_BATCH])
+        if not embeddings or len(embeddings) != len(texts[start:start + EMBED_BATCH]):
+            raise ValueError("Embedding failed")
+        vectors += [e.values for e in embeddings]
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def answer_scores(references: List[str], answers: List[str], embedder) -> List[Dict[str, float]]:
+    """BLEU, cosine similarity and token F1 of each answer against its reference."""
+    if not answers:
+        return []
+    matrix = _embed_matrix(embedder, references + answers)
+    cosine = np.einsum("ij,ij->i", matrix[:len(references)], matrix[len(references):])
+    smoothing = SmoothingFunction().method1
+    return [{
+        "bleu": sentence_bleu([ref.split()], hyp.split(), smoothing_function=smoothing),
+        "cosine": float(cos),
+        "semantic_match": float(cos >= SEMANTIC_THRESHOLD),
+        "f1": token_f1(ref, hyp),
+    } for ref, hyp, cos in zip(references, answers, cosine)]
+
+
+def run_question(item: Dict[str, Any], k: int, cached_llms: List[CachedLLM]) -> Dict[str, Any]:
+    question = item["question"]
+    for cached_llm in cached_llms:
+        cached_llm.hits = 0
+    trace = metrics.start_trace()
+    route = trace.route = route_query([question]) if rag_server.query_routing else ROUTE_FULL
+    result = {"id": item["id"], "language": item["language"], "route": route}
+    try:
+        if route == ROUTE_DIRECT:
+            translated = direct_translation(question)
+        else:
+            with metrics.span("translate"):
+                translated = rag_server.translate_query([question])
+        with metrics.span("retrieve"):
+            contexts = rag_server.retrieve(translated, k=k, question=question)
+        with metrics.span("prompt"):
+            prompt, usage = rag_server.prepare_answer_prompt(question, translated, contexts)
+        chunks = []
+        with metrics.span("generate"):
+            for chunk in rag_server.llm.stream_generate(prompt):
+                if not chunks:
+                    trace.first_token()
+                chunks.append(chunk)
+        result.update({
+            "answer": "".join(chunks),
+            "queries": rag_server.parse_translated_queries(translated),
+            "contexts": [{"id": c["id"], "provision": c.get("provision")} for c in contexts],
+            "prompt_tokens": usage["prompt_tokens"],
+            "ok": True,
+        })
+        result.update(retrieval_scores(contexts, item.get("relevant", []), sorted({1, 3, k})))
+    except Exception as e:
+        logging.exception("Evaluating %s failed", item["id"])
+        result.update({"ok": False, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        metrics.end_trace()
+    result["timings"] = trace.timings()
+    result["cached_outputs"] = sum(cached_llm.hits for cached_llm in cached_llms)
+    return result
+
+
+def _percentiles(values: List[float], name: str) -> Dict[str, float | None]:
+    if not values:
+        return {f"{name}_p{p}_s": None for p in PERCENTILES}
+    return {f"{name}_p{p}_s": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    ok = [r for r in results if r["ok"]]
+    summary: Dict[str, Any] = {"questions": len(results), "failed": len(results) - len(ok)}
+    score_keys = sorted({key for r in ok for key in r if key.startswith("recall@")})
+    score_keys += ["rr", "bleu", "cosine", "semantic_match", "f1"]
+    for key in score_keys:
+        values = [r[key] for r in ok if key in r]
+        summary["mrr" if key == "rr" else key] = float(np.mean(values)) if values else None
+    for stage in ("total", "time_to_first_token", "translate", "retrieve", "generate"):
+        summary.update(_percentiles([r["timings"][stage] for r in ok if stage in r["timings"]], stage))
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\nChange versus {baseline['commit']} ({baseline_path}):")
+    for group, summary in current["summary"].items():
+        old_summary = baseline["summary"].get(group, {})
+        for key, new in summary.items():
+            old = old_summary.get(key)
+            if key not in COMPARED and not key.startswith("recall@") or old is None or new is None:
+                continue
+            print(f"  {group:<4} {key:<28} {old:>8.3f} -> {new:>8.3f} ({new - old:+.3f})")
+
+
+def fmt(value: float | None) -> str:
+    return f"{value:.3f}" if value is not None else "-"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="JSONL question/reference set")
+    parser.add_argument("--languages", help="comma-separated subset of en,ne,ro (default all)")
+    parser.add_argument("--k", type=int, default=5, help="passages retrieved per question")
+    parser.add_argument("--workers", type=int, default=8, help="questions evaluated in parallel")
+    parser.add_argument("--cache", default=os.getenv("EVAL_CACHE_PATH", DEFAULT_CACHE_PATH))
+    parser.add_argument("--refresh", action="store_true", help="call the models again and overwrite cached outputs")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write cached outputs")
+    parser.add_argument("--output", help="JSON results path (default eval_results/eval-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to print changes against")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    items = load_questions(args.dataset, args.languages.split(",") if args.languages else None)
+    cached_llms = [] if args.no_cache else use_output_cache(OutputCache(args.cache, refresh=args.refresh))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(lambda item: run_question(item, args.k, cached_llms), items))
+    wall = time.perf_counter() - started
+
+    answered = [(item, r) for item, r in zip(items, results) if r["ok"]]
+    for (_, r), scores in zip(answered, answer_scores([item["reference"] for item, _ in answered],
+                                                      [r["answer"] for _, r in answered], rag_server.embedder)):
+        r.update(scores)
+
+    summary = {"all": summarize(results)}
+    for language in sorted({item["language"] for item in items}):
+        summary[language] = summarize([r for r in results if r["language"] == language])
+
+    print(f"{'set':<4} {'n':>3} {'fail':>4} {f'R@{args.k}':>6} {'MRR':>6} {'BLEU':>6} {'cos':>6} {'match':>6} "
+          f"{'F1':>6} {'p50 s':>6} {'p95 s':>6} {'ttft p50':>8}")
+    for group, s in summary.items():
+        print(f"{group:<4} {s['questions']:>3} {s['failed']:>4} {fmt(s.get(f'recall@{args.k}')):>6} "
+              f"{fmt(s['mrr']):>6} {fmt(s['bleu']):>6} {fmt(s['cosine']):>6} {fmt(s['semantic_match']):>6} "
+              f"{fmt(s['f1']):>6} {fmt(s['total_p50_s']):>6} {fmt(s['total_p95_s']):>6} "
+              f"{fmt(s['time_to_first_token_p50_s']):>8}")
+    cached = sum(1 for r in results if r["cached_outputs"])
+    if cached:
+        print(f"\n{cached} of {len(results)} questions used cached model outputs; run with --refresh to time them.")
+
+    output = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "python": sys.version.split()[0], "config": vars(args), "wall_s": wall, "summary": summary,
+              "questions": results}
+    path = Path(args.output or f"eval_results/eval-{output['commit']}.json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(output, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nWrote {path}")
+    if args.compare:
+        compare(output, args.compare)
+
+
+if __name__ == "__main__":
+    main()
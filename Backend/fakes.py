@@ -0,0 +1,276 @@
+"""Deterministic, offline stand-ins for Gemini and Pinecone, for benchmarks and load tests.
+
+They implement the methods the pipeline calls on ``LLMWrapper``,
+``EmbeddingEngineWrapper`` and ``VectorStoreWrapper``, so they can be assigned to
+``rag_server.llm`` / ``embedder`` / ``vector_store`` or passed to
+``markdown_loader.main``. Nothing here needs an API key or the network.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from google.genai.types import ContentEmbedding
+
+DIM = 768
+_WORD = re.compile(r"\w+")
+_QUESTIONS_BLOCK = re.compile(r"Here are the questions:\s*'(.*)'", re.DOTALL)
+_SUMMARY_BLOCK = re.compile(r"Current summary:\n(.*?)\n\nNew exchanges:\n(.*)", re.DOTALL)
+_CLIENT_LINE = re.compile(r"^Client: (.*)$", re.MULTILINE)
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+def hashed_vector(text: str, dim: int = DIM) -> np.ndarray:
+    """Unit vector of hashed word features: identical texts match exactly, overlapping ones score higher."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        seed = _seed(word)
+        vector[seed % dim] += 1.0 if (seed >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if not norm:
+        return np.random.default_rng(_seed(text)).normal(size=dim).astype(np.float32) / np.sqrt(dim)
+    return vector / norm
+
+
+class FakeEmbedder:
+    backend = "fake"
+    model_name = "fake-hashed-embedding"
+    cache = None
+
+    def __init__(self, latency: float = 0.0, dim: int = DIM):
+        self.latency = latency
+        self.dim = dim
+
+    def embed(self, messages):
+        texts = [messages] if isinstance(messages, str) else messages
+        time.sleep(self.latency)
+        return [ContentEmbedding(values=hashed_vector(t, self.dim).tolist()) for t in texts]
+
+    async def aembed(self, messages):
+        texts = [messages] if isinstance(messages, str) else messages
+        await asyncio.sleep(self.latency)
+        return [ContentEmbedding(values=hashed_vector(t, self.dim).tolist()) for t in texts]
+
+
+class FakeLLM:
+    """Answers after fixed delays, like a Gemini call that mostly waits on the network.
+
+    ``generate`` recognises the translate, summarization and conversation summary
+    prompts and returns well-formed output for them; ``stream_generate`` waits
+    ``first_token_delay`` and then yields ``chunks`` chunks ``chunk_delay`` apart.
+    ``prompt_word_delay`` adds time per word of the prompt to both, like prefill.
+    """
+
+    def __init__(self, generate_delay: float = 0.5, first_token_delay: float = 0.0, chunks: int = 40,
+                 chunk_delay: float = 0.05, prompt_word_delay: float = 0.0):
+        self.generate_delay = generate_delay
+        self.first_token_delay = first_token_delay
+        self.prompt_word_delay = prompt_word_delay
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.model_name = "fake-llm"
+        self.calls = {"generate": 0, "stream_generate": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] += 1
+
+    def _prefill(self, messages) -> float:
+        return self.prompt_word_delay * len(str(messages).split()) if self.prompt_word_delay else 0.0
+
+    @staticmethod
+    def translation(question: str) -> dict:
+        return {"en": [question, f"legal provisions about {question}"], "originalQuestion": question}
+
+    @staticmethod
+    def respond(prompt: str) -> str:
+        if '"originalQuestion"' in prompt and "numbered 1 to" in prompt:
+            match = _QUESTIONS_BLOCK.search(prompt)
+            lines = match.group(1).strip().splitlines() if match else []
+            return json.dumps([FakeLLM.translation(re.sub(r"^\d+\.\s*", "", line)) for line in lines],
+                              ensure_ascii=False)
+        if '"originalQuestion"' in prompt:
+            match = _QUESTIONS_BLOCK.search(prompt)
+            question = match.group(1).strip().splitlines()[-1] if match else prompt[-200:]
+            return json.dumps(FakeLLM.translation(question), ensure_ascii=False)
+        if "running summary of a client's conversation" in prompt:
+            match = _SUMMARY_BLOCK.search(prompt)
+            summary, exchanges = match.groups() if match else ("", "")
+            words = ("" if summary.startswith("(none") else summary).split()
+            for question in _CLIENT_LINE.findall(exchanges):
+                words += question.split()
+            return " ".join(words[-120:])
+        if "summarization assistant" in prompt:
+            words = prompt.split("\n\n")[-1].split()[:60]
+            return "• " + " ".join(words)
+        return "Based on the provided legal references, " + " ".join(prompt.split()[:20])
+
+    def generate(self, messages) -> str:
+        self._count("generate")
+        time.sleep(self.generate_delay + self._prefill(messages))
+        return self.respond(str(messages))
+
+    def stream_generate(self, messages):
+        self._count("stream_generate")
+        time.sleep(self.first_token_delay + self._prefill(messages))
+        for i in range(self.chunks):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield f"token{i} "
+
+    async def agenerate(self, messages) -> str:
+        self._count("generate")
+        await asyncio.sleep(self.generate_delay + self._prefill(messages))
+        return self.respond(str(messages))
+
+    async def astream_generate(self, messages):
+        self._count("stream_generate")
+        await asyncio.sleep(self.first_token_delay + self._prefill(messages))
+        for i in range(self.chunks):
+            if i:
+                await asyncio.sleep(self.chunk_delay)
+            yield f"token{i} "
+
+
+class FakeVectorStore:
+    """Exact cosine search over an in-memory matrix, with the ``VectorStoreWrapper`` interface."""
+
+    backend = "memory"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self._matrix: tuple | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def upsert(self, embeddings: List[List[float]], metadatas: List[Dict[str, Any]] | None = None,
+               ids: List[str] | None = None) -> List[str]:
+        ids = ids or [hashlib.md5(np.asarray(e, np.float32).tobytes()).hexdigest() for e in embeddings]
+        metadatas = metadatas or [{} for _ in embeddings]
+        with self._lock:
+            for id_, vector, meta in zip(ids, embeddings, metadatas):
+                vector = np.asarray(vector, dtype=np.float32)
+                self._vectors[id_] = vector / (np.linalg.norm(vector) or 1.0)
+                self._metadata[id_] = meta
+            self._matrix = None
+        return ids
+
+    def _snapshot(self) -> tuple:
+        with self._lock:
+            if self._matrix is None:
+                ids = list(self._vectors)
+                self._matrix = (ids, np.stack([self._vectors[i] for i in ids]) if ids else np.zeros((0, 0)))
+            return self._matrix
+
+    def query(self, vector: list[float] | None = None, id: str | None = None, top_k: int = 5,
+              namespace: str | None = None, filter: dict | None = None, include_metadata: bool = True):
+        time.sleep(self.latency)
+        ids, matrix = self._snapshot()
+        if not ids:
+            return {"matches": []}
+        query = self._vectors[id] if id is not None else np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        top = np.argsort(-scores)[:top_k]
+        return {"matches": [
+            {"id": ids[i], "score": float(scores[i]), **({"metadata": self._metadata[ids[i]]} if include_metadata else {})}
+            for i in top
+        ]}
+
+    def query_many(self, vectors: List[List[float]], top_k: int = 5, namespace: str | None = None,
+                   include_metadata: bool = True) -> List[Dict[str, Any]]:
+        time.sleep(self.latency)
+        ids, matrix = self._snapshot()
+        if not ids or not len(vectors):
+            return [{"matches": []} for _ in vectors]
+        queries = np.asarray(vectors, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ matrix.T
+        return [{"matches": [
+            {"id": ids[i], "score": float(row[i]), **({"metadata": self._metadata[ids[i]]} if include_metadata else {})}
+            for i in np.argsort(-row)[:top_k]
+        ]} for row in scores]
+
+    def fetch(self, ids: list[str], namespace: str | None = None) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {i: self._metadata[i] for i in ids if i in self._metadata}
+
+    def delete(self, ids: list[str] | None = None, namespace: str | None = None, delete_all: bool = False,
+               filter: dict | None = None):
+        with self._lock:
+            for id_ in list(self._vectors) if delete_all else ids or []:
+                self._vectors.pop(id_, None)
+                self._metadata.pop(id_, None)
+            self._matrix = None
+        return {}
+
+
+def start_server(name: str, port: int):
+    """Serve rag_server ("flask") or rag_server_async ("asgi") on a background thread; returns a stop function.
+
+    Configure the environment before calling: the server modules read it on import.
+    """
+    if name == "flask":
+        from werkzeug.serving import make_server
+
+        import rag_server
+
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = make_server("127.0.0.1", port, rag_server.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server.shutdown
+
+    import uvicorn
+
+    import rag_server_async
+
+    server = uvicorn.Server(uvicorn.Config(rag_server_async.app, host="127.0.0.1", port=port, log_level="warning",
+                                           backlog=4096))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+    return stop
+
+
+def test():
+    store = FakeVectorStore()
+    embedder = FakeEmbedder()
+    texts = ["The VAT rate is thirteen percent.", "A passport is valid for ten years.", "Voting age is eighteen."]
+    store.upsert([e.values for e in embedder.embed(texts)], [{"text": t} for t in texts], ids=["vat", "passport", "vote"])
+    query = embedder.embed(["What is the VAT rate?"])[0].values
+    assert store.query(vector=query, top_k=1)["matches"][0]["id"] == "vat"
+    assert [r["matches"][0]["id"] for r in store.query_many([query, store._vectors["vote"]], top_k=1)] == ["vat", "vote"]
+    assert embedder.embed(texts[:1])[0].values == embedder.embed(texts[:1])[0].values
+    store.delete(ids=["vat"])
+    assert "vat" not in store.fetch(["vat", "vote"]) and len(store) == 2
+
+    llm = FakeLLM(generate_delay=0, chunk_delay=0, chunks=3)
+    translated = json.loads(llm.generate("... \"originalQuestion\": ...\nHere are the questions:\n'What is the VAT rate?'\n"))
+    assert translated["originalQuestion"] == "What is the VAT rate?"
+    batch = json.loads(llm.generate("... \"originalQuestion\": ...\nHere are the questions:\n'1. A?\n2. B?'\n"
+                                    "numbered 1 to 2"))
+    assert [t["originalQuestion"] for t in batch] == ["A?", "B?"]
+    summary = llm.generate("You keep a running summary of a client's conversation ...\n\nCurrent summary:\n"
+                           "VAT registration\n\nNew exchanges:\nClient: What is the fee?\nAdviser: Rs. 500")
+    assert summary == "VAT registration What is the fee?"
+    assert "".join(llm.stream_generate("answer")) == "token0 token1 token2 "
+    print("Fake backends test passed.")
+
+
+if __name__ == "__main__":
+    test()
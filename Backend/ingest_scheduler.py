@@ -0,0 +1,103 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+from google.genai import errors as genai_errors
+
+T = TypeVar("T")
+
+# Rough characters-per-token ratio for Gemini models; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Block until ``amount`` tokens are available; returns the seconds spent waiting."""
+        # A request larger than the bucket could never fit; let it through once the bucket is full.
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate_per_second
+            time.sleep(delay)
+            waited += delay
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget shared by all workers."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens: int) -> float:
+        return self.requests.acquire(1) + self.tokens.acquire(tokens)
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, genai_errors.APIError):
+        return exc.code == 429 or (exc.code or 0) >= 500
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+def call_with_retries(fn: Callable[[], T], max_attempts: int = 6, base_delay: float = 2.0,
+                      max_delay: float = 60.0) -> T:
+    """Call ``fn``, retrying rate-limit and server errors with jittered exponential backoff."""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return fn()
+        except Exception as exc:
+            if attempt == max_attempts or not is_retryable(exc):
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            logging.warning("Retryable error (%s); attempt %d/%d, sleeping %.1fs", exc, attempt, max_attempts, delay)
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def test():
+    bucket = TokenBucket(rate_per_minute=600, capacity=2)  # 10 tokens/s
+    started = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    elapsed = time.monotonic() - started
+    assert 0.15 < elapsed < 0.5, elapsed
+
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise genai_errors.APIError(429, {"error": {"message": "quota", "status": "RESOURCE_EXHAUSTED"}})
+        return "ok"
+
+    assert call_with_retries(flaky, base_delay=0.01) == "ok" and len(attempts) == 3
+    print("TokenBucket and call_with_retries test passed.")
+
+
+if __name__ == "__main__":
+    test()
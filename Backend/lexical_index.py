@@ -0,0 +1,193 @@
+"""BM25 inverted index over the ingested chunks, for exact legal tokens dense search misses.
+
+The on-disk form is a term dictionary plus flat arrays, with the postings memory-mapped on load:
+``offsets[t]:offsets[t + 1]`` slices ``posting_docs`` / ``posting_weights`` to the
+documents containing term ``t`` and their precomputed BM25 weights, so a query is a
+handful of array slices and one ``bincount``. Per-chunk term counts are kept in
+``sources.json`` so ingestion can add or remove chunks and rebuild the arrays.
+"""
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from local_vector_index import _atomic_write_bytes, _atomic_write_json
+
+DEFAULT_LEXICAL_INDEX_DIR = "./lexical_index"
+TERMS_FILE = "terms.json"
+DOC_IDS_FILE = "doc_ids.json"
+OFFSETS_FILE = "offsets.npy"
+POSTING_DOCS_FILE = "posting_docs.npy"
+POSTING_WEIGHTS_FILE = "posting_weights.npy"
+SOURCES_FILE = "sources.json"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+# Numbers, Latin words, and Devanagari words (the danda and double danda split words).
+_TOKEN = re.compile(r"[0-9]+|[a-z]+|[ऀ-ॣ०-ॿ]+")
+# Nukta, zero-width joiners and chandrabindu spellings vary between sources of the same act.
+_DEVANAGARI_FOLD = str.maketrans({"़": None, "‌": None, "‍": None, "ँ": "ं"})
+# Common alternative spellings in Romanized Nepali ("kaanoon"/"kanun", "chha"/"cha", "vivah"/"bibaha").
+_ROMANIZED_FOLD = [(re.compile(r"a{2,}"), "a"), (re.compile(r"e{2,}"), "i"), (re.compile(r"o{2,}"), "u"),
+                   (re.compile(r"chh"), "ch"), (re.compile(r"sh"), "s"), (re.compile(r"v"), "b")]
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to what when which who with".split()
+)
+
+
+@lru_cache(maxsize=65536)
+def _fold_term(token: str) -> str:
+    if token.isascii() and token.isalpha():
+        for pattern, replacement in _ROMANIZED_FOLD:
+            token = pattern.sub(replacement, token)
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms with Devanagari digits and spelling variants folded to one form."""
+    text = unicodedata.normalize("NFC", text).lower().translate(_DEVANAGARI_DIGITS).translate(_DEVANAGARI_FOLD)
+    return [_fold_term(token) for token in _TOKEN.findall(text) if token not in STOPWORDS]
+
+
+def lexical_index_from_env() -> "LexicalIndex | None":
+    if os.getenv("HYBRID_SEARCH", "on").lower() in ("off", "0", "false"):
+        return None
+    return LexicalIndex(os.getenv("LEXICAL_INDEX_DIR", DEFAULT_LEXICAL_INDEX_DIR))
+
+
+class LexicalIndex:
+    def __init__(self, root: str | Path = DEFAULT_LEXICAL_INDEX_DIR):
+        self.root = Path(root)
+        self._sources: Dict[str, Dict[str, int]] | None = None
+        self._load()
+
+    def _load(self) -> None:
+        self.term_ids: Dict[str, int] = {}
+        self.doc_ids: List[str] = []
+        self.offsets: List[int] = [0]
+        self.posting_docs = np.zeros(0, dtype=np.int32)
+        self.posting_weights = np.zeros(0, dtype=np.float32)
+        if not (self.root / TERMS_FILE).exists():
+            return
+        self.term_ids = json.loads((self.root / TERMS_FILE).read_text(encoding="utf-8"))
+        self.doc_ids = json.loads((self.root / DOC_IDS_FILE).read_text(encoding="utf-8"))
+        # Plain ndarray views of the maps: slicing np.memmap objects costs more than the arithmetic.
+        self.offsets = np.load(self.root / OFFSETS_FILE).tolist()
+        self.posting_docs = np.asarray(np.load(self.root / POSTING_DOCS_FILE, mmap_mode="r"))
+        self.posting_weights = np.asarray(np.load(self.root / POSTING_WEIGHTS_FILE, mmap_mode="r"))
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(self, text: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """The ``top_k`` chunk ids by BM25 score for ``text``, best first."""
+        terms = Counter(t for t in tokenize(text) if t in self.term_ids)
+        if not terms or top_k <= 0:
+            return []
+        docs, weights = [], []
+        for term, count in terms.items():
+            term_id = self.term_ids[term]
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs.append(self.posting_docs[start:end])
+            weights.append(self.posting_weights[start:end] * count if count > 1 else self.posting_weights[start:end])
+        # One bincount over the concatenated postings is about twice as fast as scatter-adding term by term.
+        scores = np.bincount(np.concatenate(docs), np.concatenate(weights), minlength=len(self.doc_ids))
+
+        if len(scores) > top_k:
+            top = np.argpartition(scores, -top_k)[-top_k:]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.doc_ids[row], float(scores[row])) for row in top if scores[row] > 0]
+
+    @property
+    def sources(self) -> Dict[str, Dict[str, int]]:
+        if self._sources is None:
+            path = self.root / SOURCES_FILE
+            self._sources = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        return self._sources
+
+    def upsert(self, ids: List[str], texts: List[str]) -> None:
+        for id_, text in zip(ids, texts):
+            self.sources[id_] = dict(Counter(tokenize(text)))
+
+    def delete(self, ids: List[str]) -> None:
+        for id_ in ids:
+            self.sources.pop(id_, None)
+
+    def save(self) -> None:
+        """Rebuild the postings arrays from the current chunks and write them to disk."""
+        sources = self.sources
+        doc_ids = sorted(sources)
+        lengths = np.asarray([sum(sources[d].values()) for d in doc_ids], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) else 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for row, doc_id in enumerate(doc_ids):
+            for term, count in sources[doc_id].items():
+                postings.setdefault(term, []).append((row, count))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+        docs = np.empty(offsets[-1], dtype=np.int32)
+        weights = np.empty(offsets[-1], dtype=np.float32)
+        for term_id, term in enumerate(terms):
+            pairs = np.asarray(postings[term], dtype=np.int64)
+            rows, counts = pairs[:, 0], pairs[:, 1].astype(np.float32)
+            idf = math.log(1 + (len(doc_ids) - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / avg_length)
+            start, end = offsets[term_id], offsets[term_id + 1]
+            docs[start:end] = rows
+            weights[start:end] = idf * counts * (BM25_K1 + 1) / (counts + norm)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        for name, array in ((OFFSETS_FILE, offsets), (POSTING_DOCS_FILE, docs), (POSTING_WEIGHTS_FILE, weights)):
+            _atomic_write_bytes(self.root / name, lambda fh, array=array: np.save(fh, array))
+        _atomic_write_json(self.root / SOURCES_FILE, sources)
+        _atomic_write_json(self.root / DOC_IDS_FILE, doc_ids)
+        _atomic_write_json(self.root / TERMS_FILE, {t: i for i, t in enumerate(terms)})
+        self._load()
+
+
+def test():
+    import tempfile
+
+    assert tokenize("धारा ११ (२) मा") == ["धारा", "11", "2", "मा"]
+    assert tokenize("Kaanoon ko vivah") == tokenize("kanun ko bibah")[:2] + tokenize("vivah")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LexicalIndex(tmp)
+        index.upsert(
+            ["vat-11", "vat-12", "const-17", "income"],
+            [
+                "Value Added Tax Act, Section 11: the tax rate is 13 percent.",
+                "Section 12 covers VAT registration thresholds.",
+                "Article 17 of the Constitution guarantees freedom of opinion. धारा १७",
+                "Income Tax Act: rates for individuals.",
+            ],
+        )
+        index.save()
+        reopened = LexicalIndex(tmp)
+        assert reopened.search("What does Section 11 say about the VAT rate?")[0][0] == "vat-11"
+        assert reopened.search("धारा 17")[0][0] == "const-17"
+        assert reopened.search("unrelated words") == []
+
+        reopened.delete(["vat-11"])
+        reopened.save()
+        assert all(id_ != "vat-11" for id_, _ in LexicalIndex(tmp).search("Section 11 rate"))
+
+    print("LexicalIndex tokenize/search/delete test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -1,23 +1,113 @@
-import os
 import sys
+import time
 
 from dotenv import load_dotenv
-from google import genai
 from google.genai.types import Content, Part
 
+import clients
+from metrics import record_tokens, span, stage_seconds, upstream_calls
+from resilience import CircuitOpenError, DeadlineExceeded, fallback_model_from_env, policy_from_env
+
 
 class LLMWrapper:
-    def __init__(self, model_name="gemini-2.5-pro"):
+    """Gemini generation under a ``CallPolicy``: deadlines, retries and a per-model circuit breaker.
+
+    ``hedge`` duplicates slow non-streaming calls and ``deadline`` overrides
+    ``LLM_DEADLINE_SECONDS`` for callers with long legitimate calls. Batch callers that
+    retry on their own (ingestion) pass ``retries=0`` and ``circuit_breaker=False``. Streams that haven't started within
+    the first-token budget race ``fallback_model`` (``FALLBACK_MODEL``, default
+    gemini-2.5-flash), and a non-streaming call whose first attempt times out, or that
+    finds the circuit open, is answered by it instead. Neither model retries a timed-out
+    attempt then, so the two together take at most about two deadlines.
+    """
+
+    def __init__(self, model_name="gemini-2.5-pro", hedge: bool = False, deadline: float | None = None,
+                 fallback: bool = True, retries: int | None = None, circuit_breaker: bool = True):
         self.model_name = model_name
-        self.client = genai.Client(api_key=os.getenv("GEMINI_KEY"))
+        self.policy = policy_from_env(model_name, hedge=hedge, deadline=deadline, retries=retries,
+                                      circuit_breaker=circuit_breaker)
+        self.fallback_model = fallback_model_from_env(model_name) if fallback else None
+        self.fallback_policy = policy_from_env(self.fallback_model) if self.fallback_model else None
+
+    @property
+    def client(self):
+        return clients.gemini_client()
+
+    def warm_up(self) -> None:
+        """Open a pooled connection and check that the model exists."""
+        self.client.models.get(model=self.model_name)
 
     def generate(self, messages: Content | Part | str) -> str:
-        response = self.client.models.generate_content(model=self.model_name, contents=messages)
-        return response.text
+        try:
+            return self.policy.call(lambda: self._generate(self.model_name, messages),
+                                    retry_deadline=self.fallback_policy is None)
+        except (DeadlineExceeded, CircuitOpenError):
+            if self.fallback_policy is None:
+                raise
+            upstream_calls.inc(model=self.model_name, outcome="fallback")
+            return self.fallback_policy.call(lambda: self._generate(self.fallback_model, messages),
+                                             retry_deadline=False)
 
     def stream_generate(self, messages: Content | Part | str):
-        for chunk in self.client.models.generate_content_stream(model=self.model_name, contents=messages):
-            yield chunk.text
+        if self.fallback_policy is None:
+            return self.policy.stream(lambda: self._stream(self.model_name, messages))
+        return self.policy.stream(lambda: self._stream(self.model_name, messages), self.fallback_policy,
+                                  lambda: self._stream(self.fallback_model, messages))
+
+    async def agenerate(self, messages: Content | Part | str) -> str:
+        try:
+            return await self.policy.acall(lambda: self._agenerate(self.model_name, messages),
+                                           retry_deadline=self.fallback_policy is None)
+        except (DeadlineExceeded, CircuitOpenError):
+            if self.fallback_policy is None:
+                raise
+            upstream_calls.inc(model=self.model_name, outcome="fallback")
+            return await self.fallback_policy.acall(lambda: self._agenerate(self.fallback_model, messages),
+                                                    retry_deadline=False)
+
+    def astream_generate(self, messages: Content | Part | str):
+        if self.fallback_policy is None:
+            return self.policy.astream(lambda: self._astream(self.model_name, messages))
+        return self.policy.astream(lambda: self._astream(self.model_name, messages), self.fallback_policy,
+                                   lambda: self._astream(self.fallback_model, messages))
+
+    def _generate(self, model: str, messages: Content | Part | str) -> str:
+        with span("llm.generate", model=model):
+            response = self.client.models.generate_content(model=model, contents=messages)
+        record_tokens(model, response.usage_metadata)
+        return response.text
+
+    def _stream(self, model: str, messages: Content | Part | str):
+        started = time.perf_counter()
+        usage = None
+        with span("llm.stream", model=model):
+            for i, chunk in enumerate(self.client.models.generate_content_stream(model=model, contents=messages)):
+                if i == 0:
+                    stage_seconds.observe(time.perf_counter() - started, stage="llm.first_chunk", model=model)
+                # Every chunk repeats the running totals; the last one has the final counts.
+                usage = chunk.usage_metadata or usage
+                yield chunk.text
+        record_tokens(model, usage)
+
+    async def _agenerate(self, model: str, messages: Content | Part | str) -> str:
+        with span("llm.generate", model=model):
+            response = await self.client.aio.models.generate_content(model=model, contents=messages)
+        record_tokens(model, response.usage_metadata)
+        return response.text
+
+    async def _astream(self, model: str, messages: Content | Part | str):
+        started = time.perf_counter()
+        usage = None
+        with span("llm.stream", model=model):
+            stream = await self.client.aio.models.generate_content_stream(model=model, contents=messages)
+            first = True
+            async for chunk in stream:
+                if first:
+                    stage_seconds.observe(time.perf_counter() - started, stage="llm.first_chunk", model=model)
+                    first = False
+                usage = chunk.usage_metadata or usage
+                yield chunk.text
+        record_tokens(model, usage)
 
 
 def test():
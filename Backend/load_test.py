@@ -0,0 +1,124 @@
+"""Concurrent-stream capacity of the Flask (thread per stream) and ASGI servers.
+
+Both servers run in-process against stub Gemini / vector store stand-ins, so no
+API keys are needed and the numbers reflect the servers, not upstream latency:
+
+    python load_test.py --concurrency 50,200,500 --chunks 40 --chunk-delay 0.05
+"""
+import argparse
+import asyncio
+import atexit
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+_tmp = tempfile.mkdtemp(prefix="legaladviser-load-")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ.setdefault("GEMINI_KEY", "stub")
+os.environ["VECTOR_STORE_BACKEND"] = "local"
+os.environ["LOCAL_INDEX_DIR"] = _tmp
+os.environ["ANSWER_CACHE"] = "off"
+os.environ["EMBEDDING_CACHE"] = "off"
+os.environ["LEXICAL_INDEX_DIR"] = os.path.join(_tmp, "lexical")
+os.environ["DOCUMENT_STORE_DIR"] = os.path.join(_tmp, "documents")
+os.environ["CONVERSATION_STORE_PATH"] = os.path.join(_tmp, "conversations.sqlite3")
+# Every stream asks the same question; measure the servers, not coalescing or the fast path.
+os.environ["REQUEST_COALESCING"] = "off"
+os.environ["QUERY_ROUTING"] = "off"
+os.environ.setdefault("REQUEST_LOG", "off")
+# The stub key would fail the Gemini warm-up; the fakes need none.
+os.environ["BACKEND_WARMUP"] = "off"
+os.environ.setdefault("MAX_CONCURRENT_STREAMS", "100000")
+
+import httpx
+
+import rag_server
+from fakes import FakeEmbedder, FakeLLM, hashed_vector, start_server
+
+
+async def one_stream(client: httpx.AsyncClient, url: str, expected_chunks: int) -> dict:
+    started = time.perf_counter()
+    first_token = None
+    chunks = 0
+    try:
+        async with client.stream("POST", url, json={"queries": ["What is the voting age?"]}) as response:
+            if response.status_code != 200:
+                return {"ok": False, "error": f"HTTP {response.status_code}"}
+            async for line in response.aiter_lines():
+                if '"step": "Answering"' in line:
+                    chunks += 1
+                    first_token = first_token or time.perf_counter() - started
+                elif '"step": "Error"' in line:
+                    return {"ok": False, "error": line}
+    except httpx.HTTPError as e:
+        return {"ok": False, "error": type(e).__name__}
+    return {"ok": chunks == expected_chunks, "ttft": first_token, "total": time.perf_counter() - started,
+            "error": None if chunks == expected_chunks else f"{chunks} chunks"}
+
+
+async def drive(url: str, concurrency: int, expected_chunks: int, timeout: float) -> dict:
+    peak_threads = threading.active_count()
+    done = False
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.05)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        sampler = asyncio.create_task(sample_threads())
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one_stream(client, url, expected_chunks) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+        done = True
+        await sampler
+
+    ok = [r for r in results if r["ok"]]
+    totals = sorted(r["total"] for r in ok)
+    return {
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "wall_s": wall,
+        "p50_s": statistics.median(totals) if totals else float("nan"),
+        "p95_s": totals[int(0.95 * (len(totals) - 1))] if totals else float("nan"),
+        "ttft_p50_s": statistics.median(r["ttft"] for r in ok) if ok else float("nan"),
+        "peak_threads": peak_threads,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="50,200,500", help="comma-separated numbers of simultaneous streams")
+    parser.add_argument("--chunks", type=int, default=40, help="answer chunks streamed per request")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="seconds between streamed chunks")
+    parser.add_argument("--translate-delay", type=float, default=0.5, help="seconds for the translate_query call")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    rag_server.llm = rag_server.translate_llm = rag_server.background_llm = FakeLLM(
+        args.translate_delay, args.chunk_delay, args.chunks, args.chunk_delay)
+    rag_server.embedder = FakeEmbedder()
+    rag_server.vector_store.upsert([hashed_vector(f"chunk {i}").tolist() for i in range(100)],
+                                   [{"summary": f"chunk {i}"} for i in range(100)])
+
+    servers = {"flask": 8701, "asgi": 8702}
+    print(f"{'server':<6} {'streams':>7} {'ok':>5} {'failed':>6} {'wall s':>7} {'p50 s':>6} {'p95 s':>6} "
+          f"{'ttft p50':>8} {'threads':>7}")
+    for name, port in servers.items():
+        stop = start_server(name, port)
+        try:
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                r = asyncio.run(drive(f"http://127.0.0.1:{port}/chat", concurrency, args.chunks, args.timeout))
+                print(f"{name:<6} {concurrency:>7} {r['ok']:>5} {r['failed']:>6} {r['wall_s']:>7.2f} {r['p50_s']:>6.2f} "
+                      f"{r['p95_s']:>6.2f} {r['ttft_p50_s']:>8.2f} {r['peak_threads']:>7}")
+        finally:
+            stop()
+
+
+if __name__ == "__main__":
+    main()
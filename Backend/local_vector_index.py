@@ -0,0 +1,762 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from ann_index import IVFIndex, default_nlist
+
+DEFAULT_NAMESPACE = "__default__"
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.json"
+METADATA_FILE = "metadata.json"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_ASSIGNMENTS_FILE = "ivf_assignments.npy"
+QUANTIZED_FILE = "vectors_quantized.npy"
+QUANTIZATION_SCALES_FILE = "quantization_scales.npy"
+QUANTIZATIONS = ("none", "int8", "float16")
+
+# Below this many vectors exact search is already fast enough that IVF isn't worth training.
+IVF_MIN_TRAIN_VECTORS = 4096
+# Physically drop tombstoned rows once they are this fraction of the matrix.
+COMPACT_DEAD_FRACTION = 0.25
+# Upserts append to a segment that is merged into the base matrix once it holds this fraction of
+# the base's rows (and at least SEGMENT_MIN_ROWS), so the rewrites add up to O(1) per row.
+SEGMENT_MERGE_FRACTION = 0.5
+SEGMENT_MIN_ROWS = 4096
+# Retrain the IVF centroids once a namespace has grown this many times since they were trained.
+IVF_RETRAIN_GROWTH = 2.0
+# A quantized scan keeps this many candidates per result for the exact float32 re-scoring.
+RESCORE_FACTOR = 4
+# Rows converted to float32 at a time when scanning a quantized matrix; a block this size
+# stays in cache between the conversion and the product.
+SCAN_BLOCK_ROWS = 256
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _quantize(vectors: np.ndarray, quantization: str) -> Tuple[np.ndarray, np.ndarray | None]:
+    """Codes of the normalized ``vectors`` and, for int8, the per-dimension scales to decode them."""
+    if quantization == "float16":
+        return _encode(vectors, quantization, None), None
+    scales = np.abs(vectors).max(axis=0) / 127 if len(vectors) else np.ones(vectors.shape[1], np.float32)
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    return _encode(vectors, quantization, scales), scales
+
+
+def _encode(vectors: np.ndarray, quantization: str, scales: np.ndarray | None) -> np.ndarray:
+    """Codes of ``vectors`` with existing ``scales``; rows appended after quantizing are clipped to them."""
+    if quantization == "float16":
+        return vectors.astype(np.float16)
+    return np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+
+
+def _top_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _atomic_write_bytes(path: Path, writer) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as fh:
+        writer(fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+
+
+def _atomic_write_json(path: Path, payload: Any) -> None:
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    _atomic_write_bytes(path, lambda fh: fh.write(data))
+
+
+class _Rows:
+    """Rows of a namespace: the memory-mapped base matrix followed by the in-memory segment rows.
+
+    Supports what the searches need from a matrix: ``len``, ``shape``, integer, slice
+    and row-array indexing, and ``np.asarray`` for the whole thing.
+    """
+
+    def __init__(self, base: np.ndarray, tail: np.ndarray):
+        self.base = base
+        self.tail = tail
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.tail)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self), self.base.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.base.nbytes + self.tail.nbytes
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        rows = np.concatenate([self.base, self.tail]) if len(self.tail) else np.asarray(self.base)
+        return rows if dtype is None else rows.astype(dtype, copy=False)
+
+    def __getitem__(self, key) -> np.ndarray:
+        split = len(self.base)
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(len(self))
+            head = np.asarray(self.base[start:min(stop, split)])
+            rest = self.tail[max(start - split, 0):max(stop - split, 0)]
+            return np.concatenate([head, rest]) if len(rest) else head
+        if isinstance(key, (int, np.integer)):
+            return self.base[key] if key < split else self.tail[key - split]
+        rows = np.asarray(key, dtype=np.int64)
+        if not len(self.tail) or (rows.size and rows.max() < split):
+            return np.asarray(self.base[rows])
+        out = np.empty((len(rows), self.shape[1]), dtype=np.float32)
+        in_base = rows < split
+        out[in_base] = self.base[rows[in_base]]
+        out[~in_base] = self.tail[rows[~in_base] - split]
+        return out
+
+
+class _Namespace:
+    """One namespace of the index: a normalized float32 matrix plus columnar metadata.
+
+    The matrix is a base file plus an append-only segment: upserts append their
+    rows to ``segment-<n>.f32`` and their ids and metadata to ``segment-<n>.jsonl``,
+    and a replaced id is tombstoned and appended again. Deleted rows are tombstoned
+    (their id becomes ``None``) in the same log. The segment is merged into a new
+    base once it reaches ``SEGMENT_MERGE_FRACTION`` of it, and tombstoned rows are
+    physically removed once they make up ``COMPACT_DEAD_FRACTION`` of the matrix,
+    so every row is rewritten a bounded number of times however the corpus grows.
+    With quantization, exact searches scan an int8 or float16 copy of the matrix and
+    re-score their best candidates against the float32 rows.
+    """
+
+    def __init__(self, path: Path, index_type: str = "flat", nprobe: int = 8, nlist: int | None = None,
+                 quantization: str = "none"):
+        self.path = path
+        self.index_type = index_type
+        self.quantization = quantization
+        self.codes: np.ndarray | None = None
+        self.scales: np.ndarray | None = None
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.ids: List[str | None] = []
+        self.row_of: Dict[str, int] = {}
+        self.alive: np.ndarray = np.zeros(0, dtype=bool)
+        self.base: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        # Segment rows (and their codes) in a buffer that grows by doubling; the first tail_rows are in use.
+        self._tail = np.zeros((0, 0), dtype=np.float32)
+        self._tail_codes: np.ndarray | None = None
+        self.tail_rows = 0
+        self.segment = 0
+        self.columns: Dict[str, List[Any]] = {}
+        self.ann: IVFIndex | None = None
+        self.ann_trained_rows = 0
+        self._column_arrays: Dict[str, np.ndarray] = {}
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    @property
+    def has_tombstones(self) -> bool:
+        return len(self.row_of) < len(self.ids)
+
+    @property
+    def vectors(self) -> _Rows:
+        return _Rows(self.base, self._tail[:self.tail_rows])
+
+    def _segment_path(self, suffix: str, segment: int | None = None) -> Path:
+        return self.path / f"segment-{self.segment if segment is None else segment}.{suffix}"
+
+    def _load(self) -> None:
+        vectors_path = self.path / VECTORS_FILE
+        if not vectors_path.exists():
+            return
+        self.base = np.load(vectors_path, mmap_mode="r")
+        self.ids = json.loads((self.path / IDS_FILE).read_text(encoding="utf-8"))
+        state = json.loads((self.path / METADATA_FILE).read_text(encoding="utf-8"))
+        self.columns = state["columns"]
+        self.segment = state.get("segment", 0)
+        self._load_codes()
+        self._reindex_ids()
+        self._replay_segment()
+        if self.index_type == "ivf" and (self.path / IVF_CENTROIDS_FILE).exists():
+            assignments = np.load(self.path / IVF_ASSIGNMENTS_FILE)
+            if len(assignments) == len(self.base):
+                self.ann = IVFIndex(np.load(self.path / IVF_CENTROIDS_FILE), assignments, nprobe=self.nprobe)
+                # Indexes written before retraining existed were trained once, at the threshold.
+                self.ann_trained_rows = state.get("ivf_trained_rows", IVF_MIN_TRAIN_VECTORS)
+                self.ann.add(np.arange(len(self.base), len(self.ids)), self._tail[:self.tail_rows])
+        self._maybe_train_ann(retrain=False)
+
+    def _replay_segment(self) -> None:
+        """Apply the segment log on top of the base; a write torn by a crash is cut off."""
+        log_path = self._segment_path("jsonl")
+        if not log_path.exists():
+            return
+        records, good_bytes = [], 0
+        with open(log_path, "rb") as fh:
+            for line in fh:
+                try:
+                    records.append(json.loads(line) if line.endswith(b"\n") else None)
+                except ValueError:
+                    records.append(None)
+                if records[-1] is None:
+                    records.pop()
+                    break
+                good_bytes += len(line)
+        rows = sum(len(record.get("ids", [])) for record in records)
+        dim = self.base.shape[1]
+        vectors_path = self._segment_path("f32")
+        tail = np.fromfile(vectors_path, dtype=np.float32, count=rows * dim) if rows else np.zeros(0, np.float32)
+        if log_path.stat().st_size > good_bytes:
+            os.truncate(log_path, good_bytes)
+        if vectors_path.exists() and vectors_path.stat().st_size > rows * dim * 4:
+            os.truncate(vectors_path, rows * dim * 4)
+        for record in records:
+            self._apply(record)
+        self._extend_tail(tail.reshape(rows, dim))
+
+    def _load_codes(self) -> None:
+        if self.quantization == "none":
+            return
+        codes_path = self.path / QUANTIZED_FILE
+        if codes_path.exists():
+            codes = np.load(codes_path, mmap_mode="r")
+            scales_path = self.path / QUANTIZATION_SCALES_FILE
+            if codes.shape == self.base.shape and codes.dtype == (np.int8 if self.quantization == "int8" else np.float16):
+                self.codes = codes
+                self.scales = np.load(scales_path) if self.quantization == "int8" else None
+                return
+        # First open with quantization on (or a different kind): derive it from the float32 matrix.
+        self._save_codes()
+
+    def _save_codes(self) -> None:
+        codes, scales = _quantize(np.asarray(self.base, dtype=np.float32), self.quantization)
+        if scales is not None:
+            _atomic_write_bytes(self.path / QUANTIZATION_SCALES_FILE, lambda fh: np.save(fh, scales))
+        _atomic_write_bytes(self.path / QUANTIZED_FILE, lambda fh: np.save(fh, codes))
+        self.codes, self.scales = np.load(self.path / QUANTIZED_FILE, mmap_mode="r"), scales
+
+    def _reindex_ids(self) -> None:
+        self.row_of = {id_: row for row, id_ in enumerate(self.ids) if id_ is not None}
+        self.alive = np.fromiter((id_ is not None for id_ in self.ids), dtype=bool, count=len(self.ids))
+        self._column_arrays = {}
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        """Tombstone ``record["deleted"]`` rows and append ``record["ids"]`` with their metadata."""
+        for row in record.get("deleted", []):
+            self.row_of.pop(self.ids[row], None)
+            self.ids[row] = None
+            for values in self.columns.values():
+                values[row] = None
+        ids = record.get("ids", [])
+        start = len(self.ids)
+        self.ids.extend(ids)
+        for name in self.columns:
+            self.columns[name].extend([None] * len(ids))
+        for row, (id_, meta) in enumerate(zip(ids, record.get("metadata", [])), start):
+            self.row_of[id_] = row
+            for name, value in (meta or {}).items():
+                if name not in self.columns:
+                    self.columns[name] = [None] * len(self.ids)
+                self.columns[name][row] = value
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+        self.alive[record.get("deleted", [])] = False
+        self._column_arrays = {}
+
+    def _extend_tail(self, vectors: np.ndarray) -> None:
+        if not len(vectors):
+            return
+        count = self.tail_rows + len(vectors)
+        if count > len(self._tail):
+            tail = np.zeros((max(count, 2 * len(self._tail), 256), self.base.shape[1]), dtype=np.float32)
+            if self.tail_rows:
+                tail[:self.tail_rows] = self._tail[:self.tail_rows]
+            self._tail = tail
+            if self.codes is not None:
+                codes = np.zeros(tail.shape, dtype=self.codes.dtype)
+                if self._tail_codes is not None:
+                    codes[:self.tail_rows] = self._tail_codes[:self.tail_rows]
+                self._tail_codes = codes
+        self._tail[self.tail_rows:count] = vectors
+        if self.codes is not None:
+            self._tail_codes[self.tail_rows:count] = _encode(vectors, self.quantization, self.scales)
+        self.tail_rows = count
+
+    def _append_segment(self, record: Dict[str, Any], vectors: np.ndarray) -> None:
+        """Log ``record`` (and its rows' vectors, written first) and apply it."""
+        if len(vectors):
+            with open(self._segment_path("f32"), "ab") as fh:
+                fh.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                fh.flush()
+                os.fsync(fh.fileno())
+        with open(self._segment_path("jsonl"), "ab") as fh:
+            fh.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        start = len(self.ids)
+        self._apply(record)
+        self._extend_tail(vectors)
+        if self.ann is not None and len(vectors):
+            self.ann.add(np.arange(start, len(self.ids)), vectors)
+
+    def _save(self, vectors: np.ndarray | None = None) -> None:
+        """Write ids and metadata as a new base, plus the matrix when ``vectors`` is given; the segment starts empty."""
+        if vectors is None and self.tail_rows:
+            vectors = np.asarray(self.vectors)
+        old_segment = self.segment
+        self.segment += 1
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Metadata first: the vectors file is what marks a namespace as present.
+        _atomic_write_json(self.path / METADATA_FILE, {"columns": self.columns, "segment": self.segment,
+                                                        "ivf_trained_rows": self.ann_trained_rows})
+        _atomic_write_json(self.path / IDS_FILE, self.ids)
+        if vectors is not None:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            _atomic_write_bytes(self.path / VECTORS_FILE, lambda fh: np.save(fh, vectors))
+            self.base = np.load(self.path / VECTORS_FILE, mmap_mode="r")
+            if self.quantization != "none":
+                self._save_codes()
+        self._tail, self._tail_codes, self.tail_rows = np.zeros((0, self.base.shape[1]), dtype=np.float32), None, 0
+        if self.ann is not None:
+            _atomic_write_bytes(self.path / IVF_CENTROIDS_FILE, lambda fh: np.save(fh, self.ann.centroids))
+            _atomic_write_bytes(self.path / IVF_ASSIGNMENTS_FILE, lambda fh: np.save(fh, self.ann.assignments))
+        for suffix in ("f32", "jsonl"):
+            self._segment_path(suffix, old_segment).unlink(missing_ok=True)
+        self._reindex_ids()
+
+    def _maybe_train_ann(self, matrix: np.ndarray | _Rows | None = None, retrain: bool = True) -> bool:
+        """Train the IVF index once the namespace is big enough, and again each time it has grown ``IVF_RETRAIN_GROWTH``-fold."""
+        if self.index_type != "ivf" or len(self) < IVF_MIN_TRAIN_VECTORS:
+            return False
+        if self.ann is not None and (not retrain or len(self) < IVF_RETRAIN_GROWTH * self.ann_trained_rows):
+            return False
+        matrix = self.vectors if matrix is None else matrix
+        self.ann = IVFIndex.train(matrix, nlist=self.nlist or default_nlist(len(self)), nprobe=self.nprobe)
+        self.ann_trained_rows = len(self)
+        return True
+
+    def _merge_due(self) -> bool:
+        return (self.tail_rows >= max(SEGMENT_MIN_ROWS, SEGMENT_MERGE_FRACTION * len(self.base))
+                or len(self.ids) - len(self) >= COMPACT_DEAD_FRACTION * len(self.ids)
+                or (self.index_type == "ivf" and len(self) >= IVF_MIN_TRAIN_VECTORS
+                    and (self.ann is None or len(self) >= IVF_RETRAIN_GROWTH * self.ann_trained_rows)))
+
+    def column_array(self, name: str) -> np.ndarray:
+        if name not in self._column_arrays:
+            values = self.columns.get(name)
+            array = np.empty(len(self.ids), dtype=object)
+            for row, value in enumerate(values or []):
+                array[row] = value
+            self._column_arrays[name] = array
+        return self._column_arrays[name]
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        return {name: values[row] for name, values in self.columns.items() if values[row] is not None}
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict[str, Any]]) -> None:
+        vectors = _normalize(vectors)
+        if len(self.ids) and vectors.shape[1] != self.base.shape[1]:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.base.shape[1]}")
+
+        # Later duplicates within one batch win, as with repeated upserts.
+        latest = {id_: i for i, id_ in enumerate(ids)}
+        record = {
+            "deleted": sorted(self.row_of[id_] for id_ in latest if id_ in self.row_of),
+            "ids": list(latest),
+            "metadata": [metadatas[i] or {} for i in latest.values()],
+        }
+        rows = vectors[list(latest.values())]
+        if not len(self.ids):
+            # The first batch becomes the base directly.
+            self._apply(record)
+            self._maybe_train_ann(rows)
+            self._save(rows)
+            return
+        self._append_segment(record, rows)
+        if self._merge_due():
+            self.compact()
+
+    def tombstone(self, rows: np.ndarray) -> None:
+        if rows.size == 0:
+            return
+        self._append_segment({"deleted": [int(row) for row in rows]}, np.zeros((0, self.base.shape[1]), np.float32))
+        if self._merge_due():
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge the segment into a new base without the tombstoned rows, retraining IVF if it is due."""
+        keep = self.alive.copy()
+        kept_rows = np.flatnonzero(keep)
+        matrix = self.vectors[kept_rows]
+        self.ids = [self.ids[r] for r in kept_rows]
+        self.columns = {name: [values[r] for r in kept_rows] for name, values in self.columns.items()}
+        self.columns = {name: values for name, values in self.columns.items() if any(v is not None for v in values)}
+        self._reindex_ids()
+        if self.ann is not None:
+            self.ann.compact(keep)
+        self._maybe_train_ann(matrix)
+        self._save(matrix)
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Similarity of each query to every row: exact, or approximate from the quantized codes."""
+        tail = self._tail[:self.tail_rows]
+        if self.codes is None:
+            scores = queries @ self.base.T
+            return np.hstack([scores, queries @ tail.T]) if len(tail) else scores
+        weights = queries * self.scales if self.scales is not None else queries
+        scores = np.empty((len(queries), len(self.codes) + len(tail)), dtype=np.float32)
+        buffer = np.empty((SCAN_BLOCK_ROWS, self.codes.shape[1]), dtype=np.float32)
+        offset = 0
+        for codes in [self.codes] + ([self._tail_codes[:self.tail_rows]] if len(tail) else []):
+            for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+                chunk = codes[start:start + SCAN_BLOCK_ROWS]
+                block = buffer[:len(chunk)]
+                np.copyto(block, chunk, casting="unsafe")
+                scores[:, offset + start:offset + start + len(chunk)] = weights @ block.T
+            offset += len(codes)
+        return scores
+
+    def rescore(self, query: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The best ``k`` of the candidate ``rows`` by exact float32 similarity."""
+        rows = np.sort(rows)  # read the memory-mapped rows in file order
+        exact = np.asarray(self.vectors[rows]) @ query
+        top = _top_rows(exact, k)
+        return rows[top], exact[top]
+
+    def _best(self, query: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        finite = int(np.count_nonzero(np.isfinite(scores)))
+        k = min(top_k, finite)
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self.codes is None:
+            top = _top_rows(scores, k)
+            return top, scores[top]
+        return self.rescore(query, _top_rows(scores, min(k * RESCORE_FACTOR, finite)), k)
+
+    def search(self, query: np.ndarray, top_k: int, mask: np.ndarray | None = None,
+               nprobe: int | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k rows by cosine similarity, restricted to live rows (and ``mask`` if given)."""
+        if self.has_tombstones:
+            mask = self.alive if mask is None else (mask & self.alive)
+        if self.ann is not None:
+            return self.ann.search(self.vectors, query, top_k, nprobe=nprobe, mask=mask)
+
+        scores = self.scores(query[None, :])[0]
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        return self._best(query, scores, top_k)
+
+    def search_many(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """``search`` for a batch of normalized queries; an exact index scores them in one matrix product."""
+        if self.ann is not None:
+            return [self.search(q, top_k) for q in queries]
+        scores = self.scores(queries)
+        if self.has_tombstones:
+            scores[:, ~self.alive] = -np.inf
+        return [self._best(query, row, top_k) for query, row in zip(queries, scores)]
+
+
+class LocalVectorIndex:
+    """In-process replacement for a Pinecone ``Index`` backed by memory-mapped NumPy files.
+
+    Each namespace lives in its own directory holding a row-normalized float32 matrix
+    (``vectors.npy``), the row ids and a columnar metadata file, so opening the index
+    is a single ``mmap`` and cosine similarity is one matrix-vector product.
+
+    Upserts append to a segment file instead of rewriting the matrix; the segment is
+    merged into the matrix as it grows (see ``_Namespace``).
+
+    With ``index_type="ivf"`` an inverted-file index is trained once the namespace
+    holds ``IVF_MIN_TRAIN_VECTORS`` vectors, and retrained whenever it has grown
+    ``IVF_RETRAIN_GROWTH``-fold since; queries scan only ``nprobe`` buckets.
+    Smaller namespaces are always searched exactly. ``quantization="int8"`` (or
+    ``"float16"``) makes exact searches scan a 4x (2x) smaller copy of the matrix,
+    kept next to the float32 one, and re-score the top ``RESCORE_FACTOR * top_k``
+    candidates exactly.
+    """
+
+    def __init__(self, root: str | Path, index_type: str = "flat", nprobe: int = 8, nlist: int | None = None,
+                 quantization: str = "none"):
+        if index_type not in ("flat", "ivf"):
+            raise ValueError(f"Unknown local index type {index_type}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown local index quantization {quantization}")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.quantization = quantization
+        self._namespaces: Dict[str, _Namespace] = {}
+
+    def _namespace(self, namespace: str | None) -> _Namespace:
+        name = namespace or DEFAULT_NAMESPACE
+        if name not in self._namespaces:
+            self._namespaces[name] = _Namespace(self.root / name, self.index_type, self.nprobe, self.nlist,
+                                                self.quantization)
+        return self._namespaces[name]
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str | None = None) -> Dict[str, int]:
+        if not vectors:
+            return {"upserted_count": 0}
+        ns = self._namespace(namespace)
+        ns.upsert(
+            ids=[v["id"] for v in vectors],
+            vectors=np.asarray([v["values"] for v in vectors], dtype=np.float32),
+            metadatas=[v.get("metadata") or {} for v in vectors],
+        )
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector: list[float] | None = None, id: str | None = None, top_k: int = 5, namespace: str | None = None,
+              filter: dict | None = None, include_metadata: bool = True, nprobe: int | None = None) -> Dict[str, Any]:
+        ns = self._namespace(namespace)
+        response = {"matches": [], "namespace": namespace or ""}
+        if not len(ns) or top_k <= 0:
+            return response
+
+        if vector is not None:
+            q = _normalize(np.asarray(vector, dtype=np.float32))
+        elif id is not None and id in ns.row_of:
+            q = np.asarray(ns.vectors[ns.row_of[id]])
+        else:
+            return response
+
+        rows, scores = ns.search(q, top_k, mask=_filter_mask(ns, filter) if filter else None, nprobe=nprobe)
+        for row, score in zip(rows, scores):
+            match = {"id": ns.ids[row], "score": float(score)}
+            if include_metadata:
+                match["metadata"] = ns.metadata(row)
+            response["matches"].append(match)
+        return response
+
+    def query_many(self, vectors: List[list[float]], top_k: int = 5, namespace: str | None = None,
+                   include_metadata: bool = True) -> List[Dict[str, Any]]:
+        """One ``query`` response per vector, all scored together."""
+        ns = self._namespace(namespace)
+        if not len(ns) or top_k <= 0 or not len(vectors):
+            return [{"matches": [], "namespace": namespace or ""} for _ in vectors]
+        queries = _normalize(np.asarray(vectors, dtype=np.float32))
+        responses = []
+        for rows, scores in ns.search_many(queries, top_k):
+            matches = []
+            for row, score in zip(rows, scores):
+                match = {"id": ns.ids[row], "score": float(score)}
+                if include_metadata:
+                    match["metadata"] = ns.metadata(row)
+                matches.append(match)
+            responses.append({"matches": matches, "namespace": namespace or ""})
+        return responses
+
+    def fetch(self, ids: List[str], namespace: str | None = None) -> Dict[str, Any]:
+        ns = self._namespace(namespace)
+        vectors = {}
+        for id_ in ids:
+            row = ns.row_of.get(id_)
+            if row is not None:
+                vectors[id_] = {"id": id_, "values": np.asarray(ns.vectors[row]).tolist(), "metadata": ns.metadata(row)}
+        return {"vectors": vectors, "namespace": namespace or ""}
+
+    def delete(self, ids: list[str] | None = None, namespace: str | None = None, delete_all: bool = False,
+               filter: dict | None = None) -> Dict[str, Any]:
+        ns = self._namespace(namespace)
+        if delete_all:
+            shutil.rmtree(ns.path, ignore_errors=True)
+            self._namespaces.pop(namespace or DEFAULT_NAMESPACE, None)
+            return {}
+        if not len(ns):
+            return {}
+        if ids is not None:
+            rows = np.asarray(sorted(ns.row_of[i] for i in set(ids) if i in ns.row_of), dtype=np.int64)
+        elif filter:
+            rows = np.flatnonzero(_filter_mask(ns, filter) & ns.alive)
+        else:
+            rows = np.zeros(0, dtype=np.int64)
+        ns.tombstone(rows)
+        return {}
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        namespaces = {}
+        dimension = 0
+        for path in sorted(p for p in self.root.iterdir() if (p / VECTORS_FILE).exists()):
+            ns = self._namespace(path.name)
+            dimension = ns.vectors.shape[1]
+            namespaces["" if path.name == DEFAULT_NAMESPACE else path.name] = {"vector_count": len(ns)}
+        return {
+            "dimension": dimension,
+            "namespaces": namespaces,
+            "total_vector_count": sum(n["vector_count"] for n in namespaces.values()),
+        }
+
+
+def _compare(column: np.ndarray, op: str, operand: Any) -> np.ndarray:
+    present = np.fromiter((v is not None for v in column), dtype=bool, count=len(column))
+    if op == "$eq":
+        return np.fromiter((v == operand or (isinstance(v, list) and operand in v) for v in column), dtype=bool, count=len(column))
+    if op == "$ne":
+        return ~_compare(column, "$eq", operand)
+    if op == "$in":
+        allowed = set(operand)
+        return np.fromiter((v in allowed if not isinstance(v, list) else bool(allowed.intersection(v)) for v in column),
+                           dtype=bool, count=len(column))
+    if op == "$nin":
+        return ~_compare(column, "$in", operand)
+    if op == "$exists":
+        return present if operand else ~present
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        numeric = np.full(len(column), np.nan)
+        for i, v in enumerate(column):
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                numeric[i] = v
+        with np.errstate(invalid="ignore"):
+            if op == "$gt":
+                return numeric > operand
+            if op == "$gte":
+                return numeric >= operand
+            if op == "$lt":
+                return numeric < operand
+            return numeric <= operand
+    raise ValueError(f"Unsupported filter operator {op}")
+
+
+def _filter_mask(ns: _Namespace, filter: dict) -> np.ndarray:
+    """Evaluate a Pinecone-style metadata filter into a boolean row mask.
+
+    The mask covers every row of the matrix, tombstoned ones included, like the columns it is built from.
+    """
+    mask = np.ones(len(ns.ids), dtype=bool)
+    for key, condition in filter.items():
+        if key == "$and":
+            for sub in condition:
+                mask &= _filter_mask(ns, sub)
+        elif key == "$or":
+            any_mask = np.zeros(len(ns.ids), dtype=bool)
+            for sub in condition:
+                any_mask |= _filter_mask(ns, sub)
+            mask &= any_mask
+        else:
+            column = ns.column_array(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, operand in condition.items():
+                mask &= _compare(column, op, operand)
+    return mask
+
+
+def test():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LocalVectorIndex(tmp)
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(50, 768)).astype(np.float32)
+        index.upsert(vectors=[
+            {"id": f"id-{i}", "values": v.tolist(), "metadata": {"genre": "even" if i % 2 == 0 else "odd", "n": i}}
+            for i, v in enumerate(vectors)
+        ])
+
+        res = index.query(vector=vectors[7].tolist(), top_k=3)
+        assert res["matches"][0]["id"] == "id-7"
+        assert np.isclose(res["matches"][0]["score"], 1.0, atol=1e-4)
+
+        res = index.query(vector=vectors[7].tolist(), top_k=5, filter={"genre": {"$eq": "even"}, "n": {"$lt": 10}})
+        assert all(m["metadata"]["genre"] == "even" and m["metadata"]["n"] < 10 for m in res["matches"])
+        assert len(res["matches"]) == 5
+        assert index.fetch(ids=["id-3", "missing"])["vectors"]["id-3"]["metadata"] == {"genre": "odd", "n": 3}
+
+        index.delete(ids=["id-7"])
+        reopened = LocalVectorIndex(tmp)
+        res = reopened.query(vector=vectors[7].tolist(), top_k=1)
+        assert res["matches"][0]["id"] != "id-7"
+        assert reopened.describe_index_stats()["total_vector_count"] == 49
+        batch = reopened.query_many(vectors[:10].tolist(), top_k=4)
+        for i, res in enumerate(batch):
+            assert [m["id"] for m in res["matches"]] == \
+                [m["id"] for m in reopened.query(vector=vectors[i].tolist(), top_k=4)["matches"]]
+        assert all(m["id"] != "id-7" for m in batch[7]["matches"])
+
+        # Filters see the tombstoned rows too until compaction drops them.
+        res = reopened.query(vector=vectors[7].tolist(), top_k=3, filter={"genre": "odd"})
+        assert [m["metadata"]["genre"] for m in res["matches"]] == ["odd"] * 3
+        assert all(m["id"] != "id-7" for m in res["matches"])
+        reopened.delete(filter={"$or": [{"n": {"$gte": 45}}, {"n": 9}]})
+        assert reopened.describe_index_stats()["total_vector_count"] == 43
+        assert reopened._namespace(None).has_tombstones
+        assert not reopened.query(vector=vectors[9].tolist(), top_k=5, filter={"n": {"$in": [9, 45, 49]}})["matches"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LocalVectorIndex(tmp, index_type="ivf", nprobe=4)
+        vectors = np.random.default_rng(1).normal(size=(IVF_MIN_TRAIN_VECTORS + 500, 64)).astype(np.float32)
+        index.upsert(vectors=[{"id": f"id-{i}", "values": v} for i, v in enumerate(vectors[:IVF_MIN_TRAIN_VECTORS])])
+        index.upsert(vectors=[{"id": f"id-{i}", "values": v} for i, v in enumerate(vectors) if i >= IVF_MIN_TRAIN_VECTORS])
+        reopened = LocalVectorIndex(tmp, index_type="ivf", nprobe=4)
+        assert reopened._namespace(None).ann is not None
+        assert reopened.query(vector=vectors[-1], top_k=1)["matches"][0]["id"] == f"id-{len(vectors) - 1}"
+        reopened.delete(ids=[f"id-{len(vectors) - 1}"])
+        assert reopened.query(vector=vectors[-1], top_k=1)["matches"][0]["id"] != f"id-{len(vectors) - 1}"
+
+        # Doubling the namespace merges the segment and retrains the centroids on all of it.
+        more = np.random.default_rng(4).normal(size=(IVF_MIN_TRAIN_VECTORS, 64)).astype(np.float32)
+        reopened.upsert(vectors=[{"id": f"more-{i}", "values": v} for i, v in enumerate(more)])
+        ns = reopened._namespace(None)
+        assert ns.tail_rows == 0 and ns.ann_trained_rows == len(ns) and ns.ann.nlist == default_nlist(len(ns))
+        again = LocalVectorIndex(tmp, index_type="ivf", nprobe=4)
+        assert again._namespace(None).ann_trained_rows == len(ns)
+        assert again.query(vector=more[5], top_k=1)["matches"][0]["id"] == "more-5"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Upserts append to the segment; the base matrix is only rewritten when the segment is merged.
+        vectors = np.random.default_rng(5).normal(size=(6000, 16)).astype(np.float32)
+        index = LocalVectorIndex(tmp, quantization="int8")
+        index.upsert(vectors=[{"id": f"id-{i}", "values": v, "metadata": {"n": i}} for i, v in enumerate(vectors[:1000])])
+        base_file = Path(tmp) / DEFAULT_NAMESPACE / VECTORS_FILE
+        written = base_file.stat().st_mtime_ns
+        for start in range(1000, 5000, 1000):
+            index.upsert(vectors=[{"id": f"id-{i}", "values": vectors[i], "metadata": {"n": i}}
+                                  for i in range(start, start + 1000)])
+        ns = index._namespace(None)
+        assert base_file.stat().st_mtime_ns == written and ns.tail_rows == 4000 and len(ns.base) == 1000
+        index.upsert(vectors=[{"id": "id-3", "values": vectors[4321], "metadata": {"n": -3}}])
+        assert [m["id"] for m in index.query(vector=vectors[4321], top_k=2)["matches"]] == ["id-3", "id-4321"]
+        assert index.query(vector=vectors[2500], top_k=1, filter={"n": {"$gte": 2000}})["matches"][0]["id"] == "id-2500"
+
+        # A write torn by a crash is dropped when the segment is replayed.
+        with open(ns._segment_path("jsonl"), "ab") as fh:
+            fh.write(b'{"ids": ["torn"]')
+        reopened = LocalVectorIndex(tmp, quantization="int8")
+        assert reopened.fetch(ids=["id-3"])["vectors"]["id-3"]["metadata"] == {"n": -3}
+        assert reopened.describe_index_stats()["total_vector_count"] == 5000
+        reopened.upsert(vectors=[{"id": f"id-{i}", "values": vectors[i]} for i in range(5000, 6000)])
+        merged = reopened._namespace(None)
+        assert merged.tail_rows == 0 and len(merged.base) == 6000 and not merged.has_tombstones
+        assert [p.name for p in merged.path.glob("segment-*")] == []
+        assert reopened.query(vector=vectors[5999], top_k=1)["matches"][0]["id"] == "id-5999"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vectors = np.random.default_rng(2).normal(size=(2000, 128)).astype(np.float32)
+        exact = LocalVectorIndex(tmp)
+        exact.upsert(vectors=[{"id": f"id-{i}", "values": v} for i, v in enumerate(vectors)])
+        queries = vectors[:20] + np.random.default_rng(3).normal(scale=0.5, size=(20, 128)).astype(np.float32)
+        expected = [[m["id"] for m in exact.query(vector=q, top_k=5)["matches"]] for q in queries]
+        for quantization in ("int8", "float16"):
+            index = LocalVectorIndex(tmp, quantization=quantization)
+            found = [[m["id"] for m in index.query(vector=q, top_k=5)["matches"]] for q in queries]
+            assert np.mean([len(set(a) & set(b)) / 5 for a, b in zip(found, expected)]) >= 0.95
+            assert [[m["id"] for m in r["matches"]] for r in index.query_many(queries, top_k=5)] == found
+            assert np.isclose(index.query(vector=vectors[0], top_k=1)["matches"][0]["score"], 1.0, atol=1e-5)
+        index.delete(ids=["id-0"])
+        assert index.query(vector=vectors[0], top_k=1)["matches"][0]["id"] != "id-0"
+        assert LocalVectorIndex(tmp, quantization="float16")._namespace(None).codes.shape == (2000, 128)
+
+    print("LocalVectorIndex flat, quantized and IVF upsert/query/filter/delete test passed.")
+
+
+if __name__ == "__main__":
+    test()
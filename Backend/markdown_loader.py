@@ -1,23 +1,35 @@
+import argparse
 import hashlib
+import json
 import logging
 import math
+import os
 import re
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from dotenv import load_dotenv
 from google.genai.types import Content, Part
 
+from answer_cache import answer_cache_from_env
+from document_store import DocumentStore, document_store_from_env
 from llm_wrapper import LLMWrapper
 from vector_store_wrapper import VectorStoreWrapper
 from embedding_engine_wrapper import EmbeddingEngineWrapper
+from ingest_scheduler import RateLimiter, call_with_retries, estimate_tokens
+from lexical_index import DEFAULT_LEXICAL_INDEX_DIR, LexicalIndex, lexical_index_from_env
+from structure_chunker import DEFAULT_MAX_TOKENS, chunk_markdown, chunk_metadata
 
 INPUT_DIR = Path("./output/documents")
 PROCESSED_DIR = Path("./processed/documents")
+CHUNK_INDEX_SUFFIX = ".chunks.json"
 PAGE_DELIM_REGEX = re.compile(r"<\!-----\s*PAGE\s+\d+\s*------->", re.IGNORECASE)
 
-# Chunking parameters
+# Chunking parameters (CHUNKER=structure splits by section/article, CHUNKER=pages uses page windows)
+DEFAULT_CHUNKER = "structure"
 CHUNK_PAGE_COUNT = 5  # pages per chunk
 CHUNK_OVERLAP = 1     # overlap in pages between consecutive chunks
 _STEP = CHUNK_PAGE_COUNT - CHUNK_OVERLAP
@@ -25,6 +37,12 @@ _STEP = CHUNK_PAGE_COUNT - CHUNK_OVERLAP
 # Embedding parameters
 EMBED_BATCH_SIZE = 32  # number of texts per embedder batch call
 
+# Summarization scheduling (override with INGEST_WORKERS / INGEST_RPM / INGEST_TPM)
+DEFAULT_SUMMARY_WORKERS = 8
+DEFAULT_REQUESTS_PER_MINUTE = 120
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+SUMMARY_OUTPUT_TOKENS = 1024  # budgeted per call for the generated summary
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s – %(levelname)s – %(message)s")
 
 
@@ -45,6 +63,15 @@ def chunk_text(text: str) -> List[str]:
     return chunks
 
 
+def split_document(text: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Chunks of a document and the per-chunk metadata (page range, heading, provision) to store with them."""
+    if os.getenv("CHUNKER", DEFAULT_CHUNKER) == "pages":
+        chunks = chunk_text(text)
+        return chunks, [{} for _ in chunks]
+    units = chunk_markdown(text, max_tokens=int(os.getenv("CHUNK_MAX_TOKENS", DEFAULT_MAX_TOKENS)))
+    return [u["text"] for u in units], [chunk_metadata(u) for u in units]
+
+
 def deterministic_id(source: str) -> str:
     return hashlib.md5(source.encode("utf-8")).hexdigest()
 
@@ -94,65 +121,326 @@ def batch_embed(embedder: EmbeddingEngineWrapper, texts: List[str]) -> List[List
     return vectors
 
 
-def main():
+def summarize_chunk(llm_wrapper: LLMWrapper, limiter: RateLimiter, chunk: str, file_name: str, idx: int) -> str:
+    prompt = build_prompt(chunk, file_name, include_identity=(idx == 0))
+
+    def attempt() -> str:
+        # Every attempt, retries included, spends from the shared budget.
+        limiter.acquire(estimate_tokens(prompt) + SUMMARY_OUTPUT_TOKENS)
+        return llm_wrapper.generate(prompt)
+
+    return call_with_retries(attempt)
+
+
+def chunk_keys(chunks: List[str]) -> List[str]:
+    """Content keys for chunks: the chunk hash plus its occurrence number for repeated text."""
+    seen: Dict[str, int] = {}
+    keys = []
+    for chunk in chunks:
+        digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        keys.append(f"{digest}:{seen.get(digest, 0)}")
+        seen[digest] = seen.get(digest, 0) + 1
+    return keys
+
+
+def chunk_index_path(md_name: str) -> Path:
+    return PROCESSED_DIR / f"{Path(md_name).stem}{CHUNK_INDEX_SUFFIX}"
+
+
+def load_chunk_index(md_name: str) -> List[Dict[str, Any]]:
+    """Entries ``{key, id, summary}`` for the chunks last ingested from ``md_name``."""
+    path = chunk_index_path(md_name)
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))["chunks"]
+    processed = PROCESSED_DIR / md_name
+    if not processed.exists():
+        return []
+    # Ingested before chunk indexes existed: chunks were page windows with positional
+    # ids and the summaries were not kept, which is fine as long as they are unchanged.
+    chunks = chunk_text(processed.read_text(encoding="utf-8"))
+    return [
+        {"key": key, "id": deterministic_id(f"{md_name}-chunk{idx}"), "summary": None}
+        for idx, key in enumerate(chunk_keys(chunks))
+    ]
+
+
+def save_chunk_index(md_name: str, entries: List[Dict[str, Any]]) -> None:
+    path = chunk_index_path(md_name)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps({"document": md_name, "chunks": entries}, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def plan_document(md_path: Path, incremental: bool) -> Dict[str, Any] | None:
+    """Work for one document: which chunks need summarizing and which old vectors go away."""
+    chunks, chunk_meta = split_document(md_path.read_text(encoding="utf-8"))
+    if not chunks:
+        logging.warning("No summaries produced for %s", md_path.name)
+        return None
+    keys = chunk_keys(chunks)
+    previous = {entry["key"]: entry for entry in load_chunk_index(md_path.name)}
+    reusable = previous if incremental else {}
+
+    entries, pending = [], []
+    for idx, key in enumerate(keys):
+        if key in reusable:
+            entries.append(reusable[key])
+        else:
+            entries.append({"key": key, "id": deterministic_id(f"{md_path.name}-{key}"), "summary": None})
+            pending.append(idx)
+    kept_ids = {entry["id"] for entry in entries}
+    removed_ids = [entry["id"] for entry in previous.values() if entry["id"] not in kept_ids]
+    return {"chunks": chunks, "metadata": chunk_meta, "entries": entries, "pending": pending,
+            "removed_ids": removed_ids}
+
+
+def embed_input(chunk: str, summary: str | None) -> str:
+    return f"Summary:\n{summary}\n\nDocument Chunk:\n{chunk}"
+
+
+def lexical_text(chunk: str, summary: str | None) -> str:
+    # Summaries are English; the chunk keeps the original Nepali wording and numbering.
+    return f"{summary}\n{chunk}" if summary else chunk
+
+
+def vector_metadata(chunk: str, summary: str | None, meta: Dict[str, Any],
+                    document_store: DocumentStore | None) -> Dict[str, Any]:
+    """What is stored with a chunk's vector. With a document store the chunk text lives there, and
+    the summary, which only shaped the embedding, stays in the chunk index."""
+    if document_store is not None:
+        return dict(meta)
+    return {"document": chunk, "summary": summary, **meta}
+
+
+def store_document(md_path: Path, plan: Dict[str, Any], vector_store: VectorStoreWrapper,
+                   embedder: EmbeddingEngineWrapper, lexical_index: LexicalIndex | None = None,
+                   document_store: DocumentStore | None = None) -> bool:
+    chunks, entries, pending = plan["chunks"], plan["entries"], plan["pending"]
+    embed_inputs: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    ids: List[str] = []
+    for idx in pending:
+        summary = entries[idx]["summary"]
+        embed_inputs.append(embed_input(chunks[idx], summary))
+        metadatas.append(vector_metadata(chunks[idx], summary, plan["metadata"][idx], document_store))
+        ids.append(entries[idx]["id"])
+
+    # 2) Batch‑embed the (summary + chunk) pairs of new or changed chunks
+    try:
+        embeddings = batch_embed(embedder, embed_inputs) if embed_inputs else []
+    except RuntimeError:
+        logging.error("Skipping %s due to embedding errors", md_path.name)
+        return False
+
+    # 3) Delete vectors of chunks that disappeared and upsert the new ones. Texts go in
+    #    first, so every vector a query can find already has its text.
+    if document_store is not None:
+        document_store.put_many(ids, [chunks[idx] for idx in pending])
+    if plan["removed_ids"]:
+        vector_store.delete(ids=plan["removed_ids"])
+        logging.info("Deleted %d stale embeddings for %s", len(plan["removed_ids"]), md_path.name)
+
+    if embeddings:
+        vector_store.upsert(embeddings=embeddings, metadatas=metadatas, ids=ids)
+    logging.info("Upserted %d of %d chunks for %s into vector store", len(embeddings), len(chunks), md_path.name)
+
+    if lexical_index is not None:
+        lexical_index.delete(plan["removed_ids"])
+        lexical_index.upsert(ids, [lexical_text(chunks[idx], entries[idx]["summary"]) for idx in pending])
+    if document_store is not None:
+        document_store.delete(plan["removed_ids"])
+
+    # 4) Move processed file and record its chunk hashes for the next incremental run
+    save_chunk_index(md_path.name, entries)
+    shutil.copy2(md_path, PROCESSED_DIR / md_path.name)
+    logging.info("Moved %s to processed directory", md_path.name)
+    return True
+
+
+def main(incremental: bool = False, vector_store: VectorStoreWrapper | None = None,
+         embedder: EmbeddingEngineWrapper | None = None, llm_wrapper: LLMWrapper | None = None):
+    """Ingest new documents from INPUT_DIR; the clients default to the configured Gemini and vector store."""
     if not INPUT_DIR.exists():
         logging.error("Input directory %s does not exist", INPUT_DIR)
         return
     PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
-    vector_store = VectorStoreWrapper()
-    embedder = EmbeddingEngineWrapper()
-    llm_wrapper = LLMWrapper(model_name="gemini-2.5-flash")
+    vector_store = VectorStoreWrapper() if vector_store is None else vector_store
+    embedder = EmbeddingEngineWrapper() if embedder is None else embedder
+    # call_with_retries is the only retry layer: no policy retries, circuit breaker or model fallback.
+    llm_wrapper = (LLMWrapper(model_name="gemini-2.5-flash", fallback=False, retries=0, circuit_breaker=False)
+                   if llm_wrapper is None else llm_wrapper)
+    limiter = RateLimiter(
+        requests_per_minute=float(os.getenv("INGEST_RPM", DEFAULT_REQUESTS_PER_MINUTE)),
+        tokens_per_minute=float(os.getenv("INGEST_TPM", DEFAULT_TOKENS_PER_MINUTE)),
+    )
+    workers = int(os.getenv("INGEST_WORKERS", DEFAULT_SUMMARY_WORKERS))
+    lexical_index = lexical_index_from_env()
+    document_store = document_store_from_env()
 
+    plans: Dict[Path, Dict[str, Any]] = {}
     for md_path in INPUT_DIR.glob("*.md"):
         processed_target = PROCESSED_DIR / md_path.name
         if processed_target.exists():
-            logging.info("Skipping %s; already processed", md_path.name)
+            if not incremental:
+                logging.info("Skipping %s; already processed", md_path.name)
+                continue
+            if processed_target.read_bytes() == md_path.read_bytes() and chunk_index_path(md_path.name).exists():
+                logging.info("Skipping %s; unchanged since last ingestion", md_path.name)
+                continue
+        plan = plan_document(md_path, incremental)
+        if plan is None:
             continue
-
-        logging.info("Processing %s", md_path.name)
-        text = md_path.read_text(encoding="utf-8")
-        chunks = chunk_text(text)
-        # chunks = chunks[:3]
-
-        summaries: List[str] = []
-        embed_inputs: List[str] = []
-        metadatas: List[Dict[str, Any]] = []
-        ids: List[str] = []
-
-        # 1) Summarize each chunk sequentially
-        for idx, chunk in enumerate(chunks):
-            logging.info(f"Loading chunk {idx}/{len(chunks)}")
-            prompt = build_prompt(chunk, md_path.name, include_identity=(idx == 0))
-            summary = llm_wrapper.generate(prompt)
-            summaries.append(summary)
-            embed_inputs.append(f"Summary:\n{summary}\n\nDocument Chunk:\n{chunk}")
-            metadatas.append({"document": chunk, "summary": summary})
-            ids.append(deterministic_id(f"{md_path.name}-chunk{idx}"))
-
-        if not summaries:
-            logging.warning("No summaries produced for %s", md_path.name)
+        logging.info("%s: %d of %d chunks new or changed, %d removed", md_path.name, len(plan["pending"]),
+                     len(plan["chunks"]), len(plan["removed_ids"]))
+        plans[md_path] = plan
+
+    total_chunks = sum(len(plan["pending"]) for plan in plans.values())
+    logging.info("Summarizing %d chunks from %d documents with %d workers", total_chunks, len(plans), workers)
+    started = time.perf_counter()
+    ingested = 0
+    summarized = 0
+
+    # 1) Summarize chunks from all documents in parallel. A single writer thread embeds
+    #    and upserts each document as soon as its last chunk is done, while other
+    #    documents are still being summarized.
+    remaining = {p: len(plan["pending"]) for p, plan in plans.items()}
+    failed: set = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=1) as writer:
+        futures = {
+            pool.submit(summarize_chunk, llm_wrapper, limiter, plan["chunks"][idx], md_path.name, idx): (md_path, idx)
+            for md_path, plan in plans.items()
+            for idx in plan["pending"]
+        }
+        stores = {
+            writer.submit(store_document, md_path, plan, vector_store, embedder, lexical_index, document_store): md_path
+            for md_path, plan in plans.items()
+            if not plan["pending"]
+        }
+        for future in as_completed(futures):
+            md_path, idx = futures[future]
+            remaining[md_path] -= 1
+            try:
+                plans[md_path]["entries"][idx]["summary"] = future.result()
+                summarized += 1
+                logging.info("Summarized chunk %d/%d of %s (%d/%d overall)", idx + 1, len(plans[md_path]["chunks"]),
+                             md_path.name, summarized, total_chunks)
+            except Exception:
+                logging.exception("Summarizing chunk %d of %s failed", idx, md_path.name)
+                failed.add(md_path)
+            if remaining[md_path] == 0:
+                if md_path in failed:
+                    logging.error("Skipping %s; some chunks could not be summarized", md_path.name)
+                else:
+                    stores[writer.submit(store_document, md_path, plans[md_path], vector_store, embedder,
+                                         lexical_index, document_store)] = md_path
+        # A document that fails to store may already have changed the vector store, and the others
+        # are committed, so the lexical index and the answer cache are brought up to date regardless.
+        store_failures: Dict[Path, Exception] = {}
+        for future, md_path in stores.items():
+            try:
+                ingested += bool(future.result())
+            except Exception as e:
+                logging.exception("Storing %s failed", md_path.name)
+                store_failures[md_path] = e
+    changed = ingested or store_failures
+
+    # Rebuilding the postings is linear in the corpus, so it happens once per run rather than per document.
+    if changed and lexical_index is not None:
+        lexical_index.save()
+        logging.info("Saved lexical index with %d chunks", len(lexical_index))
+
+    elapsed = time.perf_counter() - started
+    logging.info("Ingested %d/%d documents: %d chunks in %.1fs (%.1f chunks/min)", ingested, len(plans),
+                 summarized, elapsed, summarized / elapsed * 60 if elapsed else 0.0)
+
+    # 5) Cached /chat answers were built against the old corpus
+    answer_cache = answer_cache_from_env()
+    if changed and answer_cache is not None:
+        version = answer_cache.invalidate_corpus()
+        logging.info("Invalidated cached answers; corpus version is now %d", version)
+
+    if store_failures:
+        names = ", ".join(p.name for p in store_failures)
+        raise RuntimeError(f"Storing {len(store_failures)} document(s) failed: {names}") from next(
+            iter(store_failures.values()))
+
+
+def rebuild_lexical_index() -> None:
+    """Index every processed document's chunks, e.g. for a corpus ingested before hybrid search existed."""
+    lexical_index = LexicalIndex(os.getenv("LEXICAL_INDEX_DIR", DEFAULT_LEXICAL_INDEX_DIR))
+    lexical_index.delete(list(lexical_index.sources))
+    for md_path in sorted(PROCESSED_DIR.glob("*.md")):
+        chunks, _ = split_document(md_path.read_text(encoding="utf-8"))
+        entries = load_chunk_index(md_path.name)
+        if len(entries) != len(chunks):
+            logging.warning("Chunk index of %s is out of date; skipping", md_path.name)
             continue
+        lexical_index.upsert([e["id"] for e in entries],
+                             [lexical_text(chunk, e["summary"]) for chunk, e in zip(chunks, entries)])
+    lexical_index.save()
+    logging.info("Rebuilt lexical index with %d chunks from %s", len(lexical_index), PROCESSED_DIR)
 
-        # 2) Batch‑embed all (summary + chunk) pairs
-        try:
-            embeddings = batch_embed(embedder, embed_inputs)
-        except RuntimeError:
-            logging.error("Skipping %s due to embedding errors", md_path.name)
-            continue
 
-        # 3) Delete old vectors and upsert new ones
-        vector_store.delete(ids=ids)
-        logging.info("Deleted any existing embeddings for %s", md_path.name)
+def reindex_vectors() -> None:
+    """Re-embed every processed chunk with the configured embedding backend and replace the vector store.
 
+    Summaries come from the chunk indexes, so nothing is re-summarized. Everything is
+    embedded before the old vectors are deleted, so a failure leaves the store intact.
+    """
+    embedder = EmbeddingEngineWrapper()
+    document_store = document_store_from_env()
+    ids: List[str] = []
+    texts: List[str] = []
+    inputs: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    for md_path in sorted(PROCESSED_DIR.glob("*.md")):
+        chunks, chunk_meta = split_document(md_path.read_text(encoding="utf-8"))
+        entries = load_chunk_index(md_path.name)
+        if len(entries) != len(chunks):
+            logging.warning("Chunk index of %s is out of date; skipping", md_path.name)
+            continue
+        for chunk, meta, entry in zip(chunks, chunk_meta, entries):
+            ids.append(entry["id"])
+            texts.append(chunk)
+            inputs.append(embed_input(chunk, entry["summary"]))
+            metadatas.append(vector_metadata(chunk, entry["summary"], meta, document_store))
+
+    started = time.perf_counter()
+    embeddings = batch_embed(embedder, inputs)
+    elapsed = time.perf_counter() - started
+    logging.info("Embedded %d chunks with %s in %.1fs (%.1f chunks/s)", len(embeddings), embedder.model_name,
+                 elapsed, len(embeddings) / elapsed if elapsed else 0.0)
+
+    if document_store is not None:
+        document_store.put_many(ids, texts)
+        document_store.delete(list(set(document_store.entries) - set(ids)))
+    vector_store = VectorStoreWrapper()
+    vector_store.delete(delete_all=True)
+    if embeddings:
         vector_store.upsert(embeddings=embeddings, metadatas=metadatas, ids=ids)
-        logging.info("Upserted %d chunks for %s into vector store", len(embeddings), md_path.name)
+    logging.info("Replaced the vector store with %d vectors", len(embeddings))
 
-        # 4) Move processed file
-        shutil.copy2(md_path, processed_target)
-        logging.info("Moved %s to processed directory", md_path.name)
+    # Cached answers are matched on query embeddings from the previous model.
+    answer_cache = answer_cache_from_env()
+    if answer_cache is not None:
+        answer_cache.invalidate_corpus()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize, embed and index Markdown documents.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="re-check processed documents and re-ingest only chunks whose content changed")
+    parser.add_argument("--rebuild-lexical", action="store_true",
+                        help="rebuild the BM25 index from the processed documents instead of ingesting")
+    parser.add_argument("--reindex", action="store_true",
+                        help="re-embed the processed documents with the configured embedding backend and "
+                             "replace the vector store instead of ingesting")
+    args = parser.parse_args()
     load_dotenv()
-    main()
+    if args.rebuild_lexical:
+        rebuild_lexical_index()
+    elif args.reindex:
+        reindex_vectors()
+    else:
+        main(incremental=args.incremental or os.getenv("INGEST_INCREMENTAL", "").lower() in ("1", "true", "on"))
@@ -0,0 +1,248 @@
+"""In-process metrics and per-request tracing, rendered in the Prometheus text format.
+
+``span("translate")`` times a block into the ``rag_stage_seconds`` histogram,
+counts exceptions in ``rag_stage_errors_total`` and, while a ``RequestTrace`` is
+active, adds the duration to that request's timings. Gauges for caches and other
+components are read at scrape time from functions passed to ``register_gauges``.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# Seconds; spans from sub-millisecond BM25 lookups to multi-minute answer streams.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# One JSON object per finished /chat request on stderr, independent of the root logger's level.
+request_log = logging.getLogger("rag_server.requests")
+if os.getenv("REQUEST_LOG", "on").lower() not in ("off", "0", "false") and not request_log.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    request_log.addHandler(_handler)
+    request_log.setLevel(logging.INFO)
+    request_log.propagate = False
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (k + '="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(k)} {v:g}" for k, v in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> (per-bucket counts with a final +Inf slot, sum, count)
+        self._values: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+stage_seconds = Histogram("rag_stage_seconds", "Duration of pipeline stages and upstream calls.")
+stage_errors = Counter("rag_stage_errors_total", "Exceptions raised inside a stage.")
+requests_total = Counter("rag_requests_total", "Finished /chat requests by route and outcome.")
+request_seconds = Histogram("rag_request_seconds", "Total /chat stream duration.")
+time_to_first_token = Histogram("rag_time_to_first_token_seconds", "Time from request start to the first answer chunk.")
+llm_tokens = Counter("rag_llm_tokens_total", "Gemini tokens by model and kind (prompt, output).")
+embedded_texts = Counter("rag_embedded_texts_total", "Texts sent to the embedding model.")
+upstream_calls = Counter("rag_upstream_calls_total", "Upstream call outcomes by model (ok, retry, timeout, error, "
+                         "hedged, hedge_won, fallback, circuit_open, circuit_opened).")
+
+_metrics = [stage_seconds, stage_errors, requests_total, request_seconds, time_to_first_token, llm_tokens,
+            embedded_texts, upstream_calls]
+_gauges: List[Tuple[str, Callable[[], Dict[str, float] | None]]] = []
+
+_current_trace: contextvars.ContextVar["RequestTrace | None"] = contextvars.ContextVar("rag_trace", default=None)
+
+
+def register_gauges(prefix: str, read: Callable[[], Dict[str, float] | None]) -> None:
+    """Expose the numeric fields of ``read()`` (e.g. a cache's ``stats()``) as ``<prefix>_<field>`` gauges."""
+    _gauges.append((prefix, read))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines += metric.render()
+    for prefix, read in _gauges:
+        try:
+            values = read() or {}
+        except Exception:
+            logging.exception("Reading %s gauges failed", prefix)
+            continue
+        for field, value in sorted(values.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines += [f"# TYPE {prefix}_{field} gauge", f"{prefix}_{field} {value:g}"]
+    return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    """Timings and token counts of one /chat request, summed per stage."""
+
+    def __init__(self):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, int] = {}
+        self.ttft: float | None = None
+        self.route = "unknown"
+        # Spans of one request can end concurrently on the retrieval threads.
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_tokens(self, kind: str, count: int) -> None:
+        with self._lock:
+            self.tokens[kind] = self.tokens.get(kind, 0) + count
+
+    def first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+            time_to_first_token.observe(self.ttft)
+
+    def timings(self) -> Dict[str, float]:
+        timings = {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+        if self.ttft is not None:
+            timings["time_to_first_token"] = round(self.ttft, 4)
+        timings["total"] = round(time.perf_counter() - self.started, 4)
+        return timings
+
+    def finish(self, outcome: str, **fields) -> None:
+        """Record the request metrics and write its structured log line."""
+        timings = self.timings()
+        requests_total.inc(route=self.route, outcome=outcome)
+        request_seconds.observe(timings["total"], route=self.route)
+        request_log.info(json.dumps({"event": "chat_request", "request_id": self.request_id, "route": self.route,
+                                     "outcome": outcome, "timings": timings, "tokens": self.tokens, **fields},
+                                    ensure_ascii=False))
+
+
+def start_trace() -> RequestTrace:
+    """Begin tracing the current request; spans in this thread or task (and ``to_thread`` calls) join it."""
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace() -> None:
+    _current_trace.set(None)
+
+
+def current_trace() -> "RequestTrace | None":
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage: str, **labels) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            stage_errors.inc(stage=stage, error=type(e).__name__, **labels)
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        stage_seconds.observe(seconds, stage=stage, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+
+def record_tokens(model: str, usage) -> None:
+    """Count the prompt and output tokens of a Gemini response's ``usage_metadata``."""
+    if usage is None:
+        return
+    trace = _current_trace.get()
+    for kind, count in (("prompt", usage.prompt_token_count), ("output", usage.candidates_token_count)):
+        if count:
+            llm_tokens.inc(count, model=model, kind=kind)
+            if trace is not None:
+                trace.add_tokens(kind, count)
+
+
+def test():
+    trace = start_trace()
+    with span("translate"):
+        time.sleep(0.01)
+    try:
+        with span("retrieve"):
+            raise ValueError("Embedding failed")
+    except ValueError:
+        pass
+    trace.first_token()
+    end_trace()
+    assert set(trace.timings()) == {"translate", "retrieve", "time_to_first_token", "total"}
+    assert trace.stages["translate"] >= 0.01
+
+    register_gauges("rag_test_cache", lambda: {"hits": 3, "hit_rate": 0.75, "label": "x"})
+    text = render()
+    assert 'rag_stage_seconds_bucket{stage="translate",le="0.025"} 1' in text
+    assert 'rag_stage_seconds_count{stage="translate"} 1' in text
+    assert 'rag_stage_errors_total{error="ValueError",stage="retrieve"} 1' in text
+    assert "rag_test_cache_hit_rate 0.75" in text and "rag_test_cache_label" not in text
+    print("Metrics span/histogram/render test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,166 @@
+"""Move a corpus ingested before the document store to the compact storage layout.
+
+    python migrate_storage.py
+    python migrate_storage.py --dry-run
+
+Older ingestion runs stored each chunk's full text (``document``) and its summary as
+metadata on the vector, so both were loaded with the local index and sent back
+with every Pinecone match. This copies the texts into the document store
+(``DOCUMENT_STORE_DIR``) and the summaries into the chunk indexes next to the
+processed documents (``<name>.chunks.json``, where ``reindex_vectors`` and the
+lexical index read them), then rewrites the vector metadata without them. A
+summary whose vector has no chunk index entry stays in the metadata, since it
+is the only copy. On the local backend, opening the index with
+``LOCAL_INDEX_QUANTIZATION`` set also writes the quantized copy of the vectors.
+``--dry-run`` reports how many texts and summaries would move and how many
+summaries would have to stay.
+
+Texts and summaries are stored before any metadata is rewritten, so an
+interrupted run is finished by running it again.
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+
+from document_store import document_store_from_env
+from local_vector_index import DEFAULT_NAMESPACE, VECTORS_FILE
+from markdown_loader import PROCESSED_DIR, load_chunk_index, save_chunk_index
+from vector_store_wrapper import VectorStoreWrapper
+
+# Metadata that moves to the document store or is dropped with it.
+MOVED_FIELDS = ("document", "text")
+PINECONE_PAGE_SIZE = 100
+
+
+class SummaryBackfill:
+    """Chunk index entries by vector id, to give the summaries leaving the vector metadata a home."""
+
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.indexes = {md.name: load_chunk_index(md.name) for md in sorted(PROCESSED_DIR.glob("*.md"))}
+        self.entries = {entry["id"]: (name, entry) for name, entries in self.indexes.items() for entry in entries}
+        self.copied = self.present = self.kept = 0
+
+    def place(self, summaries: Dict[str, str]) -> set:
+        """Record ``summaries`` (vector id -> summary) in the chunk indexes; returns the ids that have no entry."""
+        homeless, dirty = set(), set()
+        for id_, summary in summaries.items():
+            if id_ not in self.entries:
+                homeless.add(id_)
+                continue
+            name, entry = self.entries[id_]
+            if entry["summary"] is None:
+                entry["summary"] = summary
+                dirty.add(name)
+                self.copied += 1
+            else:
+                self.present += 1
+        if not self.dry_run:
+            for name in dirty:
+                save_chunk_index(name, self.indexes[name])
+        self.kept += len(homeless)
+        return homeless
+
+
+def directory_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def migrate_local(vector_store: VectorStoreWrapper, documents, summaries: SummaryBackfill,
+                  dry_run: bool) -> Tuple[int, int, int]:
+    index = vector_store.index
+    root = index.root
+    before = directory_bytes(root)
+    moved = 0
+    for path in sorted(p for p in root.iterdir() if (p / VECTORS_FILE).exists()):
+        ns = index._namespace(None if path.name == DEFAULT_NAMESPACE else path.name)
+        texts = ns.columns.get("document") or ns.columns.get("text") or []
+        rows = [(id_, text) for id_, text in zip(ns.ids, texts) if id_ is not None and text is not None]
+        column = ns.columns.get("summary") or []
+        homeless = summaries.place({id_: summary for id_, summary in zip(ns.ids, column)
+                                    if id_ is not None and summary is not None})
+        logging.info("%s: %d of %d vectors carry their text", path.name, len(rows), len(ns))
+        if dry_run or not (rows or column):
+            continue
+        documents.put_many([id_ for id_, _ in rows], [text for _, text in rows])
+        for field in MOVED_FIELDS:
+            ns.columns.pop(field, None)
+        if homeless:
+            ns.columns["summary"] = [summary if id_ in homeless else None for id_, summary in zip(ns.ids, column)]
+        else:
+            ns.columns.pop("summary", None)
+        ns._save()
+        moved += len(rows)
+    return moved, before, directory_bytes(root)
+
+
+def pinecone_pages(index) -> Iterator[List[str]]:
+    for page in index.list(namespace="", limit=PINECONE_PAGE_SIZE):
+        yield list(page)
+
+
+def migrate_pinecone(vector_store: VectorStoreWrapper, documents, summaries: SummaryBackfill,
+                     dry_run: bool) -> Tuple[int, int, int]:
+    index = vector_store.index
+    moved = before = after = 0
+    for ids in pinecone_pages(index):
+        vectors = index.fetch(ids=ids, namespace="").vectors
+        homeless = summaries.place({id_: vector.metadata["summary"] for id_, vector in vectors.items()
+                                    if (vector.metadata or {}).get("summary") is not None})
+        slim: List[Dict[str, Any]] = []
+        texts: Dict[str, str] = {}
+        for id_, vector in vectors.items():
+            metadata = dict(vector.metadata or {})
+            before += len(json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+            text = metadata.get("document") or metadata.get("text")
+            if text is None:
+                after += len(json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+                continue
+            texts[id_] = text
+            for field in MOVED_FIELDS:
+                metadata.pop(field, None)
+            if id_ not in homeless:
+                metadata.pop("summary", None)
+            after += len(json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+            slim.append({"id": id_, "values": list(vector.values), "metadata": metadata})
+        if dry_run or not slim:
+            continue
+        documents.put_many(list(texts), list(texts.values()))
+        index.upsert(vectors=slim, namespace="")
+        moved += len(slim)
+    return moved, before, after
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="report what would move without rewriting any metadata")
+    args = parser.parse_args()
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s – %(levelname)s – %(message)s")
+
+    documents = document_store_from_env()
+    if documents is None:
+        raise SystemExit("DOCUMENT_STORE is off; there is nowhere to move the chunk texts")
+    vector_store = VectorStoreWrapper()
+    summaries = SummaryBackfill(args.dry_run)
+    if vector_store.backend == "local":
+        moved, before, after = migrate_local(vector_store, documents, summaries, args.dry_run)
+        what = "index directory"
+    else:
+        moved, before, after = migrate_pinecone(vector_store, documents, summaries, args.dry_run)
+        what = "vector metadata"
+    logging.info("%s %d summaries into the chunk indexes (%d already there); %d have no chunk index entry and %s "
+                 "in the vector metadata", "Would copy" if args.dry_run else "Copied", summaries.copied,
+                 summaries.present, summaries.kept, "would stay" if args.dry_run else "stay")
+    stats = documents.stats()
+    logging.info("Moved %d chunk texts; %s %.1f MB -> %.1f MB; document store holds %d texts in %.1f MB "
+                 "(%.1fx compression)", moved, what, before / 1e6, after / 1e6, stats["documents"],
+                 stats["stored_bytes"] / 1e6, stats["compression_ratio"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,35 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from io import BytesIO
-from typing import List
+from typing import Any, Container, Dict, Iterator, List, Tuple
 
 from dotenv import load_dotenv
 from google.genai.types import Content, Part
 from pypdf import PdfReader, PdfWriter
 from llm_wrapper import LLMWrapper
+from ingest_scheduler import call_with_retries
 
 INPUT_DIR = Path("./input/documents")
 OUTPUT_DIR = Path("./output/documents")
 INTERMEDIATE_DIR = OUTPUT_DIR / "intermediate"
+MANIFEST_PATH = INTERMEDIATE_DIR / "manifest.json"
 PAGES_PER_CHUNK = 5
+MAX_BUFFERED_WINDOWS_PER_WORKER = 2
+# Transcribing five dense pages can take minutes; a flash fallback would lower transcription quality.
+CONVERSION_DEADLINE_SECONDS = 600.0
+
+STATUS_PENDING = "pending"
+STATUS_IN_FLIGHT = "in-flight"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
 
 CONVERSION_PROMPT = """SYSTEM (role = expert document-to-markdown converter):
 You are a specialist in PDF structure recovery, optical character recognition, Nepali-language handling, legacy-font transliteration, and Markdown formatting for retrieval-augmented generation (RAG) pipelines.
@@ -71,59 +90,188 @@ CONSTRAINTS
 BEGIN.
 """
 
-def pdf_to_byte_chunks(pdf_path: Path, pages_per_chunk: int = PAGES_PER_CHUNK) -> List[bytes]:
+def iter_page_windows(pdf_path: Path, pages_per_chunk: int = PAGES_PER_CHUNK, only: Container[int] | None = None,
+                      spool_dir: Path | None = None) -> Iterator[Tuple[int, bytes | Path]]:
+    """Lazily yield ``(window number, sub-PDF)`` for each ``pages_per_chunk``-page window.
+
+    Each window is built only when the consumer asks for it, so memory is bounded by
+    the windows the consumer still holds. ``only`` restricts output to the given
+    (1-based) window numbers; with ``spool_dir`` each window is written to a temp
+    file there and its path is yielded instead of the bytes.
+    """
     reader = PdfReader(str(pdf_path))
-    chunks: List[bytes] = []
-    for start in range(0, len(reader.pages), pages_per_chunk):
+    page_count = len(reader.pages)
+    for idx, start in enumerate(range(0, page_count, pages_per_chunk), start=1):
+        if only is not None and idx not in only:
+            continue
         writer = PdfWriter()
-        for p in range(start, min(start + pages_per_chunk, len(reader.pages))):
+        for p in range(start, min(start + pages_per_chunk, page_count)):
             writer.add_page(reader.pages[p])
-        buf = BytesIO()
-        writer.write(buf)
-        chunks.append(buf.getvalue())
-    return chunks
+        if spool_dir is not None:
+            spool_dir.mkdir(parents=True, exist_ok=True)
+            fd, name = tempfile.mkstemp(prefix=f"{pdf_path.stem}_window{idx}_", suffix=".pdf", dir=spool_dir)
+            with os.fdopen(fd, "wb") as fh:
+                writer.write(fh)
+            yield idx, Path(name)
+        else:
+            buf = BytesIO()
+            writer.write(buf)
+            yield idx, buf.getvalue()
 
-def run_llm_on_chunk(llm: LLMWrapper, chunk_bytes: bytes) -> str:
+
+def pdf_to_byte_chunks(pdf_path: Path, pages_per_chunk: int = PAGES_PER_CHUNK) -> Iterator[bytes]:
+    for _, chunk_bytes in iter_page_windows(pdf_path, pages_per_chunk):
+        yield chunk_bytes
+
+def run_llm_on_chunk(llm: LLMWrapper, chunk: bytes | Path) -> str:
+    chunk_bytes = chunk.read_bytes() if isinstance(chunk, Path) else chunk
     messages = Content(parts=[
         Part.from_text(text=CONVERSION_PROMPT),
         Part.from_bytes(data=chunk_bytes, mime_type="application/pdf")
     ])
     return llm.generate(messages).strip()
 
-def convert_pdf(pdf_path: Path, llm: LLMWrapper) -> None:
-    final_md_path = OUTPUT_DIR / f"{pdf_path.stem}.md"
-    if final_md_path.exists():
-        print(f"✓ Skipping {pdf_path.name}: final Markdown already exists.")
-        return
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class ConversionManifest:
+    """JSON record of every page window's status, so an interrupted run resumes where it stopped.
+
+    A window is reused only if it is ``done`` with the same PDF hash and prompt hash;
+    editing ``CONVERSION_PROMPT`` or replacing a PDF re-runs just the stale windows.
+    """
 
-    print(f"→ Processing {pdf_path.name}")
-    markdown_parts: List[str] = []
-    chunks = pdf_to_byte_chunks(pdf_path)
+    def __init__(self, path: Path = MANIFEST_PATH):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            self.entries = json.loads(path.read_text(encoding="utf-8")).get("chunks", {})
+        self._lock = threading.Lock()
 
-    for idx, chunk_bytes in enumerate(chunks, start=1):
+    @staticmethod
+    def key(pdf_path: Path, idx: int) -> str:
+        return f"{pdf_path.name}#{idx}"
+
+    def is_current(self, pdf_path: Path, idx: int, pdf_hash: str, prompt_hash: str) -> bool:
+        entry = self.entries.get(self.key(pdf_path, idx))
+        return (
+            entry is not None
+            and entry["status"] == STATUS_DONE
+            and entry["pdf_hash"] == pdf_hash
+            and entry["prompt_hash"] == prompt_hash
+            and Path(entry["path"]).exists()
+        )
+
+    def update(self, pdf_path: Path, idx: int, status: str, **fields: Any) -> None:
+        with self._lock:
+            entry = self.entries.setdefault(self.key(pdf_path, idx), {"pdf": pdf_path.name, "window": idx})
+            entry.update(fields, status=status, updated=time.time())
+            atomic_write_text(self.path, json.dumps({"chunks": self.entries}, ensure_ascii=False, indent=1))
+
+
+def convert_all(pdf_paths: List[Path], llm: LLMWrapper, workers: int = 1, spool_dir: Path | None = None) -> None:
+    """Convert every page window of every PDF on a pool of ``workers`` threads."""
+    prompt_hash = hashlib.sha256(CONVERSION_PROMPT.encode("utf-8")).hexdigest()
+    manifest = ConversionManifest()
+    plans = {}
+    for pdf_path in pdf_paths:
+        pdf_hash = file_sha256(pdf_path)
+        window_count = math.ceil(len(PdfReader(str(pdf_path)).pages) / PAGES_PER_CHUNK)
+        stale = []
+        for idx in range(1, window_count + 1):
+            chunk_md_path = INTERMEDIATE_DIR / f"{pdf_path.stem}_chunk{idx}.md"
+            if manifest.is_current(pdf_path, idx, pdf_hash, prompt_hash):
+                continue
+            if manifest.key(pdf_path, idx) not in manifest.entries and chunk_md_path.exists():
+                # Chunk cached by a run that predates the manifest: adopt it.
+                manifest.update(pdf_path, idx, STATUS_DONE, pdf_hash=pdf_hash, prompt_hash=prompt_hash,
+                                path=str(chunk_md_path))
+                continue
+            manifest.update(pdf_path, idx, STATUS_PENDING, pdf_hash=pdf_hash, prompt_hash=prompt_hash,
+                            path=str(chunk_md_path))
+            stale.append(idx)
+        final_md_path = OUTPUT_DIR / f"{pdf_path.stem}.md"
+        if not stale and final_md_path.exists():
+            print(f"✓ Skipping {pdf_path.name}: final Markdown already exists.")
+            continue
+        print(f"→ Processing {pdf_path.name}: {len(stale)}/{window_count} windows to convert")
+        plans[pdf_path] = (window_count, stale)
+
+    def convert_window(pdf_path: Path, idx: int, chunk: bytes | Path) -> None:
         chunk_md_path = INTERMEDIATE_DIR / f"{pdf_path.stem}_chunk{idx}.md"
+        manifest.update(pdf_path, idx, STATUS_IN_FLIGHT)
+        try:
+            md_chunk = call_with_retries(lambda: run_llm_on_chunk(llm, chunk))
+            atomic_write_text(chunk_md_path, md_chunk)
+        except Exception as e:
+            manifest.update(pdf_path, idx, STATUS_FAILED, error=str(e))
+            raise
+        finally:
+            if isinstance(chunk, Path):
+                chunk.unlink(missing_ok=True)
+        manifest.update(pdf_path, idx, STATUS_DONE, error=None)
+        print(f"  • Generated {pdf_path.name} chunk {idx}")
 
-        if chunk_md_path.exists():
-            print(f"  • Using cached chunk {idx}/{len(chunks)}")
-            md_chunk = chunk_md_path.read_text(encoding="utf-8").strip()
-        else:
-            print(f"  • Generating chunk {idx}/{len(chunks)}")
-            md_chunk = run_llm_on_chunk(llm, chunk_bytes)
-            chunk_md_path.write_text(md_chunk, encoding="utf-8")
+    # Windows are cut from the PDFs only as worker slots free up, so at most
+    # MAX_BUFFERED_WINDOWS_PER_WORKER * workers sub-PDFs exist at any time.
+    slots = threading.BoundedSemaphore(workers * MAX_BUFFERED_WINDOWS_PER_WORKER)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for pdf_path, (_, stale) in plans.items():
+            for idx, chunk in iter_page_windows(pdf_path, only=set(stale), spool_dir=spool_dir):
+                slots.acquire()
+                future = pool.submit(convert_window, pdf_path, idx, chunk)
+                future.add_done_callback(lambda _: slots.release())
+                futures[future] = pdf_path
+        failed = set()
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                failed.add(futures[future])
+                print(f"  ✗ {futures[future].name}: {future.exception()}")
+
+    for pdf_path, (window_count, _) in plans.items():
+        if pdf_path in failed:
+            print(f"  ✗ Not assembling {pdf_path.name}; rerun to retry the failed windows")
+            continue
+        markdown_parts = [
+            (INTERMEDIATE_DIR / f"{pdf_path.stem}_chunk{idx}.md").read_text(encoding="utf-8").strip()
+            for idx in range(1, window_count + 1)
+        ]
+        final_md_path = OUTPUT_DIR / f"{pdf_path.stem}.md"
+        atomic_write_text(final_md_path, "\n\n".join(markdown_parts))
+        print(f"  → Saved final Markdown to {final_md_path}")
 
-        markdown_parts.append(md_chunk)
 
-    combined_md = "\n\n".join(markdown_parts)
-    final_md_path.write_text(combined_md, encoding="utf-8")
-    print(f"  → Saved final Markdown to {final_md_path.relative_to(Path.cwd())}")
+def convert_pdf(pdf_path: Path, llm: LLMWrapper) -> None:
+    convert_all([pdf_path], llm)
+
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert PDFs in ./input/documents to Markdown.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("PDF_WORKERS", "1")),
+                        help="page windows converted concurrently, across all PDFs")
+    parser.add_argument("--spool", action="store_true",
+                        help="hold pending page windows in temp files instead of memory")
+    args = parser.parse_args()
+
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     INTERMEDIATE_DIR.mkdir(parents=True, exist_ok=True)
 
-    llm = LLMWrapper()
-    for pdf in sorted(INPUT_DIR.glob("*.pdf")):
-        convert_pdf(pdf, llm)
+    # call_with_retries is the only retry layer: no policy retries or circuit breaker.
+    llm = LLMWrapper(deadline=CONVERSION_DEADLINE_SECONDS, fallback=False, retries=0, circuit_breaker=False)
+    convert_all(sorted(INPUT_DIR.glob("*.pdf")), llm, workers=args.workers,
+                spool_dir=INTERMEDIATE_DIR / "spool" if args.spool else None)
 
 if __name__ == "__main__":
     load_dotenv()
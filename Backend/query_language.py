@@ -0,0 +1,49 @@
+import re
+
+LANG_ENGLISH = "en"
+LANG_NEPALI = "ne"
+LANG_ROMANIZED_NEPALI = "ne-Latn"
+
+_DEVANAGARI = re.compile(r"[ऀ-ॿ]")
+_LATIN_WORD = re.compile(r"[a-z]+")
+
+# Frequent Romanized Nepali function words and legal vocabulary that rarely occur in English text.
+ROMANIZED_NEPALI_MARKERS = frozenset(
+    """
+    ko ka ki ma le lai bata sanga ra ni pani ho hoina hunchha huncha hunchha chha cha chhan chan chhaina chaina
+    thiyo garna garne gareko garnu garchha garcha paune pauna sakchha sakcha sakinchha sakincha kati kasari ke kun
+    kaha kahile kina kasle kasko hamro mero timro tapai tapaiko yo tyo yasko tyasko bhane bhaneko bhanne lagi
+    lagchha lagcha huna hune bhayo bhaeko nagarik nagarikta sambidhan samvidhan kanun ain niyam adhikar kar
+    rajya sarkar adalat muddha jagga sampatti bibaha vivah rahadani mulya abhivriddhi
+    """.split()
+)
+
+
+def detect_language(text: str) -> str:
+    """Classify a query as Nepali (Devanagari), Romanized Nepali or English."""
+    letters = [c for c in text if c.isalpha()]
+    if not letters:
+        return LANG_ENGLISH
+    devanagari = sum(1 for c in letters if _DEVANAGARI.match(c))
+    if devanagari / len(letters) > 0.3:
+        return LANG_NEPALI
+
+    words = _LATIN_WORD.findall(text.lower())
+    if not words:
+        return LANG_ENGLISH
+    markers = sum(1 for w in words if w in ROMANIZED_NEPALI_MARKERS)
+    if markers >= 2 or markers / len(words) >= 0.25:
+        return LANG_ROMANIZED_NEPALI
+    return LANG_ENGLISH
+
+
+def test():
+    assert detect_language("What is the voting age in Nepal?") == LANG_ENGLISH
+    assert detect_language("नेपालमा मतदान गर्ने उमेर कति हो?") == LANG_NEPALI
+    assert detect_language("Nepal ma vote garne umer kati ho?") == LANG_ROMANIZED_NEPALI
+    assert detect_language("nagarikta kasari paune?") == LANG_ROMANIZED_NEPALI
+    print("detect_language test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,106 @@
+import json
+import os
+import re
+import statistics
+import threading
+from collections import deque
+from typing import Deque, Dict, List
+
+from query_language import LANG_ENGLISH, detect_language
+
+ROUTE_DIRECT = "direct"        # simple English question: retrieve with it as-is
+ROUTE_TRANSLATE = "translate"  # everything else: translate_query first
+ROUTE_FULL = "full"            # QUERY_ROUTING=off: every question translated by the answer model
+ROUTE_CACHED = "cached"        # answered from the semantic answer cache
+
+DEFAULT_TRANSLATE_MODEL = "gemini-2.5-flash"
+SIMPLE_MAX_WORDS = 20
+TTFT_SAMPLES = 1000
+
+_WORD = re.compile(r"\w+")
+# Comparisons and calculations need the sub-query decomposition of translate_query.
+_COMPLEX_MARKERS = re.compile(
+    r"\b(compare|comparison|versus|vs|difference|differ|between|calculate|calculation|compute|how much|"
+    r"total|amount|percent|percentage|deduct\w*|exempt\w*|rs|npr|rupees?)\b",
+    re.IGNORECASE,
+)
+_LARGE_NUMBER = re.compile(r"\d[\d,]{3,}")
+
+
+def query_routing_enabled() -> bool:
+    return os.getenv("QUERY_ROUTING", "on").lower() not in ("off", "0", "false")
+
+
+def speculative_retrieval_enabled() -> bool:
+    return os.getenv("SPECULATIVE_RETRIEVAL", "off").lower() in ("on", "1", "true")
+
+
+def is_simple_question(text: str) -> bool:
+    """A short, single English question without comparisons, amounts or calculations."""
+    return (
+        detect_language(text) == LANG_ENGLISH
+        and len(_WORD.findall(text)) <= SIMPLE_MAX_WORDS
+        and text.count("?") <= 1
+        and not _COMPLEX_MARKERS.search(text)
+        and not _LARGE_NUMBER.search(text)
+    )
+
+
+def route_query(queries: List[str]) -> str:
+    """Route a /chat request; follow-ups depend on the history and always go through translation."""
+    if len(queries) == 1 and is_simple_question(queries[0]):
+        return ROUTE_DIRECT
+    return ROUTE_TRANSLATE
+
+
+def direct_translation(question: str) -> str:
+    """What translate_query would return for a question that needs no rewriting."""
+    return json.dumps({"en": [], "originalQuestion": question.strip()}, ensure_ascii=False)
+
+
+class RouteStats:
+    """Time to first answer token per route, over the last ``TTFT_SAMPLES`` requests of each."""
+
+    def __init__(self):
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, ttft_seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(route, deque(maxlen=TTFT_SAMPLES)).append(ttft_seconds)
+            self._counts[route] = self._counts.get(route, 0) + 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            stats = {}
+            for route, samples in self._samples.items():
+                ordered = sorted(samples)
+                stats[route] = {
+                    "requests": self._counts[route],
+                    "ttft_p50_s": statistics.median(ordered),
+                    "ttft_p95_s": ordered[int(0.95 * (len(ordered) - 1))],
+                    "ttft_mean_s": statistics.fmean(ordered),
+                }
+        return stats
+
+
+def test():
+    assert route_query(["What is the voting age in Nepal?"]) == ROUTE_DIRECT
+    assert route_query(["Who can get citizenship by descent?"]) == ROUTE_DIRECT
+    assert route_query(["नेपालमा मतदान गर्ने उमेर कति हो?"]) == ROUTE_TRANSLATE
+    assert route_query(["Nepal ma vote garne umer kati ho?"]) == ROUTE_TRANSLATE
+    assert route_query(["Compare citizenship by birth and by descent."]) == ROUTE_TRANSLATE
+    assert route_query(["How much income tax do I pay on a salary of 1,200,000?"]) == ROUTE_TRANSLATE
+    assert route_query(["What is the voting age?", "And for local elections?"]) == ROUTE_TRANSLATE
+    assert json.loads(direct_translation(" What is the voting age? "))["originalQuestion"] == "What is the voting age?"
+
+    stats = RouteStats()
+    for seconds in (1.0, 2.0, 3.0):
+        stats.record(ROUTE_DIRECT, seconds)
+    assert stats.stats()[ROUTE_DIRECT]["ttft_p50_s"] == 2.0
+    print("Query routing test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -1,21 +1,105 @@
+import logging
+import os
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
 from dotenv import load_dotenv
 from flask import Flask, request, Response, json
 from flask_cors import CORS
+import clients
+import metrics
 from llm_wrapper import LLMWrapper
 from vector_store_wrapper import VectorStoreWrapper
 from embedding_engine_wrapper import EmbeddingEngineWrapper
+from answer_cache import answer_cache_from_env, normalize_query
+from context_assembly import assemble_context, count_tokens
+from conversation_store import conversation_store_from_env
+from document_store import document_store_from_env
+from lexical_index import lexical_index_from_env
+from reranker import reranker_from_env
+from request_coalescer import RequestCoalescer, coalesce_key, coalescing_enabled
+from query_language import detect_language
+from query_router import (
+    DEFAULT_TRANSLATE_MODEL,
+    ROUTE_CACHED,
+    ROUTE_DIRECT,
+    ROUTE_FULL,
+    RouteStats,
+    direct_translation,
+    query_routing_enabled,
+    route_query,
+    speculative_retrieval_enabled,
+)
 
 load_dotenv()
 
 STATUS_PROCESSING = "processing"
 STATUS_RESULT = "result"
 
+# Reciprocal-rank fusion constant; 60 is the value from the original RRF paper.
+RRF_K = 60
+RETRIEVAL_WORKERS = 8
+JSON_BLOCK_REGEX = re.compile(r"\{.*\}", re.DOTALL)
+JSON_ARRAY_REGEX = re.compile(r"\[.*\]", re.DOTALL)
+
+# Bulk answering: questions per translate call, texts per embedding request (the Gemini
+# limit), answers generated at once, and the largest question set one /batch call takes.
+BATCH_TRANSLATE_SIZE = int(os.getenv("BATCH_TRANSLATE_SIZE", "10"))
+BATCH_EMBED_SIZE = 100
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
 
 vector_store = VectorStoreWrapper()
 embedder = EmbeddingEngineWrapper()
 llm = LLMWrapper()
+query_routing = query_routing_enabled()
+# With routing on, simple questions skip translation and the rest use a faster model. Translation
+# blocks the whole answer, so either way a call slower than the recent p95 is duplicated.
+translate_model = os.getenv("TRANSLATE_MODEL", DEFAULT_TRANSLATE_MODEL) if query_routing else llm.model_name
+translate_llm = LLMWrapper(model_name=translate_model, hedge=True)
+# Conversation summaries and batch translation are long by design: hedging would send most of
+# them twice, and their failures shouldn't open the circuit that interactive translation relies on.
+background_llm = LLMWrapper(model_name=translate_model, circuit_breaker=False)
+speculative_retrieval = speculative_retrieval_enabled()
+route_stats = RouteStats()
+retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS)
+# Speculative searches fan out on retrieval_pool themselves, so they need their own threads.
+speculation_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS)
+answer_cache = answer_cache_from_env()
+lexical_index = lexical_index_from_env()
+document_store = document_store_from_env()
+reranker = reranker_from_env()
+coalescer = RequestCoalescer() if coalescing_enabled() else None
+# Follow-ups in a conversation are translated from a rolling summary and the last few turns;
+# summarize_conversation is defined below and only called once turns leave the window.
+conversations = conversation_store_from_env(summarize=lambda summary, turns: summarize_conversation(summary, turns))
+# Emit a "Timing" event with the stage timings at the end of each answer stream.
+sse_timings = os.getenv("SSE_TIMINGS", "off").lower() in ("on", "1", "true")
+
+if answer_cache is not None:
+    metrics.register_gauges("rag_answer_cache", answer_cache.stats)
+if embedder.cache is not None:
+    metrics.register_gauges("rag_embedding_cache", embedder.cache.stats)
+if coalescer is not None:
+    metrics.register_gauges("rag_coalescing", coalescer.stats)
+if document_store is not None:
+    metrics.register_gauges("rag_document_store", document_store.stats)
+if conversations is not None:
+    metrics.register_gauges("rag_conversations", conversations.stats)
+
+# The wrappers connect on first use; warm them up in the background so startup never
+# waits on Gemini or Pinecone, and let /ready report when they have answered.
+warmup_checks = {"llm": llm.warm_up, "embedder": embedder.warm_up, "vector_store": vector_store.warm_up}
+if translate_llm.model_name != llm.model_name:
+    warmup_checks["translate_llm"] = translate_llm.warm_up
+clients.start_warmup(warmup_checks)
+metrics.register_gauges("rag_backend_ready", lambda: {
+    name: float(c["state"] == clients.STATE_READY) for name, c in clients.readiness()["components"].items()
+})
 
 
 def sse(payload: dict) -> str:
@@ -29,9 +113,9 @@ def embed_one(text: str):
     return emb_objs[0].values
 
 
-def translate_query(history: list[str]):
+def build_translate_prompt(history: list[str]) -> str:
     joined = "\n".join(history)
-    prompt = f"""
+    return f"""
 You are a legal search expert with deep knowledge of the structure and content of various legal documents, including acts, regulations, case law, and policy texts. You are working with a vector database containing a wide range of legal documents in English. This database supports semantic search but does not perform reasoning or legal interpretation. It returns relevant document snippets based on similarity.
 
 We receive legal questions from clients, and your task is to convert each question into a set of well-structured search queries optimized for the vector database. These queries should aim to retrieve relevant legal texts that can help answer the client's question by pointing to applicable laws or clauses.
@@ -66,25 +150,207 @@ Please follow these instructions:
 Here are the questions:
 '{joined}'
             """
-    return llm.generate(prompt).strip()
 
 
-def retrieve(query_text: str, k: int = 5):
-    vec = embed_one(query_text)
-    results = vector_store.query(vector=vec, top_k=k, include_metadata=True)
+def translate_query(history: list[str]):
+    return translate_llm.generate(build_translate_prompt(history)).strip()
+
+
+def build_conversation_summary_prompt(summary: str, turns: list[dict]) -> str:
+    exchanges = []
+    for turn in turns:
+        try:
+            asked = json.loads(JSON_BLOCK_REGEX.search(turn["translated"]).group())["originalQuestion"]
+        except (TypeError, AttributeError, ValueError, KeyError):
+            asked = turn["question"]
+        exchanges.append(f"Client: {asked}\nAdviser (beginning of the answer): {turn['answer'] or '(not recorded)'}")
+    joined = "\n\n".join(exchanges)
+    return f"""
+You keep a running summary of a client's conversation with a legal adviser on Nepali law. The summary is used to understand the client's follow-up questions, so it must keep every fact the client gave (who they are, amounts, dates, places, the type of entity or contract) and the acts, sections and topics already discussed.
+
+Update the current summary with the new exchanges below. Write in English, in at most 120 words, and return only the updated summary.
+
+Current summary:
+{summary or "(none yet)"}
+
+New exchanges:
+{joined}
+            """
+
+
+def summarize_conversation(summary: str, turns: list[dict]) -> str:
+    """Fold ``turns`` into ``summary``: one call on the old summary and the new turns only."""
+    return background_llm.generate(build_conversation_summary_prompt(summary, turns)).strip()
+
+
+def build_batch_translate_prompt(questions: list[str]) -> str:
+    numbered = [f"{i}. {q}" for i, q in enumerate(questions, 1)]
+    return build_translate_prompt(numbered) + f"""
+The questions above are {len(questions)} independent client questions, numbered 1 to {len(questions)}. Apply the instructions to each question separately and return a JSON array with exactly one object per question, in the same order, each in the format above.
+"""
+
+
+def translate_batch(questions: list[str]) -> list[str] | None:
+    """translate_query for independent questions in one call, or None if the reply doesn't line up."""
+    reply = background_llm.generate(build_batch_translate_prompt(questions))
+    match = JSON_ARRAY_REGEX.search(reply)
+    try:
+        parsed = json.loads(match.group(0) if match else reply)
+    except ValueError:
+        return None
+    if not isinstance(parsed, list) or len(parsed) != len(questions) or not all(isinstance(p, dict) for p in parsed):
+        return None
+    return [json.dumps(p, ensure_ascii=False) for p in parsed]
+
+
+def parse_translated_queries(translated: str) -> list[str]:
+    """Pull the sub-queries (and the English original question) out of translate_query's JSON."""
+    match = JSON_BLOCK_REGEX.search(translated)
+    try:
+        parsed = json.loads(match.group(0) if match else translated)
+    except ValueError:
+        return [translated]
+    if not isinstance(parsed, dict):
+        return [translated]
+
+    queries = [q for q in parsed.get("en", []) if isinstance(q, str)]
+    original = parsed.get("originalQuestion")
+    if isinstance(original, str):
+        queries.insert(0, original)
+
+    seen = set()
+    unique = []
+    for q in (q.strip() for q in queries):
+        if q and q.lower() not in seen:
+            seen.add(q.lower())
+            unique.append(q)
+    return unique or [translated]
+
+
+def fuse_rankings(rankings: list[list[dict]], k: int) -> list[dict]:
+    """Reciprocal-rank fusion of several ranked match lists, deduplicated by id."""
+    fused: dict[str, dict] = {}
+    for matches in rankings:
+        for rank, match in enumerate(matches):
+            entry = fused.setdefault(match["id"], {"match": match, "rrf": 0.0})
+            entry["rrf"] += 1.0 / (RRF_K + rank + 1)
+            if match.get("score", 0) > entry["match"].get("score", 0):
+                entry["match"] = match
+    ranked = sorted(fused.values(), key=lambda e: e["rrf"], reverse=True)
+    return [e["match"] for e in ranked[:k]]
+
+
+def lexical_rankings(texts: list[str], k: int) -> list[list[dict]]:
+    """BM25 matches for each text; they carry no metadata until ``hydrate_matches``."""
+    if lexical_index is None or not len(lexical_index):
+        return []
+    with metrics.span("lexical_search"):
+        return [[{"id": id_, "bm25": score} for id_, score in lexical_index.search(text, k)] for text in texts]
+
+
+def hydrate_matches(matches: list[dict]) -> list[dict]:
+    """Fetch metadata for lexical-only matches, dropping ids no longer in the vector store."""
+    fetched = vector_store.fetch([m["id"] for m in matches if "metadata" not in m])
+    hydrated = []
+    for match in matches:
+        if "metadata" not in match:
+            if match["id"] not in fetched:
+                continue
+            match = {**match, "metadata": fetched[match["id"]]}
+        hydrated.append(match)
+    return hydrated
+
+
+def rerank_contexts(query: str, contexts: list[dict], k: int) -> list[dict]:
+    if reranker is None:
+        return contexts[:k]
+    with metrics.span("rerank"):
+        return reranker.rerank(query, contexts, k)
+
+
+def fetch_count(k: int) -> int:
+    # With a reranker, over-fetch candidates and let it pick the final k.
+    return max(k, reranker.candidates) if reranker is not None else k
+
+
+def dense_rankings(queries: list[str], k: int) -> list[list[dict]]:
+    if not queries:
+        return []
+    emb_objs = embedder.embed(queries)
+    if not emb_objs or len(emb_objs) != len(queries):
+        raise ValueError("Embedding failed")
+
+    def search(vec):
+        return vector_store.query(vector=vec, top_k=k, include_metadata=True).get("matches") or []
+
+    return list(retrieval_pool.map(search, [e.values for e in emb_objs]))
+
+
+def batch_dense_rankings(texts: list[str], k: int) -> dict[str, list[dict]]:
+    """Dense matches of every distinct text, embedded in batches and searched together."""
+    unique = list(dict.fromkeys(texts))
+    vectors = []
+    for start in range(0, len(unique), BATCH_EMBED_SIZE):
+        chunk = unique[start:start + BATCH_EMBED_SIZE]
+        emb_objs = embedder.embed(chunk)
+        if not emb_objs or len(emb_objs) != len(chunk):
+            raise ValueError("Embedding failed")
+        vectors += [e.values for e in emb_objs]
+    responses = vector_store.query_many(vectors, top_k=k, include_metadata=True)
+    return {text: response.get("matches") or [] for text, response in zip(unique, responses)}
+
+
+def speculate(question: str, k: int = 5) -> Future:
+    """Start the dense search for the raw question while translate_query is still running."""
+    return speculation_pool.submit(dense_rankings, [question], fetch_count(k))
+
+
+def retrieve(translated: str, k: int = 5, question: str | None = None, speculative: Future | None = None):
+    queries = parse_translated_queries(translated)
+    fetch_k = fetch_count(k)
+    rankings = []
+    if speculative is not None:
+        # The raw question's ranking is already done; don't search it again if translation kept it.
+        rankings += speculative.result()
+        queries_to_search = [q for q in queries if q.lower() != question.strip().lower()]
+    else:
+        queries_to_search = queries
+    rankings += dense_rankings(queries_to_search, fetch_k)
+    return fuse_contexts(queries, question, rankings, k)
+
+
+def fuse_contexts(queries: list[str], question: str | None, rankings: list[list[dict]], k: int) -> list[dict]:
+    """The top ``k`` contexts from the dense ``rankings`` of ``queries`` fused with their BM25 matches."""
+    fetch_k = fetch_count(k)
+    # The untranslated question keeps exact Nepali terms and section numbers for the lexical side.
+    rankings = rankings + lexical_rankings(([question] if question else []) + queries, fetch_k)
+    contexts = context_rows(hydrate_matches(fuse_rankings(rankings, fetch_k)))
+    # queries[0] is the question in English, which is what the cross-encoder was trained on.
+    return rerank_contexts(queries[0], contexts, k)
+
+
+def context_rows(matches: list[dict]) -> list[dict]:
+    # Only the fused candidates' texts are read, not those of every match of every sub-query.
+    texts = document_store.get_many([m["id"] for m in matches]) if document_store is not None else {}
     rows = []
-    for match in results.get("matches"):
-        rows.append(
-            {
-                "id": match["id"],
-                "document": match["metadata"].get("text") or match["metadata"].get("summary", ""),
-                "distance": match.get("score", 0),
-            }
-        )
+    for match in matches:
+        metadata = match["metadata"]
+        row = {
+            "id": match["id"],
+            # Chunks ingested before the document store carry their text in the metadata.
+            "document": texts.get(match["id"]) or metadata.get("document") or metadata.get("summary", ""),
+            "distance": match.get("score", 0),
+        }
+        # Chunks from the structure-aware chunker say where in the act they come from.
+        if "provision" in metadata:
+            row["provision"] = metadata["provision"]
+        if "page_start" in metadata:
+            row["pages"] = f"{int(metadata['page_start'])}-{int(metadata['page_end'])}"
+        rows.append(row)
     return rows
 
 
-def build_answer_prompt(user_query: str, contexts: list[dict]):
+def build_answer_prompt(user_query: str, context: str):
     return (
         f"""
 ### User Query:
@@ -93,7 +359,7 @@ def build_answer_prompt(user_query: str, contexts: list[dict]):
 ### **Your Task:**
 
 1.  **Analyze the Query:** Understand the core legal question the user is asking. Prioritize the primary question.
-2.  **Extract Relevant Information:** Find and extract *all* applicable legal provisions, definitions, rules, rates, conditions, thresholds, formulas, exemptions, deductions, fines, penalties, boundaries, logic, and any other numerical or procedural data directly and exclusively from the 'text' column of the provided documents that are relevant to the user's query.
+2.  **Extract Relevant Information:** Find and extract *all* applicable legal provisions, definitions, rules, rates, conditions, thresholds, formulas, exemptions, deductions, fines, penalties, boundaries, logic, and any other numerical or procedural data directly and exclusively from the provided legal references that are relevant to the user's query.
 3.  **Formulate the Response:**
     * Provide a precise, factually correct, and complete answer to the user's query, based *strictly* on the extracted legal information.
     * Ensure the response directly addresses the user's main question.
@@ -130,87 +396,337 @@ def build_answer_prompt(user_query: str, contexts: list[dict]):
 * **No Examples (Unless Asked):** Do not provide hypothetical examples or scenarios unless the user explicitly requests one to clarify a concept *based on the provisions found in the provided text*.
 
 ### Provided Legal References:
-The relevant legal documents are in the
-'${contexts}'
+Each reference starts with a [n] header naming its provision and pages where known.
+
+{context}
     """
     )
 
 
+def prepare_answer_prompt(question: str, translated: str, contexts: list[dict]) -> tuple[str, dict]:
+    """The answer prompt with a token-budgeted context block, and its token usage."""
+    context, usage = assemble_context(contexts, [question, *parse_translated_queries(translated)])
+    prompt = build_answer_prompt(question, context)
+    usage["prompt_tokens"] = count_tokens(prompt)
+    logging.info("Answer prompt: %d tokens (context %d of %d retrieved, %d passages)", usage["prompt_tokens"],
+                 usage["context_tokens"], usage["raw_context_tokens"], usage["passages"])
+    return prompt, usage
+
+
+def step_event(step: str, status: str, message: str, emoji: str, **extra) -> str:
+    return sse({"step": step, "status": status, "message": message, "icon": {"emoji": emoji}, **extra})
+
+
+def replay_cached_answer(cached: dict):
+    """Stream a cached answer with the same step events as a live run."""
+    yield step_event("Understanding", STATUS_PROCESSING, "Understanding relevant context", "🤔")
+    yield step_event("Understanding", STATUS_RESULT, "Found relevant questions.", "🤔")
+    yield step_event("Searching", STATUS_PROCESSING, "Searching Relevant Laws", "🔍")
+    yield step_event("Searching", STATUS_RESULT, f"Top {cached['contexts']} passages found.", "✅")
+    yield step_event("Generating", STATUS_PROCESSING, "Generating answer", "✍️")
+    for chunk in cached["chunks"]:
+        yield step_event("Answering", STATUS_RESULT, chunk, "📄")
+
+
+def timing_event(trace: metrics.RequestTrace) -> str:
+    return step_event("Timing", STATUS_RESULT, "Request timings", "⏱️", request_id=trace.request_id,
+                      timings=trace.timings(), tokens=trace.tokens)
+
+
+def conversation_history(queries: list[str], conversation_id: str | None) -> list[str]:
+    """The questions to translate: the client's own history, or the stored state of its conversation."""
+    if conversation_id is None or conversations is None:
+        return queries
+    return conversations.history(conversation_id, queries[-1], seed=queries[:-1])
+
+
+def cached_translation(queries: list[str], conversation_id: str | None) -> str | None:
+    if conversation_id is None or conversations is None:
+        return None
+    return conversations.cached_translation(conversation_id, queries[-1])
+
+
+def record_conversation_turn(queries: list[str], conversation_id: str | None, translated: str | None,
+                             contexts: list[dict], chunks: list[str]) -> None:
+    if conversation_id is not None and conversations is not None:
+        conversations.record_turn(conversation_id, queries[-1], translated, [c["id"] for c in contexts],
+                                  "".join(chunks), seed=queries[:-1])
+
+
+def is_first_turn(queries: list[str], conversation_id: str) -> bool:
+    """A conversation's opening question, which depends on nothing but itself and can be coalesced."""
+    return len(conversation_history(queries, conversation_id)) == 1
+
+
+def record_shared_turn(queries: list[str], conversation_id: str, events: list[str]) -> None:
+    """Record a coalesced first turn in this client's conversation, from the events it was sent.
+
+    Like a replayed cached answer, the turn is kept without its translation and context ids.
+    """
+    payloads = [json.loads(event[len("data: "):]) for event in events]
+    if any(p["status"] == "error" for p in payloads):
+        return
+    chunks = [p["message"] for p in payloads if p["step"] == "Answering"]
+    if chunks:
+        record_conversation_turn(queries, conversation_id, None, [], chunks)
+
+
+def recorded_shared_turn(events, queries: list[str], conversation_id: str):
+    sent = []
+    for event in events:
+        sent.append(event)
+        yield event
+    record_shared_turn(queries, conversation_id, sent)
+
+
+def pipeline_events(queries: list[str], conversation_id: str | None = None):
+    started = time.perf_counter()
+    trace = metrics.start_trace()
+    cache_vector = language = None
+    history = conversation_history(queries, conversation_id)
+    route = trace.route = route_query(history) if query_routing else ROUTE_FULL
+    outcome = "cancelled"
+    try:
+        # Only single-turn questions are cached; follow-ups depend on the history.
+        if answer_cache is not None and len(history) == 1:
+            with metrics.span("cache_lookup"):
+                cache_vector = embed_one(normalize_query(queries[-1]))
+                language = detect_language(queries[-1])
+                cached = answer_cache.lookup(queries[-1], cache_vector, language)
+            if cached is not None:
+                trace.route = ROUTE_CACHED
+                yield from replay_cached_answer(cached)
+                record_conversation_turn(queries, conversation_id, None, [], cached["chunks"])
+                outcome = "ok"
+                return
+
+        yield step_event("Understanding", STATUS_PROCESSING, "Understanding relevant context", "🤔")
+        speculative = None
+        # A question repeated within a conversation reuses that turn's translation.
+        translated = cached_translation(queries, conversation_id)
+        if translated is None and route == ROUTE_DIRECT:
+            translated = direct_translation(queries[-1])
+        elif translated is None:
+            speculative = speculate(queries[-1]) if speculative_retrieval else None
+            with metrics.span("translate"):
+                translated = translate_query(history)
+        yield step_event("Understanding", STATUS_RESULT, "Found relevant questions.", "🤔", route=route)
+
+        yield step_event("Searching", STATUS_PROCESSING, "Searching Relevant Laws", "🔍")
+        with metrics.span("retrieve"):
+            contexts = retrieve(translated, question=queries[-1], speculative=speculative)
+        yield step_event("Searching", STATUS_RESULT, f"Top {len(contexts)} passages found.", "✅")
+
+        # Step 3: answering
+        with metrics.span("prompt"):
+            prompt, usage = prepare_answer_prompt(queries[-1], translated, contexts)
+        yield step_event("Generating", STATUS_PROCESSING, "Generating answer", "✍️", usage=usage)
+        chunks = []
+        with metrics.span("generate"):
+            for chunk in llm.stream_generate(prompt):
+                if not chunks:
+                    trace.first_token()
+                    route_stats.record(route, trace.ttft)
+                chunks.append(chunk)
+                yield step_event("Answering", STATUS_RESULT, chunk, "📄")
+
+        if cache_vector is not None:
+            answer_cache.store(queries[-1], cache_vector, language, {"contexts": len(contexts), "chunks": chunks},
+                               generation_seconds=time.perf_counter() - started)
+        record_conversation_turn(queries, conversation_id, translated, contexts, chunks)
+        outcome = "ok"
+        if sse_timings:
+            yield timing_event(trace)
+    except Exception as e:
+        outcome = "error"
+        yield step_event("Error", "error", str(e), "⚠️")
+    finally:
+        trace.finish(outcome, queries=len(history))
+        metrics.end_trace()
+
+
+def batch_items(questions: list) -> list[dict]:
+    """``{"id", "question"}`` items from bare strings or objects; ids default to the position."""
+    items = []
+    for i, entry in enumerate(questions):
+        if isinstance(entry, str):
+            entry = {"question": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("question"), str) or not entry["question"].strip():
+            raise ValueError(f"Question {i} has no text")
+        items.append({"id": str(entry.get("id", i)), "question": entry["question"]})
+    return items
+
+
+def _translate_wave(questions: list[str], pool: ThreadPoolExecutor) -> list:
+    """Translated JSON per question, or the exception that stopped it."""
+    translated: list = [None] * len(questions)
+    full = []
+    for i, question in enumerate(questions):
+        if query_routing and route_query([question]) == ROUTE_DIRECT:
+            translated[i] = direct_translation(question)
+        else:
+            full.append(i)
+    groups = [full[start:start + BATCH_TRANSLATE_SIZE] for start in range(0, len(full), BATCH_TRANSLATE_SIZE)]
+    futures = [pool.submit(translate_batch, [questions[i] for i in group]) for group in groups]
+    retry = []
+    for group, future in zip(groups, futures):
+        try:
+            replies = future.result()
+        except Exception as e:
+            replies = e
+        if isinstance(replies, list):
+            for i, reply in zip(group, replies):
+                translated[i] = reply
+        else:
+            logging.warning("Batch translation of %d questions failed (%s); translating them one by one",
+                            len(group), replies or "malformed reply")
+            retry += group
+    singles = [(i, pool.submit(translate_query, [questions[i]])) for i in retry]
+    for i, future in singles:
+        try:
+            translated[i] = future.result()
+        except Exception as e:
+            translated[i] = e
+    return translated
+
+
+def answer_batch(items: list[dict], k: int = 5, concurrency: int | None = None, wave_size: int = 200):
+    """Answer independent questions together, yielding one result per item as its answer completes.
+
+    Repeated questions are answered once. Each wave of ``wave_size`` distinct questions
+    is translated ``BATCH_TRANSLATE_SIZE`` to a call, all of its sub-queries are
+    embedded and searched as one batch, and at most ``concurrency`` answers are
+    generated at a time. A failed question yields a result with an ``error`` instead
+    of an ``answer``.
+    """
+    groups: dict[str, list[dict]] = {}
+    for item in items:
+        groups.setdefault(normalize_query(item["question"]), []).append(item)
+    members = list(groups.values())
+    pool = ThreadPoolExecutor(max_workers=concurrency or BATCH_CONCURRENCY, thread_name_prefix="batch")
+
+    def results(group: list[dict], **fields):
+        for item in group:
+            yield {"id": item["id"], "question": item["question"], **fields,
+                   **({"duplicate_of": group[0]["id"]} if item is not group[0] else {})}
+
+    def answer(question: str, translated: str, queries: list[str], dense: dict) -> dict:
+        contexts = fuse_contexts(queries, question, [dense[q] for q in queries], k)
+        prompt, usage = prepare_answer_prompt(question, translated, contexts)
+        with metrics.span("batch_generate"):
+            text = llm.generate(prompt)
+        return {"answer": text, "prompt_tokens": usage["prompt_tokens"],
+                "contexts": [{key: c[key] for key in ("id", "provision", "pages") if key in c} for c in contexts]}
+
+    try:
+        for start in range(0, len(members), wave_size):
+            wave = members[start:start + wave_size]
+            questions = [group[0]["question"] for group in wave]
+            with metrics.span("batch_translate"):
+                translated = _translate_wave(questions, pool)
+            queries = [parse_translated_queries(t) if isinstance(t, str) else [] for t in translated]
+            try:
+                with metrics.span("batch_retrieve"):
+                    dense = batch_dense_rankings([q for qs in queries for q in qs], fetch_count(k))
+            except Exception as e:
+                translated = [t if isinstance(t, Exception) else e for t in translated]
+                dense = {}
+
+            futures = {}
+            for group, question, t, qs in zip(wave, questions, translated, queries):
+                if isinstance(t, Exception):
+                    yield from results(group, error=f"{type(t).__name__}: {t}")
+                else:
+                    futures[pool.submit(answer, question, t, qs, dense)] = group
+            for future in as_completed(futures):
+                try:
+                    yield from results(futures[future], **future.result())
+                except Exception as e:
+                    yield from results(futures[future], error=f"{type(e).__name__}: {e}")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def batch_events(items: list[dict], k: int = 5, concurrency: int | None = None):
+    """NDJSON lines of answer_batch, then a summary line with the throughput."""
+    started = time.perf_counter()
+    answered = errors = 0
+    for result in answer_batch(items, k=k, concurrency=concurrency):
+        answered += 1
+        errors += "error" in result
+        yield json.dumps(result, ensure_ascii=False) + "\n"
+    seconds = time.perf_counter() - started
+    yield json.dumps({"summary": {"questions": answered, "errors": errors, "seconds": round(seconds, 3),
+                                  "questions_per_minute": round(answered * 60 / seconds, 1) if seconds else None}}) + "\n"
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
     data = request.get_json(force=True)
     queries = data.get("queries", [])
     if not queries:
         return {"error": "No queries provided"}, 400
+    conversation_id = data.get("conversation_id") or None
 
-    def generate():
-        try:
-            yield sse(
-                {
-                    "step": "Understanding",
-                    "status": STATUS_PROCESSING,
-                    "message": f"Understanding relevant context",
-                    "icon": {"emoji": "🤔"},
-                }
-            )
-            translated = translate_query(queries)
-            yield sse(
-                {
-                    "step": "Understanding",
-                    "status": STATUS_RESULT,
-                    "message": f"Found relevant questions.",
-                    "icon": {"emoji": "🤔"},
-                }
-            )
-
-            yield sse(
-                {
-                    "step": "Searching",
-                    "status": STATUS_PROCESSING,
-                    "message": "Searching Relevant Laws",
-                    "icon": {"emoji": "🔍"},
-                }
-            )
-            contexts = retrieve(translated)
-            yield sse(
-                {
-                    "step": "Searching",
-                    "status": STATUS_RESULT,
-                    "message": f"Top {len(contexts)} passages found.",
-                    "icon": {"emoji": "✅"},
-                }
-            )
-
-            # Step 3: answering
-            prompt = build_answer_prompt(queries[-1], contexts)
-            yield sse(
-                {
-                    "step": "Generating",
-                    "status": STATUS_PROCESSING,
-                    "message": "Generating answer",
-                    "icon": {"emoji": "✍️"},
-                }
-            )
-            for chunk in llm.stream_generate(prompt):
-                yield sse(
-                    {
-                        "step": "Answering",
-                        "status": STATUS_RESULT,
-                        "message": chunk,
-                        "icon": {"emoji": "📄"},
-                    }
-                )
-        except Exception as e:
-            yield sse(
-                {
-                    "step": "Error",
-                    "status": "error",
-                    "message": str(e),
-                    "icon": {"emoji": "⚠️"},
-                }
-            )
-
-    return Response(generate(), mimetype="text/event-stream")
+    # Identical questions arriving together share one upstream pipeline. A follow-up depends on
+    # its conversation's state; a first turn doesn't, and is recorded in each client's conversation.
+    if coalescer is not None and (conversation_id is None or is_first_turn(queries, conversation_id)):
+        events = coalescer.stream(coalesce_key(queries), lambda: pipeline_events(queries))
+        if conversation_id is not None:
+            events = recorded_shared_turn(events, queries, conversation_id)
+        return Response(events, mimetype="text/event-stream")
+    return Response(pipeline_events(queries, conversation_id), mimetype="text/event-stream")
+
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    data = request.get_json(force=True)
+    try:
+        items = batch_items(data.get("questions", []))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if not items:
+        return {"error": "No questions provided"}, 400
+    if len(items) > BATCH_MAX_QUESTIONS:
+        return {"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch"}, 413
+    return Response(batch_events(items), mimetype="application/x-ndjson")
+
+
+@app.route("/conversations/<conversation_id>", methods=["GET", "DELETE"])
+def conversation(conversation_id: str):
+    if conversations is None:
+        return {"error": "Conversations are off"}, 404
+    if request.method == "DELETE":
+        return ({"deleted": conversation_id}, 200) if conversations.delete(conversation_id) else ({"error": "Not found"}, 404)
+    state = conversations.get(conversation_id)
+    return (state, 200) if state is not None else ({"error": "Not found"}, 404)
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    return {"status": "ok"}
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    state = clients.readiness()
+    return state, 200 if state["ready"] else 503
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return {
+        "answers": answer_cache.stats() if answer_cache is not None else None,
+        "embeddings": embedder.cache.stats() if embedder.cache is not None else None,
+        "coalescing": coalescer.stats() if coalescer is not None else None,
+        "conversations": conversations.stats() if conversations is not None else None,
+        "routes": route_stats.stats(),
+    }
 
 
 if __name__ == "__main__":
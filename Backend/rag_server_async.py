@@ -0,0 +1,311 @@
+"""Asyncio (ASGI) entry point serving the same ``/chat`` SSE contract as rag_server.py.
+
+    uvicorn rag_server_async:app --host 0.0.0.0 --port 8000
+
+Each stream is a coroutine rather than an OS thread, so thousands of slow
+``stream_generate`` calls can be in flight at once. ``MAX_CONCURRENT_STREAMS``
+bounds the pipelines actually running; requests that cannot get a slot within
+``QUEUE_TIMEOUT_SECONDS`` are rejected with 503 instead of piling up.
+"""
+import asyncio
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import clients
+import metrics
+import rag_server
+from answer_cache import normalize_query
+from query_language import detect_language
+from query_router import ROUTE_CACHED, ROUTE_DIRECT, ROUTE_FULL, direct_translation, route_query
+from request_coalescer import AsyncRequestCoalescer, coalesce_key, coalescing_enabled
+from rag_server import (
+    STATUS_PROCESSING,
+    STATUS_RESULT,
+    build_translate_prompt,
+    cached_translation,
+    context_rows,
+    conversation_history,
+    fetch_count,
+    fuse_rankings,
+    hydrate_matches,
+    is_first_turn,
+    lexical_rankings,
+    parse_translated_queries,
+    prepare_answer_prompt,
+    record_conversation_turn,
+    record_shared_turn,
+    rerank_contexts,
+    replay_cached_answer,
+    step_event,
+    timing_event,
+)
+
+MAX_CONCURRENT_STREAMS = int(os.getenv("MAX_CONCURRENT_STREAMS", "64"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("QUEUE_TIMEOUT_SECONDS", "5"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "180"))
+
+stream_slots = asyncio.Semaphore(MAX_CONCURRENT_STREAMS)
+coalescer = AsyncRequestCoalescer() if coalescing_enabled() else None
+if coalescer is not None:
+    metrics.register_gauges("rag_async_coalescing", coalescer.stats)
+
+
+async def embed_one(text: str):
+    emb_objs = await rag_server.embedder.aembed([text])
+    if not emb_objs:
+        raise ValueError("Embedding failed")
+    return emb_objs[0].values
+
+
+async def translate_query(history: list[str]):
+    return (await rag_server.translate_llm.agenerate(build_translate_prompt(history))).strip()
+
+
+async def dense_rankings(queries: list[str], k: int) -> list[list[dict]]:
+    if not queries:
+        return []
+    emb_objs = await rag_server.embedder.aembed(queries)
+    if not emb_objs or len(emb_objs) != len(queries):
+        raise ValueError("Embedding failed")
+
+    def search(vec):
+        return rag_server.vector_store.query(vector=vec, top_k=k, include_metadata=True).get("matches") or []
+
+    # The vector store client is synchronous; keep it off the event loop.
+    return list(await asyncio.gather(*(asyncio.to_thread(search, e.values) for e in emb_objs)))
+
+
+async def retrieve(translated: str, k: int = 5, question: str | None = None,
+                   speculative: asyncio.Task | None = None):
+    queries = parse_translated_queries(translated)
+    fetch_k = fetch_count(k)
+    rankings = []
+    if speculative is not None:
+        rankings += await speculative
+        queries_to_search = [q for q in queries if q.lower() != question.strip().lower()]
+    else:
+        queries_to_search = queries
+    rankings += await dense_rankings(queries_to_search, fetch_k)
+    # BM25 lookups take well under a millisecond, so they run inline.
+    rankings += lexical_rankings(([question] if question else []) + queries, fetch_k)
+    contexts = context_rows(await asyncio.to_thread(hydrate_matches, fuse_rankings(rankings, fetch_k)))
+    # The cross-encoder forward pass is CPU-bound.
+    return await asyncio.to_thread(rerank_contexts, queries[0], contexts, k)
+
+
+async def run_pipeline(queries: list[str], history: list[str], conversation_id: str | None,
+                       trace: metrics.RequestTrace):
+    started = time.perf_counter()
+    answer_cache = rag_server.answer_cache
+    cache_vector = language = None
+    if answer_cache is not None and len(history) == 1:
+        with metrics.span("cache_lookup"):
+            cache_vector = await embed_one(normalize_query(queries[-1]))
+            language = detect_language(queries[-1])
+            cached = await asyncio.to_thread(answer_cache.lookup, queries[-1], cache_vector, language)
+        if cached is not None:
+            trace.route = ROUTE_CACHED
+            for event in replay_cached_answer(cached):
+                yield event
+            await asyncio.to_thread(record_conversation_turn, queries, conversation_id, None, [], cached["chunks"])
+            return
+
+    yield step_event("Understanding", STATUS_PROCESSING, "Understanding relevant context", "🤔")
+    route = trace.route
+    speculative = None
+    translated = await asyncio.to_thread(cached_translation, queries, conversation_id)
+    if translated is None and route == ROUTE_DIRECT:
+        translated = direct_translation(queries[-1])
+    elif translated is None:
+        if rag_server.speculative_retrieval:
+            # Search with the raw question while translation is still running.
+            speculative = asyncio.create_task(dense_rankings([queries[-1]], fetch_count(5)))
+        try:
+            with metrics.span("translate"):
+                translated = await translate_query(history)
+        except BaseException:
+            if speculative is not None:
+                speculative.cancel()
+            raise
+    yield step_event("Understanding", STATUS_RESULT, "Found relevant questions.", "🤔", route=route)
+
+    yield step_event("Searching", STATUS_PROCESSING, "Searching Relevant Laws", "🔍")
+    with metrics.span("retrieve"):
+        contexts = await retrieve(translated, question=queries[-1], speculative=speculative)
+    yield step_event("Searching", STATUS_RESULT, f"Top {len(contexts)} passages found.", "✅")
+
+    with metrics.span("prompt"):
+        prompt, usage = prepare_answer_prompt(queries[-1], translated, contexts)
+    yield step_event("Generating", STATUS_PROCESSING, "Generating answer", "✍️", usage=usage)
+    chunks = []
+    with metrics.span("generate"):
+        async for chunk in rag_server.llm.astream_generate(prompt):
+            if not chunks:
+                trace.first_token()
+                rag_server.route_stats.record(route, trace.ttft)
+            chunks.append(chunk)
+            yield step_event("Answering", STATUS_RESULT, chunk, "📄")
+
+    if cache_vector is not None:
+        await asyncio.to_thread(answer_cache.store, queries[-1], cache_vector, language,
+                                {"contexts": len(contexts), "chunks": chunks}, time.perf_counter() - started)
+    await asyncio.to_thread(record_conversation_turn, queries, conversation_id, translated, contexts, chunks)
+    if rag_server.sse_timings:
+        yield timing_event(trace)
+
+
+async def pipeline_events(queries: list[str], conversation_id: str | None = None):
+    """``run_pipeline`` with its timeout and errors turned into SSE error events."""
+    trace = metrics.start_trace()
+    history = await asyncio.to_thread(conversation_history, queries, conversation_id)
+    trace.route = route_query(history) if rag_server.query_routing else ROUTE_FULL
+    outcome = "cancelled"
+    try:
+        async with asyncio.timeout(REQUEST_TIMEOUT_SECONDS):
+            async for event in run_pipeline(queries, history, conversation_id, trace):
+                yield event
+        outcome = "ok"
+    except TimeoutError:
+        outcome = "timeout"
+        yield step_event("Error", "error", f"Request timed out after {REQUEST_TIMEOUT_SECONDS:g}s", "⚠️")
+    except Exception as e:
+        outcome = "error"
+        yield step_event("Error", "error", str(e), "⚠️")
+    finally:
+        trace.finish(outcome, queries=len(history))
+        metrics.end_trace()
+
+
+class _Slot:
+    """A semaphore slot released exactly once, whichever of stream end or response teardown comes first."""
+
+    def __init__(self):
+        self.held = True
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            stream_slots.release()
+
+
+async def chat(request: Request):
+    data = await request.json()
+    queries = data.get("queries", [])
+    if not queries:
+        return JSONResponse({"error": "No queries provided"}, status_code=400)
+    conversation_id = data.get("conversation_id") or None
+
+    try:
+        await asyncio.wait_for(stream_slots.acquire(), QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return JSONResponse({"error": "Server busy, please retry"}, status_code=503, headers={"Retry-After": "1"})
+    slot = _Slot()
+
+    async def generate():
+        # On client disconnect Starlette cancels this generator, which closes the
+        # upstream Gemini stream mid-generation instead of letting it run to the end.
+        # A coalesced stream is only closed once its last subscriber has gone.
+        # A first turn doesn't depend on its conversation, so it is shared and then recorded per client.
+        shared = coalescer is not None and (
+            conversation_id is None or await asyncio.to_thread(is_first_turn, queries, conversation_id))
+        if shared:
+            events = coalescer.stream(coalesce_key(queries), lambda: pipeline_events(queries))
+        else:
+            events = pipeline_events(queries, conversation_id)
+        sent = []
+        try:
+            async for event in events:
+                sent.append(event)
+                yield event
+        finally:
+            await events.aclose()
+            slot.release()
+        if shared and conversation_id is not None:
+            await asyncio.to_thread(record_shared_turn, queries, conversation_id, sent)
+
+    return StreamingResponse(generate(), media_type="text/event-stream", background=BackgroundTask(slot.release))
+
+
+async def batch(request: Request):
+    data = await request.json()
+    try:
+        items = rag_server.batch_items(data.get("questions", []))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if not items:
+        return JSONResponse({"error": "No questions provided"}, status_code=400)
+    if len(items) > rag_server.BATCH_MAX_QUESTIONS:
+        return JSONResponse({"error": f"At most {rag_server.BATCH_MAX_QUESTIONS} questions per batch"},
+                            status_code=413)
+    # A bulk job is throughput-bound and runs on its own thread pool; Starlette drains
+    # the synchronous generator off the event loop.
+    return StreamingResponse(rag_server.batch_events(items), media_type="application/x-ndjson")
+
+
+async def conversation(request: Request):
+    conversations = rag_server.conversations
+    conversation_id = request.path_params["conversation_id"]
+    if conversations is None:
+        return JSONResponse({"error": "Conversations are off"}, status_code=404)
+    if request.method == "DELETE":
+        if await asyncio.to_thread(conversations.delete, conversation_id):
+            return JSONResponse({"deleted": conversation_id})
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    state = await asyncio.to_thread(conversations.get, conversation_id)
+    if state is None:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    return JSONResponse(state)
+
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok"})
+
+
+async def ready(request: Request):
+    state = clients.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+async def metrics_endpoint(request: Request):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def cache_stats(request: Request):
+    answer_cache = rag_server.answer_cache
+    embedder = rag_server.embedder
+    return JSONResponse({
+        "answers": answer_cache.stats() if answer_cache is not None else None,
+        "embeddings": embedder.cache.stats() if embedder.cache is not None else None,
+        "coalescing": coalescer.stats() if coalescer is not None else None,
+        "conversations": rag_server.conversations.stats() if rag_server.conversations is not None else None,
+        "routes": rag_server.route_stats.stats(),
+    })
+
+
+app = Starlette(
+    routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/batch", batch, methods=["POST"]),
+        Route("/conversations/{conversation_id}", conversation, methods=["GET", "DELETE"]),
+        Route("/cache/stats", cache_stats, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+        Route("/health", health, methods=["GET"]),
+        Route("/ready", ready, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origin_regex=".*", allow_credentials=True, allow_methods=["*"],
+                           allow_headers=["*"])],
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=8000)
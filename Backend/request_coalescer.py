@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, List
+
+from answer_cache import normalize_query
+
+
+def coalesce_key(queries: List[str]) -> str:
+    """Requests with the same normalized history share one pipeline."""
+    return "\n".join(normalize_query(q) for q in queries)
+
+
+def coalescing_enabled() -> bool:
+    return os.getenv("REQUEST_COALESCING", "on").lower() not in ("off", "0", "false")
+
+
+class _Flight:
+    def __init__(self):
+        self.events: List[str] = []
+        self.done = False
+        self.subscribers = 0
+
+
+class RequestCoalescer:
+    """Single-flight fan-out of SSE event streams for the threaded Flask server.
+
+    The first request for a key starts ``start()`` on a background thread; every
+    request for the same key while it runs subscribes to the same buffered events,
+    so a late joiner first gets the prefix already produced. The upstream stream is
+    closed once its last subscriber disconnects.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.counters = {"flights": 0, "coalesced": 0, "abandoned": 0}
+
+    def stream(self, key: str, start: Callable[[], Iterator[str]]) -> Iterator[str]:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.counters["flights"] += 1
+            else:
+                self.counters["coalesced"] += 1
+            flight.subscribers += 1
+        if leader:
+            threading.Thread(target=self._produce, args=(key, flight, start), daemon=True).start()
+
+        sent = 0
+        try:
+            while True:
+                with self._lock:
+                    while sent == len(flight.events) and not flight.done:
+                        self._changed.wait()
+                    events = flight.events[sent:]
+                if not events:
+                    return
+                yield from events
+                sent += len(events)
+        finally:
+            with self._lock:
+                flight.subscribers -= 1
+
+    def _produce(self, key: str, flight: _Flight, start: Callable[[], Iterator[str]]) -> None:
+        source = start()
+        try:
+            for event in source:
+                with self._lock:
+                    flight.events.append(event)
+                    self._changed.notify_all()
+                    if flight.subscribers == 0:
+                        self.counters["abandoned"] += 1
+                        break
+        except Exception:
+            logging.exception("Coalesced pipeline for %r failed", key)
+        finally:
+            source.close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.done = True
+                self._changed.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counters, "in_flight": len(self._flights)}
+
+
+class _AsyncFlight(_Flight):
+    def __init__(self):
+        super().__init__()
+        self.changed = asyncio.Condition()
+        self.task: asyncio.Task | None = None
+
+
+class AsyncRequestCoalescer:
+    """``RequestCoalescer`` for the ASGI server: the shared stream runs as a task on the event loop."""
+
+    def __init__(self):
+        self._flights: Dict[str, _AsyncFlight] = {}
+        self.counters = {"flights": 0, "coalesced": 0, "abandoned": 0}
+
+    async def stream(self, key: str, start: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _AsyncFlight()
+            flight.task = asyncio.create_task(self._produce(key, flight, start()))
+            self.counters["flights"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        flight.subscribers += 1
+
+        sent = 0
+        try:
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: sent < len(flight.events) or flight.done)
+                    events = flight.events[sent:]
+                if not events:
+                    return
+                for event in events:
+                    yield event
+                sent += len(events)
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is listening any more; cancelling closes the upstream Gemini stream.
+                self.counters["abandoned"] += 1
+                self._flights.pop(key, None)
+                flight.task.cancel()
+
+    async def _produce(self, key: str, flight: _AsyncFlight, source: AsyncIterator[str]) -> None:
+        try:
+            async for event in source:
+                flight.events.append(event)
+                async with flight.changed:
+                    flight.changed.notify_all()
+        except Exception:
+            logging.exception("Coalesced pipeline for %r failed", key)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.done = True
+            async with flight.changed:
+                flight.changed.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "in_flight": len(self._flights)}
+
+
+def test():
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    subscribers = 20
+    generations = []
+
+    class StubLLM:
+        def stream_generate(self, prompt):
+            generations.append(prompt)
+            for i in range(5):
+                time.sleep(0.02)
+                yield f"chunk{i} "
+
+    llm = StubLLM()
+    coalescer = RequestCoalescer()
+    key = coalesce_key(["What is the voting age?"])
+
+    def request(i):
+        # Later requests join mid-stream and must still see the whole answer.
+        time.sleep(i * 0.002)
+        return "".join(coalescer.stream(key, lambda: llm.stream_generate("What is the voting age?")))
+
+    with ThreadPoolExecutor(max_workers=subscribers) as pool:
+        answers = list(pool.map(request, range(subscribers)))
+    assert len(generations) == 1, generations
+    assert answers == ["chunk0 chunk1 chunk2 chunk3 chunk4 "] * subscribers
+    assert coalescer.stats() == {"flights": 1, "coalesced": subscribers - 1, "abandoned": 0, "in_flight": 0}
+
+    async def astream_generate(prompt):
+        generations.append(prompt)
+        for i in range(5):
+            await asyncio.sleep(0.02)
+            yield f"chunk{i} "
+
+    async def arequest(acoalescer, i):
+        await asyncio.sleep(i * 0.002)
+        return "".join([e async for e in acoalescer.stream(key, lambda: astream_generate("What is the voting age?"))])
+
+    async def arun():
+        acoalescer = AsyncRequestCoalescer()
+        answers = await asyncio.gather(*(arequest(acoalescer, i) for i in range(subscribers)))
+        return acoalescer, answers
+
+    generations.clear()
+    acoalescer, answers = asyncio.run(arun())
+    assert len(generations) == 1, generations
+    assert answers == ["chunk0 chunk1 chunk2 chunk3 chunk4 "] * subscribers
+    assert acoalescer.stats()["coalesced"] == subscribers - 1
+    print("Request coalescing test passed: one upstream generation per concurrent burst.")
+
+
+if __name__ == "__main__":
+    test()
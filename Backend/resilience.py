@@ -0,0 +1,626 @@
+"""Deadlines, retries, hedging, model fallback and circuit breaking for Gemini calls.
+
+``CallPolicy.call`` runs one upstream call under a per-attempt deadline and retries
+transient failures (timeouts, connection errors, HTTP 408/429/5xx) with jittered
+exponential backoff. With ``hedge=True``, a second identical request starts once the
+first has taken longer than the recent p95 latency, and whichever answers first wins.
+``CallPolicy.stream`` bounds the wait for the first chunk and between chunks. When
+the primary model hasn't produced its first chunk within the first-token budget, it
+also starts the fallback model's stream and commits to whichever speaks first. Every
+model has a circuit breaker: after ``CIRCUIT_FAILURES`` consecutive transient
+failures it rejects calls for ``CIRCUIT_RESET_SECONDS``, then lets one trial through.
+429s are retried but don't count towards it: a rate-limited model is up.
+Outcomes are counted in ``rag_upstream_calls_total``.
+"""
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, TypeVar
+
+from metrics import upstream_calls
+
+T = TypeVar("T")
+
+DEFAULT_DEADLINE_SECONDS = 60.0
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 8.0
+DEFAULT_FIRST_TOKEN_BUDGET_SECONDS = 15.0
+DEFAULT_STREAM_IDLE_SECONDS = 60.0
+DEFAULT_FALLBACK_MODEL = "gemini-2.5-flash"
+DEFAULT_CIRCUIT_FAILURES = 5
+DEFAULT_CIRCUIT_RESET_SECONDS = 30.0
+# Until enough calls have been timed, hedge after this long.
+DEFAULT_HEDGE_DELAY_SECONDS = 2.0
+MIN_HEDGE_DELAY_SECONDS = 0.25
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+_END = object()
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_transient(error: BaseException) -> bool:
+    """Worth retrying: timeouts, dropped connections and 408/429/5xx responses."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import httpx
+
+        if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+            return True
+    except ImportError:
+        pass
+    # google.genai.errors.APIError carries the HTTP status as ``code``.
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return status in TRANSIENT_STATUS
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return (getattr(error, "code", None) or getattr(error, "status_code", None)) == 429
+
+
+def backoff_seconds(attempt: int, base: float = DEFAULT_BACKOFF_SECONDS) -> float:
+    """Full jitter: uniform in [0, base * 2**attempt], capped."""
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_CIRCUIT_FAILURES,
+                 reset_seconds: float = DEFAULT_CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Closed: always. Open or half-open: one trial call per ``reset_seconds``."""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self.state = CIRCUIT_HALF_OPEN
+            self._opened_at = time.monotonic()
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != CIRCUIT_OPEN:
+                    upstream_calls.inc(model=self.name, outcome="circuit_opened")
+                    logging.warning("Circuit for %s opened after %d failures", self.name, self.failures)
+                self.state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Recent call latencies; ``p95()`` is the hedging delay."""
+
+    def __init__(self, samples: int = LATENCY_SAMPLES):
+        self._samples: Deque[float] = deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> float:
+        with self._lock:
+            if len(self._samples) < MIN_LATENCY_SAMPLES:
+                return DEFAULT_HEDGE_DELAY_SECONDS
+            ordered = sorted(self._samples)
+        return max(MIN_HEDGE_DELAY_SECONDS, ordered[int(0.95 * (len(ordered) - 1))])
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(model: str) -> CircuitBreaker:
+    """One breaker per model, shared by every wrapper that calls it."""
+    with _breakers_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(
+                model,
+                failure_threshold=int(os.getenv("CIRCUIT_FAILURES", DEFAULT_CIRCUIT_FAILURES)),
+                reset_seconds=float(os.getenv("CIRCUIT_RESET_SECONDS", DEFAULT_CIRCUIT_RESET_SECONDS)),
+            )
+        return _breakers[model]
+
+
+def circuit_states() -> Dict[str, str]:
+    with _breakers_lock:
+        return {model: breaker.state for model, breaker in _breakers.items()}
+
+
+def _submit(fn: Callable[[], T]) -> Future:
+    """Run ``fn`` on its own daemon thread, so a stalled call can be abandoned at its deadline.
+
+    A bounded pool would make streams wait for each other's slots. The context is
+    copied so spans inside the call still land in the request's trace.
+    """
+    future: Future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="upstream", daemon=True).start()
+    return future
+
+
+class CallPolicy:
+    def __init__(self, model: str, deadline: float = DEFAULT_DEADLINE_SECONDS, retries: int = DEFAULT_RETRIES,
+                 hedge: bool = False, first_token_budget: float = DEFAULT_FIRST_TOKEN_BUDGET_SECONDS,
+                 stream_idle: float = DEFAULT_STREAM_IDLE_SECONDS, breaker: CircuitBreaker | None = None):
+        self.model = model
+        self.deadline = deadline
+        self.retries = retries
+        self.hedge = hedge
+        self.first_token_budget = first_token_budget
+        self.stream_idle = stream_idle
+        self.breaker = breaker or breaker_for(model)
+        self.latency = LatencyTracker()
+
+    def _count(self, outcome: str) -> None:
+        upstream_calls.inc(model=self.model, outcome=outcome)
+
+    def _admit(self) -> None:
+        if not self.breaker.allow():
+            self._count("circuit_open")
+            raise CircuitOpenError(f"Circuit for {self.model} is open")
+
+    def _failed(self, error: BaseException, attempt: int) -> bool:
+        """Record a failed attempt; True if it should be retried."""
+        transient = is_transient(error)
+        if transient and not is_rate_limited(error):
+            self.breaker.record_failure()
+        if not transient or attempt >= self.retries:
+            self._count("timeout" if isinstance(error, TimeoutError) else "error")
+            return False
+        self._count("retry")
+        return True
+
+    def _succeeded(self, started: float) -> None:
+        self.breaker.record_success()
+        self.latency.record(time.monotonic() - started)
+        self._count("ok")
+
+    def _final_attempt(self, error: BaseException, attempt: int, retry_deadline: bool) -> int:
+        return self.retries if isinstance(error, DeadlineExceeded) and not retry_deadline else attempt
+
+    def call(self, fn: Callable[[], T], retry_deadline: bool = True) -> T:
+        """``fn()`` with retries; ``retry_deadline=False`` gives up on the first timed-out attempt."""
+        for attempt in range(self.retries + 1):
+            self._admit()
+            started = time.monotonic()
+            try:
+                result = self._attempt(fn, started)
+            except Exception as e:
+                if not self._failed(e, self._final_attempt(e, attempt, retry_deadline)):
+                    raise
+                time.sleep(backoff_seconds(attempt))
+                continue
+            self._succeeded(started)
+            return result
+        raise AssertionError("unreachable")
+
+    def _attempt(self, fn: Callable[[], T], started: float) -> T:
+        deadline = started + self.deadline
+        primary = _submit(fn)
+        pending = {primary}
+        if self.hedge:
+            done, _ = wait(pending, timeout=min(self.latency.p95(), self.deadline))
+            if not done:
+                self._count("hedged")
+                pending.add(_submit(fn))
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_won")
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded(f"{self.model} did not answer within {self.deadline:g}s")
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], retry_deadline: bool = True) -> T:
+        for attempt in range(self.retries + 1):
+            self._admit()
+            started = time.monotonic()
+            try:
+                result = await self._aattempt(fn, started)
+            except Exception as e:
+                if not self._failed(e, self._final_attempt(e, attempt, retry_deadline)):
+                    raise
+                await asyncio.sleep(backoff_seconds(attempt))
+                continue
+            self._succeeded(started)
+            return result
+        raise AssertionError("unreachable")
+
+    async def _aattempt(self, fn: Callable[[], Awaitable[T]], started: float) -> T:
+        deadline = started + self.deadline
+        primary = asyncio.ensure_future(fn())
+        pending = {primary}
+        try:
+            if self.hedge:
+                done, _ = await asyncio.wait(pending, timeout=min(self.latency.p95(), self.deadline))
+                if not done:
+                    self._count("hedged")
+                    pending.add(asyncio.ensure_future(fn()))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_won")
+                        return task.result()
+                    error = task.exception()
+            if error is not None and not pending:
+                raise error
+            raise DeadlineExceeded(f"{self.model} did not answer within {self.deadline:g}s")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stream(self, open_stream: Callable[[], Iterator[str]], fallback: "CallPolicy | None" = None,
+               open_fallback: Callable[[], Iterator[str]] | None = None) -> Iterator[str]:
+        """Chunks of ``open_stream()``, or of ``open_fallback()`` if the primary is too slow to start."""
+        chunks: "queue.Queue[tuple]" = queue.Queue()
+        stops: Dict[str, threading.Event] = {}
+        policies = {"primary": self, "fallback": fallback}
+        openers = {"primary": open_stream, "fallback": open_fallback}
+        started: Dict[str, float] = {}
+
+        def start(source: str) -> None:
+            stops[source] = threading.Event()
+            started[source] = time.monotonic()
+            _submit(lambda: _read(source, openers[source], chunks, stops[source]))
+
+        def start_fallback() -> bool:
+            if fallback is None or "fallback" in stops or not fallback.breaker.allow():
+                return False
+            self._count("fallback")
+            start("fallback")
+            return True
+
+        try:
+            if self.breaker.allow():
+                start("primary")
+            elif not start_fallback():
+                self._admit()
+            attempts = 0
+            committed = None
+            first_deadline = time.monotonic() + (self.first_token_budget if fallback is not None else self.stream_idle)
+            while committed is None:
+                try:
+                    source, chunk, error = chunks.get(timeout=max(0.0, first_deadline - time.monotonic()))
+                except queue.Empty:
+                    if start_fallback():
+                        first_deadline = time.monotonic() + fallback.stream_idle
+                        continue
+                    self.breaker.record_failure()
+                    self._count("timeout")
+                    raise DeadlineExceeded(f"{self.model} sent nothing within its first-token budget")
+                policy = policies[source]
+                if error is None:
+                    committed = source
+                    for other, stop in stops.items():
+                        if other != source:
+                            stop.set()
+                    break
+                del stops[source]
+                retry = policy._failed(error, attempts)
+                if retry and source == "primary" and not stops:
+                    attempts += 1
+                    time.sleep(backoff_seconds(attempts - 1))
+                    start("primary")
+                elif source == "primary" and is_transient(error) and start_fallback():
+                    first_deadline = time.monotonic() + fallback.stream_idle
+                elif not stops:
+                    raise error
+
+            policy = policies[committed]
+            while chunk is not _END:
+                yield chunk
+                while True:
+                    try:
+                        source, chunk, error = chunks.get(timeout=policy.stream_idle)
+                    except queue.Empty:
+                        policy.breaker.record_failure()
+                        policy._count("timeout")
+                        raise DeadlineExceeded(f"{policy.model} stalled for {policy.stream_idle:g}s mid-answer")
+                    if source == committed:
+                        break
+                if error is not None:
+                    policy._failed(error, policy.retries)
+                    raise error
+            policy._succeeded(started[committed])
+        finally:
+            for stop in stops.values():
+                stop.set()
+
+    async def astream(self, open_stream: Callable[[], AsyncIterator[str]], fallback: "CallPolicy | None" = None,
+                      open_fallback: Callable[[], AsyncIterator[str]] | None = None) -> AsyncIterator[str]:
+        """``stream`` for async iterators; the losing stream's task is cancelled."""
+        chunks: "asyncio.Queue[tuple]" = asyncio.Queue()
+        tasks: Dict[str, asyncio.Task] = {}
+        policies = {"primary": self, "fallback": fallback}
+        openers = {"primary": open_stream, "fallback": open_fallback}
+        started: Dict[str, float] = {}
+
+        def start(source: str) -> None:
+            started[source] = time.monotonic()
+            tasks[source] = asyncio.create_task(_aread(source, openers[source], chunks))
+
+        def start_fallback() -> bool:
+            if fallback is None or "fallback" in tasks or not fallback.breaker.allow():
+                return False
+            self._count("fallback")
+            start("fallback")
+            return True
+
+        try:
+            if self.breaker.allow():
+                start("primary")
+            elif not start_fallback():
+                self._admit()
+            attempts = 0
+            committed = None
+            first_deadline = time.monotonic() + (self.first_token_budget if fallback is not None else self.stream_idle)
+            while committed is None:
+                try:
+                    source, chunk, error = await asyncio.wait_for(chunks.get(),
+                                                                  max(0.0, first_deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    if start_fallback():
+                        first_deadline = time.monotonic() + fallback.stream_idle
+                        continue
+                    self.breaker.record_failure()
+                    self._count("timeout")
+                    raise DeadlineExceeded(f"{self.model} sent nothing within its first-token budget")
+                policy = policies[source]
+                if error is None:
+                    committed = source
+                    for other, task in tasks.items():
+                        if other != source:
+                            task.cancel()
+                    break
+                del tasks[source]
+                retry = policy._failed(error, attempts)
+                if retry and source == "primary" and not tasks:
+                    attempts += 1
+                    await asyncio.sleep(backoff_seconds(attempts - 1))
+                    start("primary")
+                elif source == "primary" and is_transient(error) and start_fallback():
+                    first_deadline = time.monotonic() + fallback.stream_idle
+                elif not tasks:
+                    raise error
+
+            policy = policies[committed]
+            while chunk is not _END:
+                yield chunk
+                while True:
+                    try:
+                        source, chunk, error = await asyncio.wait_for(chunks.get(), policy.stream_idle)
+                    except asyncio.TimeoutError:
+                        policy.breaker.record_failure()
+                        policy._count("timeout")
+                        raise DeadlineExceeded(f"{policy.model} stalled for {policy.stream_idle:g}s mid-answer")
+                    if source == committed:
+                        break
+                if error is not None:
+                    policy._failed(error, policy.retries)
+                    raise error
+            policy._succeeded(started[committed])
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+
+def _read(source: str, open_stream: Callable[[], Iterator[str]], chunks: queue.Queue, stop: threading.Event) -> None:
+    stream = None
+    try:
+        stream = open_stream()
+        for chunk in stream:
+            if stop.is_set():
+                return
+            chunks.put((source, chunk, None))
+        chunks.put((source, _END, None))
+    except Exception as e:
+        chunks.put((source, None, e))
+    finally:
+        if stream is not None and hasattr(stream, "close"):
+            stream.close()
+
+
+async def _aread(source: str, open_stream: Callable[[], AsyncIterator[str]], chunks: asyncio.Queue) -> None:
+    stream = open_stream()
+    try:
+        async for chunk in stream:
+            chunks.put_nowait((source, chunk, None))
+        chunks.put_nowait((source, _END, None))
+    except Exception as e:
+        chunks.put_nowait((source, None, e))
+    finally:
+        # Closing the generator closes the upstream HTTP stream, also when the reader is cancelled.
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+
+
+def policy_from_env(model: str, hedge: bool = False, deadline: float | None = None, retries: int | None = None,
+                    circuit_breaker: bool = True) -> CallPolicy:
+    """``retries`` overrides ``LLM_RETRIES``; without ``circuit_breaker`` the policy never rejects a call."""
+    return CallPolicy(
+        model,
+        deadline=deadline or float(os.getenv("LLM_DEADLINE_SECONDS", DEFAULT_DEADLINE_SECONDS)),
+        retries=int(os.getenv("LLM_RETRIES", DEFAULT_RETRIES)) if retries is None else retries,
+        hedge=hedge,
+        first_token_budget=float(os.getenv("LLM_FIRST_TOKEN_BUDGET_SECONDS", DEFAULT_FIRST_TOKEN_BUDGET_SECONDS)),
+        stream_idle=float(os.getenv("LLM_STREAM_IDLE_SECONDS", DEFAULT_STREAM_IDLE_SECONDS)),
+        breaker=None if circuit_breaker else CircuitBreaker(model, failure_threshold=math.inf),
+    )
+
+
+def fallback_model_from_env(model: str) -> str | None:
+    """The faster model to fall back to from ``model``; None when it is the same model or ``FALLBACK_MODEL=off``."""
+    fallback = os.getenv("FALLBACK_MODEL", DEFAULT_FALLBACK_MODEL)
+    if fallback.lower() in ("off", "0", "false", "") or fallback == model:
+        return None
+    return fallback
+
+
+def test():
+    class Unavailable(Exception):
+        code = 503
+
+    calls: List[str] = []
+
+    def flaky():
+        calls.append("flaky")
+        if len(calls) < 3:
+            raise Unavailable("503 UNAVAILABLE")
+        return "ok"
+
+    policy = CallPolicy("test-retry", deadline=1.0, retries=2, breaker=CircuitBreaker("test-retry"))
+    assert policy.call(flaky) == "ok" and len(calls) == 3
+
+    # A slow first request is hedged after the p95 delay and the hedge answers first.
+    hedged = CallPolicy("test-hedge", deadline=2.0, retries=0, hedge=True, breaker=CircuitBreaker("test-hedge"))
+    for _ in range(MIN_LATENCY_SAMPLES):
+        hedged.latency.record(0.01)
+    delays = iter([1.5, 0.01])
+
+    def slow_then_fast():
+        time.sleep(next(delays))
+        return "answer"
+
+    started = time.monotonic()
+    assert hedged.call(slow_then_fast) == "answer" and time.monotonic() - started < 0.6
+
+    stalled = CallPolicy("test-deadline", deadline=0.1, retries=2, breaker=CircuitBreaker("test-deadline"))
+    started = time.monotonic()
+    try:
+        stalled.call(lambda: time.sleep(1), retry_deadline=False)
+        raise AssertionError("expected DeadlineExceeded")
+    except DeadlineExceeded:
+        assert time.monotonic() - started < 0.2  # not retried
+
+    breaker = CircuitBreaker("test-circuit", failure_threshold=2, reset_seconds=0.2)
+    failing = CallPolicy("test-circuit", deadline=1.0, retries=1, breaker=breaker)
+
+    def down():
+        raise Unavailable("503")
+
+    for _ in range(2):
+        try:
+            failing.call(down)
+        except (Unavailable, CircuitOpenError):
+            pass
+    assert breaker.state == CIRCUIT_OPEN
+    try:
+        failing.call(lambda: "never called")
+        raise AssertionError("expected CircuitOpenError")
+    except CircuitOpenError:
+        pass
+    time.sleep(0.25)
+    assert failing.call(lambda: "recovered") == "recovered" and breaker.state == CIRCUIT_CLOSED
+
+    class RateLimited(Exception):
+        code = 429
+
+    def throttled():
+        raise RateLimited("429 RESOURCE_EXHAUSTED")
+
+    for _ in range(3):
+        try:
+            failing.call(throttled)
+        except RateLimited:
+            pass
+    assert breaker.state == CIRCUIT_CLOSED and breaker.failures == 0
+
+    def slow_stream():
+        time.sleep(1)
+        yield "slow"
+
+    def fast_stream():
+        yield from ["fast ", "answer"]
+
+    primary = CallPolicy("test-primary", first_token_budget=0.1, stream_idle=1.0,
+                         breaker=CircuitBreaker("test-primary"))
+    fallback = CallPolicy("test-fallback", stream_idle=1.0, breaker=CircuitBreaker("test-fallback"))
+    assert "".join(primary.stream(slow_stream, fallback, fast_stream)) == "fast answer"
+    assert "".join(primary.stream(fast_stream, fallback, slow_stream)) == "fast answer"
+
+    async def aslow():
+        await asyncio.sleep(1)
+        yield "slow"
+
+    async def afast():
+        for chunk in ["fast ", "answer"]:
+            yield chunk
+
+    async def arun():
+        answer = "".join([c async for c in primary.astream(aslow, fallback, afast)])
+        attempts = iter([Unavailable("503"), None])
+
+        async def aflaky():
+            error = next(attempts)
+            if error:
+                raise error
+            return "ok"
+
+        return answer, await policy.acall(aflaky)
+
+    assert asyncio.run(arun()) == ("fast answer", "ok")
+    print("Resilience test passed: retries, hedging, deadlines, circuit breaker and stream fallback.")
+
+
+if __name__ == "__main__":
+    test()
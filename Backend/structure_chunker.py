@@ -0,0 +1,295 @@
+"""Split converted legal Markdown into provision-sized chunks instead of fixed page windows.
+
+A new unit starts at every Markdown heading and every provision marker ("Section 11",
+"Article 17", "दफा ११", "17. Right to freedom:"). Units below ``min_tokens`` (a bare
+heading, a one-line section) are merged into the following one; units above
+``max_tokens`` are split at paragraph, table-row or line boundaries, repeating the table
+header and the provision title in every part. Each chunk records its page range, heading
+path and provision, and keeps the page markers it spans, renumbered document-wide.
+"""
+import re
+from typing import Any, Dict, List, Tuple
+
+from ingest_scheduler import CHARS_PER_TOKEN, estimate_tokens
+
+DEFAULT_MAX_TOKENS = 800
+DEFAULT_MIN_TOKENS = 200
+
+PAGE_MARKER_REGEX = re.compile(r"<\!-----\s*PAGE\s+\d+\s*------->", re.IGNORECASE)
+# pdf_to_markdown_agent converts each page window separately, so every window starts with its own front-matter.
+FRONT_MATTER_REGEX = re.compile(r"^---[ \t]*\n(?:[A-Za-z_][\w \t]*:.*\n)+---[ \t]*$\n?", re.MULTILINE)
+HEADING_REGEX = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+PROVISION_REGEX = re.compile(
+    r"^(?:section|sec\.|article|art\.|rule|schedule|दफा|धारा|नियम|अनुसूची)\s*[-–]?\s*[0-9०-९]+[a-z]?\b",
+    re.IGNORECASE,
+)
+# "17. Right to freedom:" / "३. नागरिकताको प्राप्ति:" — numbered provision titles ending in a colon.
+NUMBERED_PROVISION_REGEX = re.compile(r"^[0-9०-९]+[a-z]?\s*[.)।]\s+[^:ः]{1,100}[:ः]")
+# A sentence ends before a capital, an opening quote or bracket, or Devanagari ("Rs. 500" is not an end).
+SENTENCE_END_REGEX = re.compile(r"(?<=[.!?।])\s+(?=[A-Z\"“(ऀ-ॿ])")
+
+
+def page_marker(page: int) -> str:
+    return f"<!----- PAGE {page} ------->"
+
+
+def _provision_title(line: str) -> str | None:
+    stripped = re.sub(r"[*_]+", "", line.strip().lstrip("#")).strip()
+    match = PROVISION_REGEX.match(stripped) or NUMBERED_PROVISION_REGEX.match(stripped)
+    if match is None:
+        return None
+    title = re.split(r"[:ः]", stripped, maxsplit=1)[0].strip()
+    return title if len(title) <= 120 else match.group(0).rstrip(" :ः")
+
+
+def _tokens(lines: List[Tuple[int, str]]) -> int:
+    return estimate_tokens("\n".join(line for _, line in lines))
+
+
+def parse_units(text: str) -> List[Dict[str, Any]]:
+    """Heading/provision-delimited units; ``lines`` holds ``(page, line)`` pairs."""
+    text = FRONT_MATTER_REGEX.sub("", text)
+    units: List[Dict[str, Any]] = []
+    headings: List[Tuple[int, str]] = []
+    pending_markers: List[Tuple[int, str]] = []
+    page = 1
+    current = None
+
+    def start_unit(provision: str | None) -> Dict[str, Any]:
+        unit = {"lines": [], "heading": " > ".join(h for _, h in headings) or None, "provision": provision,
+                "level": None}
+        units.append(unit)
+        return unit
+
+    for line in text.splitlines():
+        if PAGE_MARKER_REGEX.fullmatch(line.strip()):
+            # Markers are numbered per converted window; count them to get document pages.
+            page = page + 1 if current is not None or pending_markers else page
+            pending_markers.append((page, page_marker(page)))
+            continue
+        if current is None and not line.strip():
+            continue
+
+        heading = HEADING_REGEX.match(line)
+        provision = _provision_title(line)
+        level = len(heading.group(1)) if heading else None
+        if heading and not provision:
+            headings = [h for h in headings if h[0] < level] + [(level, re.sub(r"[*_]+", "", heading.group(2)))]
+        if heading or provision or current is None:
+            current = start_unit(provision)
+            current["level"] = level
+        # Markers seen between two units belong to the one that follows them.
+        current["lines"].extend(pending_markers)
+        pending_markers = []
+        current["lines"].append((page, line))
+
+    if current is not None:
+        current["lines"].extend(pending_markers)
+    for unit in units:
+        while unit["lines"] and not unit["lines"][-1][1].strip():
+            unit["lines"].pop()
+    return [u for u in units if u["lines"]]
+
+
+def _blocks(lines: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+    """Paragraphs and whole tables, separated by blank lines."""
+    blocks: List[List[Tuple[int, str]]] = []
+    current: List[Tuple[int, str]] = []
+    for page, line in lines:
+        is_table = line.lstrip().startswith("|")
+        in_table = bool(current) and current[-1][1].lstrip().startswith("|")
+        if not line.strip() or (current and is_table != in_table and not PAGE_MARKER_REGEX.fullmatch(line.strip())):
+            if current:
+                blocks.append(current)
+            current = [] if not line.strip() else [(page, line)]
+            continue
+        current.append((page, line))
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def _split_line(line: str, max_tokens: int) -> List[str]:
+    """Sentences of an over-budget line, hard-cut if a single sentence is still too long."""
+    pieces = []
+    for sentence in SENTENCE_END_REGEX.split(line):
+        while estimate_tokens(sentence) > max_tokens:
+            cut = max_tokens * CHARS_PER_TOKEN
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:]
+        pieces.append(sentence)
+    return pieces
+
+
+def _split_block(block: List[Tuple[int, str]], max_tokens: int,
+                 first_tokens: int | None = None) -> List[List[Tuple[int, str]]]:
+    """Cut an over-budget paragraph or table at line boundaries, repeating a table's header rows.
+
+    The first part is limited to ``first_tokens`` so it can fill up the chunk already in progress;
+    it is empty if not even one line fits there.
+    """
+    rows = [item for item in block if not PAGE_MARKER_REGEX.fullmatch(item[1].strip())]
+    is_table = bool(rows) and rows[0][1].lstrip().startswith("|")
+    header = rows[:2] if is_table and len(rows) > 2 and set(rows[1][1].strip()) <= set("|-: ") else []
+    body = [(row, page, piece) for row, (page, line) in enumerate(block) if (page, line) not in header
+            for piece in _split_line(line, max_tokens - _tokens(header))]
+
+    parts, current = [], []
+    budget = max_tokens if first_tokens is None else first_tokens
+    for row, page, piece in body:
+        if _tokens(header + _join_pieces(current + [(row, page, piece)])) > budget and (current or budget < max_tokens):
+            parts.append(header + _join_pieces(current) if current else [])
+            current, budget = [], max_tokens
+        current.append((row, page, piece))
+    if current:
+        parts.append(header + _join_pieces(current))
+    return parts
+
+
+def _join_pieces(pieces: List[Tuple[int, int, str]]) -> List[Tuple[int, str]]:
+    """Glue sentences cut from the same source line back into one line."""
+    lines: List[Tuple[int, str]] = []
+    previous_row = None
+    for row, page, piece in pieces:
+        if row == previous_row:
+            lines[-1] = (lines[-1][0], f"{lines[-1][1]} {piece}")
+        else:
+            lines.append((page, piece))
+        previous_row = row
+    return lines
+
+
+def _render(lines: List[Tuple[int, str]]) -> str:
+    text = "\n".join(line for _, line in lines).strip()
+    return text if PAGE_MARKER_REGEX.match(text) else f"{page_marker(lines[0][0])}\n{text}"
+
+
+def _chunk(lines: List[Tuple[int, str]], unit: Dict[str, Any], provisions: List[str]) -> Dict[str, Any]:
+    pages = [page for page, _ in lines]
+    text = _render(lines)
+    return {
+        "text": text,
+        "page_start": min(pages),
+        "page_end": max(pages),
+        "heading": unit["heading"],
+        "provision": "; ".join(provisions) or None,
+        "tokens": estimate_tokens(text),
+    }
+
+
+def _split_unit(unit: Dict[str, Any], max_tokens: int) -> List[List[Tuple[int, str]]]:
+    title = next((line.strip() for _, line in unit["lines"]
+                  if line.strip() and not PAGE_MARKER_REGEX.fullmatch(line.strip())), None)
+    # Later parts repeat the provision title so they are still findable on their own.
+    continued = f"{title} (continued)" if title else None
+    budget = max_tokens - (estimate_tokens(continued) + 1 if continued else 0)
+    parts: List[List[Tuple[int, str]]] = []
+    current: List[Tuple[int, str]] = []
+    for block in _blocks(unit["lines"]):
+        if _tokens(block) > budget:
+            room = max_tokens - _tokens(current) - 1 if current else None
+            pieces = _split_block(block, budget, room)
+        else:
+            pieces = [block]
+        for piece in pieces:
+            if not piece:  # nothing of the block fitted next to what is already in the chunk
+                parts.append(current)
+                current = [(block[0][0], continued), (block[0][0], "")] if continued else []
+                continue
+            if current and _tokens(current + piece) > max_tokens:
+                parts.append(current)
+                current = [(piece[0][0], continued), (piece[0][0], "")] if continued else []
+            current.extend(piece + [(piece[-1][0], "")])
+    if current:
+        parts.append(current)
+    return parts
+
+
+def chunk_markdown(text: str, max_tokens: int = DEFAULT_MAX_TOKENS,
+                   min_tokens: int = DEFAULT_MIN_TOKENS) -> List[Dict[str, Any]]:
+    """Provision-level chunks of converted Markdown with page range, heading and provision metadata."""
+    chunks: List[Dict[str, Any]] = []
+    buffer: List[Tuple[int, str]] = []
+    buffer_unit: Dict[str, Any] | None = None
+    provisions: List[str] = []
+
+    def flush() -> None:
+        nonlocal buffer, buffer_unit, provisions
+        if buffer:
+            chunks.append(_chunk(buffer, buffer_unit, provisions))
+        buffer, buffer_unit, provisions = [], None, []
+
+    for unit in parse_units(text):
+        tokens = _tokens(unit["lines"])
+        if tokens > max_tokens:
+            flush()
+            for part in _split_unit(unit, max_tokens):
+                chunks.append(_chunk(part, unit, [unit["provision"]] if unit["provision"] else []))
+            continue
+        # Short units are merged forward, but never across a new part or chapter.
+        new_part = unit["level"] is not None and unit["level"] <= 2 and provisions
+        if buffer and (new_part or _tokens(buffer) >= min_tokens or _tokens(buffer) + tokens > max_tokens):
+            flush()
+        if buffer_unit is None or buffer_unit["provision"] is None:
+            # A chunk is labelled by its first provision, not by the headings that introduce it.
+            buffer_unit = unit
+        if buffer:
+            buffer.append((unit["lines"][0][0], ""))
+        buffer.extend(unit["lines"])
+        if unit["provision"]:
+            provisions.append(unit["provision"])
+    flush()
+    return chunks
+
+
+def chunk_metadata(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Vector-store metadata for a chunk; Pinecone rejects null values, so those are left out."""
+    return {key: chunk[key] for key in ("page_start", "page_end", "heading", "provision") if chunk[key] is not None}
+
+
+def test():
+    window = """---
+title: Sample Act
+page_count: 3
+---
+<!----- PAGE 1 ------->
+# Sample Act, 2080
+
+## Chapter 1: Preliminary
+
+1. Short title and commencement: This Act may be called the Sample Act, 2080.
+
+2. Definitions: In this Act, "tax" means value added tax.
+<!----- PAGE 2 ------->
+### Section 3 Rate of tax
+The rate of tax shall be thirteen percent.
+
+| Item | Rate |
+|------|------|
+""" + "\n".join(f"| item {i} | {i}% |" for i in range(60)) + """
+
+Explanation: """ + " ".join(f"Clause {i} applies to goods of class {i}." for i in range(120)) + """
+<!----- PAGE 3 ------->
+दफा ४ कर छुट: तोकिएका वस्तुमा कर लाग्ने छैन।
+"""
+    # A second converted window restarts its page numbers and repeats the front-matter.
+    text = window + "\n\n" + window.replace("Sample Act", "Second Act")
+    chunks = chunk_markdown(text, max_tokens=200, min_tokens=40)
+
+    assert not any("page_count:" in c["text"] for c in chunks)
+    assert chunks[0]["page_start"] == 1 and chunks[-1]["page_end"] == 6
+    assert chunks[0]["text"].startswith(page_marker(1)) and "# Sample Act, 2080" in chunks[0]["text"]
+    assert chunks[0]["provision"] == "1. Short title and commencement; 2. Definitions"
+    assert chunks[0]["heading"] == "Sample Act, 2080 > Chapter 1: Preliminary"
+    rate = [c for c in chunks if c["provision"] == "Section 3 Rate of tax"]
+    tables = [c for c in rate if "| item " in c["text"]]
+    assert len(tables) > 1 and all("| Item | Rate |" in c["text"] for c in tables)
+    assert "Clause 119 applies" in rate[-1]["text"] and rate[-1]["text"].count("(continued)") == 1
+    assert all(c["tokens"] <= 200 + 20 for c in chunks)
+    assert any(c["provision"] == "दफा ४ कर छुट" and c["page_start"] == 6 for c in chunks)
+    assert page_marker(5) in "".join(c["text"] for c in chunks)
+    print("chunk_markdown provision/table/page test passed.")
+
+
+if __name__ == "__main__":
+    test()
@@ -1,18 +1,53 @@
 import os
+import sys
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import List, Optional, Dict, Any
 
 import numpy as np
 from dotenv import load_dotenv
-from pinecone import Pinecone
+import clients
+from local_vector_index import LocalVectorIndex
+from metrics import span
+
+DEFAULT_BACKEND = "pinecone"  # or "local" for the memory-mapped NumPy index on disk
+DEFAULT_LOCAL_INDEX_DIR = "./vector_index"
+DEFAULT_LOCAL_INDEX_TYPE = "flat"  # or "ivf" for approximate search on large corpora
+DEFAULT_LOCAL_INDEX_NPROBE = 8
+DEFAULT_LOCAL_INDEX_QUANTIZATION = "none"  # or "int8" / "float16" to scan a compact copy and re-score exactly
+
 
 class VectorStoreWrapper:
-    def __init__(self, index_name: str = "legaladviser", api_key: str | None = None):
-        self.pc = Pinecone(api_key=api_key or os.getenv("PINECONE_API_KEY"))
-        index_names =  [i.get("name") for i in self.pc.list_indexes().indexes]
-        if index_name not in index_names:
-            raise f"Cannot find pinecone index {index_name}"
-        self.index = self.pc.Index(index_name)
+    def __init__(self, index_name: str = "legaladviser", api_key: str | None = None, backend: str | None = None):
+        self.backend = backend or os.getenv("VECTOR_STORE_BACKEND", DEFAULT_BACKEND)
+        if self.backend == "local":
+            nlist = os.getenv("LOCAL_INDEX_NLIST")
+            self._local_index = LocalVectorIndex(
+                Path(os.getenv("LOCAL_INDEX_DIR", DEFAULT_LOCAL_INDEX_DIR)) / index_name,
+                index_type=os.getenv("LOCAL_INDEX_TYPE", DEFAULT_LOCAL_INDEX_TYPE),
+                nprobe=int(os.getenv("LOCAL_INDEX_NPROBE", DEFAULT_LOCAL_INDEX_NPROBE)),
+                nlist=int(nlist) if nlist else None,
+                quantization=os.getenv("LOCAL_INDEX_QUANTIZATION", DEFAULT_LOCAL_INDEX_QUANTIZATION),
+            )
+            return
+        if self.backend != "pinecone":
+            raise ValueError(f"Unknown vector store backend {self.backend}")
+
+        # The Pinecone index is looked up on first use rather than before the server can start.
+        self.index_name = index_name
+        self.api_key = api_key
+
+    @property
+    def index(self):
+        if self.backend == "local":
+            return self._local_index
+        return clients.pinecone_index(self.index_name, self.api_key)
+
+    def warm_up(self) -> None:
+        """Resolve the index and open a pooled connection to it."""
+        if self.backend == "pinecone":
+            self.index.describe_index_stats()
 
     def upsert(
             self,
@@ -30,23 +65,56 @@ class VectorStoreWrapper:
             for id_, vector, meta in zip(ids, embeddings, metadatas)
         ]
 
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
-            self.index.upsert(vectors=batch)
+        # The local index rewrites its files on every upsert, so send it everything at once.
+        batch_size = len(vectors) if self.backend == "local" else 100
+        with span("vector_store.upsert", backend=self.backend):
+            for i in range(0, len(vectors), max(batch_size, 1)):
+                batch = vectors[i:i + batch_size]
+                self.index.upsert(vectors=batch)
 
         return ids
 
     def query(self, vector: list[float] | None = None, id: str | None = None, top_k: int = 5, namespace: str | None = None, filter: dict | None = None, include_metadata: bool = True):
-        return self.index.query(vector=vector, id=id, top_k=top_k, namespace=namespace or "", filter=filter, include_metadata=include_metadata)
+        with span("vector_store.query", backend=self.backend):
+            return self.index.query(vector=vector, id=id, top_k=top_k, namespace=namespace or "", filter=filter, include_metadata=include_metadata)
+
+    def query_many(self, vectors: List[List[float]], top_k: int = 5, namespace: str | None = None,
+                   include_metadata: bool = True, workers: int = 8) -> List[Dict[str, Any]]:
+        """One ``query`` response per vector, in order.
+
+        The local index scores the whole batch in one matrix product; Pinecone has no
+        multi-vector query, so those requests run ``workers`` at a time.
+        """
+        if not vectors:
+            return []
+        with span("vector_store.query_many", backend=self.backend):
+            if self.backend == "local":
+                return self.index.query_many(vectors, top_k=top_k, namespace=namespace or "",
+                                             include_metadata=include_metadata)
+            with ThreadPoolExecutor(max_workers=min(workers, len(vectors))) as pool:
+                return list(pool.map(lambda v: self.index.query(vector=v, top_k=top_k, namespace=namespace or "",
+                                                                include_metadata=include_metadata), vectors))
+
+    def fetch(self, ids: list[str], namespace: str | None = None) -> Dict[str, Dict[str, Any]]:
+        """Metadata of the stored vectors with these ids; unknown ids are left out."""
+        if not ids:
+            return {}
+        with span("vector_store.fetch", backend=self.backend):
+            response = self.index.fetch(ids=ids, namespace=namespace or "")
+        vectors = response["vectors"] if isinstance(response, dict) else response.vectors
+        return {
+            id_: (vector["metadata"] if isinstance(vector, dict) else vector.metadata) or {}
+            for id_, vector in vectors.items()
+        }
 
     def delete(self, ids: list[str] | None = None, namespace: str | None = None, delete_all: bool = False,
                filter: dict | None = None):
-        return self.index.delete(ids=ids, namespace=namespace or "", delete_all=delete_all, filter=filter)
+        with span("vector_store.delete", backend=self.backend):
+            return self.index.delete(ids=ids, namespace=namespace or "", delete_all=delete_all, filter=filter)
 
-def test():
+def test(backend: str | None = None):
     dim = 768
-    wrapper = VectorStoreWrapper()
+    wrapper = VectorStoreWrapper(backend=backend)
     vector = np.random.rand(dim).tolist()
     metadata = {"genre": "demo"}
     vec_id = "test-id"
@@ -66,4 +134,4 @@ def test():
 
 if __name__ == "__main__":
     load_dotenv()
-    test()
+    test(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -259,7 +259,7 @@ export default function Home() {
       const response = await fetch('http://localhost:8000/chat', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ queries: [content], model: selectedModel }),
+        body: JSON.stringify({ queries: [content], conversation_id: conversationId, model: selectedModel }),
         signal: abortControllerRef.current.signal,
       });
 